@@ -7,6 +7,13 @@ export FIO_RW=write
 export FIO_NUM_JOBS=6
 export DATA_PATH=/mnt/centos/fio-data
 export RESULTS_PATH=/cluster/centos/fio-results
+# Address of a barrier coordinator (fio_barrier serve) to start fio on every rank together
+#export FIO_BARRIER=mpi-head:7070
+# Tolerance of an adaptive sweep of node counts and I/O sizes (see fio_schedule)
+#export FIO_ADAPTIVE=0.05
+# End each run once it is stable by this fio criterion, or after FIO_SS_RUNTIME seconds
+#export FIO_STEADYSTATE=iops_slope:0.5%
+#export FIO_SS_RUNTIME=120
 
 export BS_MIN=1024
 export BS_MAX=$((2 * 1024 * 1024))
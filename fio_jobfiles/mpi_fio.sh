@@ -20,4 +20,19 @@ esac
 
 mkdir -p $SCENARIO_DIR $CLIENT_DIR $SCRATCH_DIR
 
-fio global_config.fio --directory=$SCRATCH_DIR --output-format=json+ --blocksize=$BS --output=$CLIENT_DIR/${BS}.json >& fio-$OMPI_COMM_WORLD_SIZE-$OMPI_COMM_WORLD_LOCAL_SIZE-$CLIENT_NAME-$BS.dat
+# With FIO_BARRIER set to the address of a barrier coordinator, start fio on
+# every rank together
+if [ -n "${FIO_BARRIER:-}" ]; then
+    python3 fio_barrier.py wait --address $FIO_BARRIER --group $SCENARIO-$FIO_RW-$OMPI_COMM_WORLD_SIZE \
+        --name $SCENARIO-$FIO_RW-$OMPI_COMM_WORLD_SIZE-$BS --parties $OMPI_COMM_WORLD_SIZE --client $CLIENT_NAME \
+        --timeout ${FIO_BARRIER_TIMEOUT:-3600} || exit 1
+fi
+
+# With FIO_STEADYSTATE set to a criterion such as iops_slope:0.5%, end each
+# run once it is stable, or after FIO_SS_RUNTIME seconds
+SS_ARGS=""
+if [ -n "${FIO_STEADYSTATE:-}" ]; then
+    SS_ARGS="--steadystate=$FIO_STEADYSTATE --steadystate_duration=${FIO_SS_DURATION:-10}s --steadystate_ramp_time=${FIO_SS_RAMP:-5}s --runtime=${FIO_SS_RUNTIME:-120}"
+fi
+
+fio global_config.fio --directory=$SCRATCH_DIR --output-format=json+ --blocksize=$BS --output=$CLIENT_DIR/${BS}.json $SS_ARGS >& fio-$OMPI_COMM_WORLD_SIZE-$OMPI_COMM_WORLD_LOCAL_SIZE-$CLIENT_NAME-$BS.dat
@@ -2,11 +2,28 @@
 
 source mpi_env.sh
 
-for ((n=1; $n <= $NNODES; n=$n+1))
-do
-    for ((i=$BS_MIN; $i <= $BS_MAX; i=$i * 2))
+if [ -n "${FIO_ADAPTIVE:-}" ]; then
+    # Choose each number of nodes and I/O size here, once for every rank,
+    # from the results so far read through the fiotools parse cache (so
+    # fiotools must be installed on this host), skipping those where
+    # throughput has plateaued or throughput and latency scale evenly
+    SCENARIO_DIR=$RESULTS_PATH/$SCENARIO-$FIO_RW
+    while NP=$(fio_schedule clients --input-dir $SCENARIO_DIR --tolerance $FIO_ADAPTIVE \
+                   --values $(seq $NPROCS $NPROCS $(($NNODES * $NPROCS)))) && [ -n "$NP" ]; do
+        n=$(($NP / $NPROCS))
+        while i=$(fio_schedule bs --input-dir $SCENARIO_DIR/$NP-$NPROCS --tolerance $FIO_ADAPTIVE \
+                      --min $BS_MIN --max $BS_MAX) && [ -n "$i" ]; do
+            echo Nodes: $n Procs: $NPROCS Blocksize: $i
+            mpirun -N $NPROCS --np $NP --hostfile ~/mpi_hosts --tag-output mpi_fio.sh $i
+        done
+    done
+else
+    for ((n=1; $n <= $NNODES; n=$n+1))
     do
-	echo Nodes: $n Procs: $NPROCS Blocksize: $i 
-	mpirun -N $NPROCS --np $(($n * $NPROCS)) --hostfile ~/mpi_hosts --tag-output mpi_fio.sh $i
+        for ((i=$BS_MIN; $i <= $BS_MAX; i=$i * 2))
+        do
+	    echo Nodes: $n Procs: $NPROCS Blocksize: $i 
+	    mpirun -N $NPROCS --np $(($n * $NPROCS)) --hostfile ~/mpi_hosts --tag-output mpi_fio.sh $i
+        done
     done
-done
+fi
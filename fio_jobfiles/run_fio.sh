@@ -10,18 +10,42 @@ prepare () {
 }
 
 syncpods () {
-  BS_LOCK=$SCENARIO_DIR/${1}.lock
-  mkdir -p $BS_LOCK
-  while [ $(ls $BS_LOCK | wc -l) -lt $NUM_CLIENTS ]; do
-    touch $BS_LOCK/$CLIENT_NAME
-    sleep 1
-  done
+  # With FIO_BARRIER set to the address of a barrier coordinator (fio_barrier
+  # serve), wait there for every client; otherwise poll a lock directory
+  if [ -n "${FIO_BARRIER:-}" ]; then
+    python3 $FIO_JOBFILES/fio_barrier.py wait --address $FIO_BARRIER --group $SCENARIO_NAME-$NUM_CLIENTS \
+      --name $SCENARIO_NAME-$NUM_CLIENTS-$1 --parties $NUM_CLIENTS --client $CLIENT_NAME \
+      --timeout ${FIO_BARRIER_TIMEOUT:-3600} || exit 1
+  else
+    BS_LOCK=$SCENARIO_DIR/${1}.lock
+    mkdir -p $BS_LOCK
+    while [ $(ls $BS_LOCK | wc -l) -lt $NUM_CLIENTS ]; do
+      touch $BS_LOCK/$CLIENT_NAME
+      sleep 1
+    done
+  fi
   mkdir -p $CLIENT_DIR
 }
 
+nextbs () {
+  # Wait at the barrier after I/O size $1 of an adaptive sweep, printing the
+  # next I/O size, or nothing once the sweep is done.  The coordinator chooses
+  # it once from the results of every client, and hands it to them all.
+  python3 $FIO_JOBFILES/fio_barrier.py wait --address $FIO_BARRIER --group $SCENARIO_NAME-$NUM_CLIENTS \
+    --name $SCENARIO_NAME-$NUM_CLIENTS-$1 --parties $NUM_CLIENTS --client $CLIENT_NAME \
+    --timeout ${FIO_BARRIER_TIMEOUT:-3600} \
+    --schedule bs --input-dir $SCENARIO_NAME/$NUM_CLIENTS --tolerance $FIO_ADAPTIVE
+}
+
 cleanup () {
   sleep 10; rm -rf $SCENARIO_DIR/*.lock
   if [[ "${FIO_RW}" =~ "write" ]]; then rm -rf $SCRATCH_DIR; fi
+  # List the results of this client with their size and mtime, which
+  # fiotools reads instead of looking up each file.  It is touched after the
+  # rename so that it is no older than the directory, or it is ignored.
+  (cd $CLIENT_DIR && find . -maxdepth 1 -type f -name '*.json' -printf '%s\t%T@\t%P\n') > $CLIENT_DIR/.fiotools-manifest.tmp &&
+    mv $CLIENT_DIR/.fiotools-manifest.tmp $CLIENT_DIR/.fiotools-manifest &&
+    touch $CLIENT_DIR/.fiotools-manifest
   chown -R ${RESULT_USER:-1000}:${RESULT_GROUP:-1000} $CLIENT_DIR
 }
 
@@ -30,13 +54,46 @@ export SCRATCH_DIR
 export SCENARIO_DIR=$RESULTS_PATH/$SCENARIO_NAME/$NUM_CLIENTS
 export CLIENT_DIR=$RESULTS_PATH/$SCENARIO_NAME/$NUM_CLIENTS/$CLIENT_NAME
 
-prepare
-syncpods 0
-let BS=256; let LIM=16*1024*1024
-while [ $BS -le $LIM ]; do
+runbs () {
+  BS=$1
   echo $BS
-  fio $FIO_JOBFILES/global_config.fio --directory=$SCRATCH_DIR --output-format=json+ --blocksize=$BS --output=$CLIENT_DIR/${BS}.json
-  syncpods $BS
-  let BS=2*BS
-done
+  # With FIO_LOG_MSEC set, also log bandwidth, IOPS and latency averaged over
+  # that many milliseconds, to ${BS}_<bw|iops|lat|clat|slat>.<job>.log
+  LOG_ARGS=""
+  if [ -n "${FIO_LOG_MSEC:-}" ]; then
+    LOG_ARGS="--write_bw_log=$CLIENT_DIR/${BS} --write_iops_log=$CLIENT_DIR/${BS} --write_lat_log=$CLIENT_DIR/${BS} --log_avg_msec=$FIO_LOG_MSEC"
+  fi
+  # With FIO_STEADYSTATE set to a criterion such as iops_slope:0.5%, end the
+  # run once it is stable, or after FIO_SS_RUNTIME seconds
+  SS_ARGS=""
+  if [ -n "${FIO_STEADYSTATE:-}" ]; then
+    SS_ARGS="--steadystate=$FIO_STEADYSTATE --steadystate_duration=${FIO_SS_DURATION:-10}s --steadystate_ramp_time=${FIO_SS_RAMP:-5}s --runtime=${FIO_SS_RUNTIME:-120}"
+  fi
+  fio $FIO_JOBFILES/global_config.fio --directory=$SCRATCH_DIR --output-format=json+ --blocksize=$BS --output=$CLIENT_DIR/${BS}.json $LOG_ARGS $SS_ARGS
+}
+
+prepare
+if [ -n "${FIO_ADAPTIVE:-}" ]; then
+  # Run the I/O sizes chosen by the barrier coordinator (fio_barrier serve
+  # --results), skipping those where throughput has plateaued or throughput
+  # and latency scale evenly
+  if [ -z "${FIO_BARRIER:-}" ]; then
+    echo "FIO_ADAPTIVE needs FIO_BARRIER, the address of a barrier coordinator serving with --results" >&2
+    exit 1
+  fi
+  BS=$(nextbs 0) || exit 1
+  mkdir -p $CLIENT_DIR
+  while [ -n "$BS" ]; do
+    runbs $BS
+    BS=$(nextbs $BS) || exit 1
+  done
+else
+  syncpods 0
+  let BS=256; let LIM=16*1024*1024
+  while [ $BS -le $LIM ]; do
+    runbs $BS
+    syncpods $BS
+    let BS=2*BS
+  done
+fi
 cleanup
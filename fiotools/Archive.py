@@ -0,0 +1,203 @@
+# Copyright 2021 StackHPC Ltd
+# Compressed and archived fio result files, read in place
+
+import bz2
+import gzip
+import io
+import lzma
+import os
+import tarfile
+import time
+
+####################################################################################################
+# Compressed files.  zstandard is an optional dependency, only needed for .zst files.
+
+COMPRESSED = {
+    '.gz': gzip.open,
+    '.bz2': bz2.open,
+    '.xz': lzma.open,
+}
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz', '.tar.zst', '.tar.zstd')
+
+
+def zstd_reader(path):
+    ''' A binary stream decompressing a .zst file '''
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Reading %s needs the zstandard package (pip install fiotools[zstd])" % path)
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+
+
+def open_binary(path):
+    ''' Open a file for reading, decompressing it according to its suffix '''
+    path = str(path)
+    suffix = os.path.splitext(path)[1]
+    if suffix in COMPRESSED:
+        return COMPRESSED[suffix](path, 'rb')
+    if suffix in ('.zst', '.zstd'):
+        return zstd_reader(path)
+    return open(path, 'rb')
+
+
+def open_text(path):
+    ''' Open a possibly compressed file for reading as text '''
+    return io.TextIOWrapper(open_binary(path), encoding='utf-8')
+
+####################################################################################################
+# Tar archives.  A member of an archive is named by a path continuing from the
+# archive path, as if the archive were a directory: results.tar.gz/run/4096.json
+
+def is_archive(path):
+    return str(path).endswith(TAR_SUFFIXES) and os.path.isfile(str(path))
+
+
+def split_archive_path(path):
+    ''' Split a path into the archive it lies in and the member path within
+        it, or return (None, path) for a path outside any archive '''
+    path = os.path.normpath(str(path))
+    if not any(P.endswith(TAR_SUFFIXES) for P in os.path.dirname(path).split(os.sep)):
+        # Only look at the filesystem for paths which may lie in an archive
+        return None, path
+    archive = path
+    while archive and not os.path.exists(archive):
+        parent = os.path.dirname(archive)
+        if parent == archive:
+            break
+        archive = parent
+    if archive != path and is_archive(archive):
+        return archive, os.path.relpath(path, archive)
+    return None, path
+
+
+def open_tar(archive):
+    ''' Open a tar archive for a single sequential pass over its members '''
+    if archive.endswith(('.zst', '.zstd')):
+        return tarfile.open(fileobj=zstd_reader(archive), mode='r|')
+    return tarfile.open(archive, mode='r|*')
+
+
+def iter_members(archive):
+    ''' Iterate over the (member path, tar file, member info) of each regular
+        file in a tar archive, in archive order, reading the archive once '''
+    with open_tar(archive) as tar:
+        for info in tar:
+            if info.isfile():
+                yield os.path.normpath(info.name), tar, info
+
+
+def list_archive(archive, prefix='.'):
+    ''' The paths of the result files in a tar archive below a member prefix '''
+    prefix = os.path.normpath(prefix)
+    return [ os.path.join(archive, name) for name, tar, info in iter_members(archive)
+             if (prefix == '.' or name == prefix or name.startswith(prefix + os.sep))
+             and is_result_name(os.path.basename(name)) ]
+
+
+class MemberReader(io.RawIOBase):
+    ''' A member of a tar archive being read sequentially, as a raw stream.
+        tarfile's own member objects cannot be wrapped for text when the
+        archive is read as a stream, as they fail to report not being
+        seekable. '''
+
+    def __init__(self, member):
+        self.member = member
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self.member.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+def read_members(archive, names, reader):
+    ''' Read the given members of a tar archive in a single sequential pass,
+        returning reader(text stream) for each name in the order given.
+        Members not found in the archive are None. '''
+    wanted = set(names)
+    found = {}
+    for name, tar, info in iter_members(archive):
+        if name in wanted:
+            with io.TextIOWrapper(io.BufferedReader(MemberReader(tar.extractfile(info))), encoding='utf-8') as fd:
+                found[name] = reader(fd)
+    return [ found.get(name) for name in names ]
+
+# Compression of the archives written, by suffix
+TAR_WRITE_MODES = (('.tar.gz', 'w:gz'), ('.tgz', 'w:gz'), ('.tar.bz2', 'w:bz2'), ('.tar.xz', 'w:xz'), ('.tar', 'w'))
+
+
+def tar_write_mode(archive):
+    modes = [ M for S, M in TAR_WRITE_MODES if archive.endswith(S) ]
+    if not modes:
+        raise ValueError("Cannot write archive %s: expected one of %s" %
+                         (archive, ', '.join(S for S, M in TAR_WRITE_MODES)))
+    return modes[0]
+
+
+def add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_archive(archive, members):
+    ''' Write a tar archive of (member path, bytes) in the order given,
+        compressed according to its suffix.  The archive is written to a
+        temporary file and renamed into place, so it is always complete. '''
+    archive = str(archive)
+    mode = tar_write_mode(archive)
+    tmp_path = "%s.%d.tmp" % (archive, os.getpid())
+    with tarfile.open(tmp_path, mode) as tar:
+        for name, data in members:
+            add_member(tar, name, data)
+    os.replace(tmp_path, archive)
+
+
+class ArchiveWriter:
+    ''' A tar archive written a member at a time, as the members arrive.
+        Members are appended to an uncompressed tar beside the archive,
+        <archive>.partial.tar, which holds every member added so far and
+        can be read in place should the writer be killed.  close compresses
+        it into the archive, according to its suffix, in a single pass, and
+        removes it. '''
+
+    def __init__(self, archive):
+        self.archive = str(archive)
+        self.mode = tar_write_mode(self.archive)
+        self.partial = self.archive + '.partial.tar'
+        self.tar = tarfile.open(self.partial, 'w')
+
+    def add(self, name, data):
+        add_member(self.tar, name, data)
+        self.tar.fileobj.flush()
+
+    def close(self):
+        self.tar.close()
+        if self.mode == 'w':
+            os.replace(self.partial, self.archive)
+            return
+        tmp_path = "%s.%d.tmp" % (self.archive, os.getpid())
+        with tarfile.open(self.partial) as partial, tarfile.open(tmp_path, self.mode) as tar:
+            for info in partial:
+                tar.addfile(info, partial.extractfile(info))
+        os.replace(tmp_path, self.archive)
+        os.unlink(self.partial)
+
+####################################################################################################
+# Result files, compressed or archived
+
+def is_result_name(name):
+    ''' Whether a file name may be a fio result: not hidden, and not a fio
+        bandwidth, latency or IOPS log (read by fiotools.Log) '''
+    return not name.startswith('.') and not name.endswith('.log')
+
+
+def result_stat(path):
+    ''' The (size, mtime_ns) of a result file, or of the archive holding it '''
+    archive, member = split_archive_path(path)
+    st = os.stat(archive or path)
+    return st.st_size, st.st_mtime_ns
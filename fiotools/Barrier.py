@@ -0,0 +1,357 @@
+# Copyright 2021 StackHPC Ltd
+# Barrier coordinator for synchronising fio clients between the steps of a sweep
+#
+# This module uses only the Python standard library, so that it can be copied
+# into the fio container and run on its own as fio_barrier.py.  Only the
+# coordinator, when it chooses the points of adaptive sweeps, needs fiotools.
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Clients connect to a TCP address host:port, or to a Unix socket path
+DEFAULT_PORT = 7070
+
+# Clients wait this long for the coordinator to come up
+CONNECT_TIMEOUT = 60.0
+
+####################################################################################################
+
+def parse_address(address):
+    ''' The socket family and address for host:port, or for a Unix socket
+        path (containing a '/', or prefixed unix:) '''
+    address = str(address)
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    if '/' in address:
+        return socket.AF_UNIX, address
+    host, _, port = address.rpartition(':')
+    if not host:
+        host, port = port, DEFAULT_PORT
+    return socket.AF_INET, (host, int(port))
+
+
+class BarrierError(Exception):
+    ''' A barrier could not be passed: it timed out, or the request was refused '''
+
+    def __init__(self, reply):
+        self.reply = reply
+        super(BarrierError, self).__init__(reply.get('message', reply.get('status')))
+
+
+class Barrier:
+    ''' The clients waiting at one named barrier '''
+
+    def __init__(self, name, group, parties, timeout):
+        self.name = name
+        self.group = group
+        self.parties = parties
+        self.timeout = timeout
+        self.waiters = {}       # client name -> (stream writer, arrival time)
+        self.first_arrival = time.time()
+        self.timer = None
+        self.schedule = None    # The sweep to choose the next point of, on release
+
+
+class Coordinator:
+    ''' A barrier coordinator.  Each client connects, names the barrier to
+        enter, the number of parties and itself, and is sent a reply once
+        every party has arrived, or the barrier has timed out since its
+        first arrival.  Replies are written to every waiting connection at
+        once from a single event loop, so clients are released within a
+        round trip of the last arrival.
+
+        Clients whose connection drops while waiting are removed from the
+        barrier and reported.  On a timeout the clients that arrived, and
+        those of the same group seen at earlier barriers but missing from
+        this one, are reported to the log and to each waiting client.
+
+        A barrier is forgotten once released, so a name can be used again.
+
+        Clients of an adaptive sweep name the sweep they are in, its
+        schedule, and are released with the next point to run, chosen once
+        by choose(schedule) (see fiotools.Schedule.Scheduler), or None once
+        the sweep is done.  Choices are made one at a time, in a thread of
+        their own, while the event loop carries on serving. '''
+
+    def __init__(self, address, timeout=3600.0, log=print, choose=None):
+        self.family, self.address = parse_address(address)
+        self.timeout = timeout
+        self.log = log
+        self.choose = choose
+        self.chooser = ThreadPoolExecutor(max_workers=1) if choose is not None else None
+        self.barriers = {}      # barrier name -> Barrier
+        self.seen = {}          # group -> set of client names
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+
+    async def start(self):
+        if self.family == socket.AF_UNIX:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            self.server = await asyncio.start_unix_server(self.handle, path=self.address)
+        else:
+            self.server = await asyncio.start_server(self.handle, host=self.address[0], port=self.address[1])
+            # The port actually bound, where port 0 was given
+            self.address = self.server.sockets[0].getsockname()[:2]
+
+    def run(self):
+        ''' Serve until stop() is called, from any thread '''
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.loop.run_until_complete(self.start())
+            self.log( "Barrier coordinator listening on %s" % self.address_string() )
+            self.ready.set()
+            self.loop.run_forever()
+        finally:
+            if self.server is not None:
+                self.server.close()
+                self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+            if self.chooser is not None:
+                self.chooser.shutdown()
+            if self.family == socket.AF_UNIX and os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def address_string(self):
+        if self.family == socket.AF_UNIX:
+            return self.address
+        return "%s:%d" % tuple(self.address)
+
+    async def handle(self, reader, writer):
+        try:
+            request = json.loads((await reader.readline()).decode('utf-8'))
+            name, client, parties = str(request['barrier']), str(request['client']), int(request['parties'])
+            group = str(request.get('group', name))
+            timeout = float(request.get('timeout') or self.timeout)
+            schedule = request.get('schedule')
+            if schedule is not None and not isinstance(schedule, dict):
+                raise TypeError("schedule is not an object")
+        except (ValueError, KeyError, TypeError) as E:
+            self.reply(writer, {'status': 'error', 'message': "Malformed barrier request: %s" % E})
+            return
+        if schedule is not None and self.choose is None:
+            self.reply(writer, {'status': 'error', 'message': "Barrier %s: this coordinator does not choose the "
+                                "points of sweeps (serve it with --results)" % name})
+            return
+        barrier = self.barriers.get(name)
+        if barrier is None:
+            barrier = self.barriers[name] = Barrier(name, group, parties, timeout)
+            barrier.timer = self.loop.call_later(timeout, self.expire, barrier)
+        elif barrier.parties != parties:
+            self.reply(writer, {'status': 'error', 'message': "Barrier %s has %d parties, not %d" %
+                                (name, barrier.parties, parties)})
+            return
+        if schedule is not None:
+            barrier.schedule = barrier.schedule or schedule
+        if client in barrier.waiters:
+            # A client restarted since it arrived: the old connection is dead
+            self.reply(barrier.waiters[client][0], {'status': 'error', 'message': "Replaced by a new connection"})
+        barrier.waiters[client] = (writer, time.time())
+        self.seen.setdefault(group, set()).add(client)
+        if len(barrier.waiters) >= barrier.parties:
+            self.release(barrier)
+            return
+
+        # Wait for the release, or for the client to go away
+        await reader.read()
+        if self.barriers.get(name) is barrier and barrier.waiters.get(client, (None,))[0] is writer:
+            del barrier.waiters[client]
+            self.log( "Barrier %s: client %s disconnected after waiting %.1f s, %d of %d remain" %
+                      (name, client, time.time() - barrier.first_arrival, len(barrier.waiters), barrier.parties) )
+            writer.close()
+
+    def reply(self, writer, message):
+        try:
+            writer.write((json.dumps(message) + '\n').encode('utf-8'))
+            writer.close()
+        except (OSError, RuntimeError):
+            pass
+
+    def release(self, barrier):
+        barrier.timer.cancel()
+        del self.barriers[barrier.name]
+        message = {'status': 'go', 'barrier': barrier.name, 'parties': barrier.parties}
+        if barrier.schedule is None:
+            self.send(barrier, message)
+            return
+        # Every client is sent the one choice, once it is made
+        future = self.loop.run_in_executor(self.chooser, self.choose, barrier.schedule)
+        future.add_done_callback(lambda F: self.send(barrier, self.chosen(barrier, message, F)))
+
+    def chosen(self, barrier, message, future):
+        try:
+            message['next'] = future.result()
+        except Exception as E:
+            message = {'status': 'error', 'barrier': barrier.name, 'parties': barrier.parties,
+                       'message': "Barrier %s: could not choose the next point of the sweep: %s" % (barrier.name, E)}
+            self.log( message['message'] )
+            return message
+        self.log( "Barrier %s: next point %s" % (barrier.name, message['next']) )
+        return message
+
+    def send(self, barrier, message):
+        for writer, arrival in barrier.waiters.values():
+            self.reply(writer, message)
+        self.log( "Barrier %s: released %d clients %.3f s after the first arrived" %
+                  (barrier.name, len(barrier.waiters), time.time() - barrier.first_arrival) )
+
+    def expire(self, barrier):
+        if self.barriers.get(barrier.name) is not barrier:
+            return
+        del self.barriers[barrier.name]
+        arrived = sorted(barrier.waiters)
+        missing = sorted(self.seen.get(barrier.group, set()) - set(arrived))
+        message = {'status': 'timeout', 'barrier': barrier.name, 'parties': barrier.parties,
+                   'arrived': arrived, 'missing': missing,
+                   'message': "Barrier %s timed out after %g s: %d of %d clients arrived%s" %
+                              (barrier.name, barrier.timeout, len(arrived), barrier.parties,
+                               ", missing %s" % ', '.join(missing) if missing else '')}
+        self.log( message['message'] )
+        for writer, arrival in barrier.waiters.values():
+            self.reply(writer, message)
+
+####################################################################################################
+
+def connect(address, timeout=CONNECT_TIMEOUT):
+    ''' Connect to a coordinator, retrying until it is up or timeout passes '''
+    family, sockaddr = parse_address(address)
+    deadline = time.time() + timeout
+    while True:
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(sockaddr)
+            if family != socket.AF_UNIX:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            return sock
+        except OSError:
+            sock.close()
+            if time.time() >= deadline:
+                raise
+            time.sleep(0.1)
+
+
+def wait(address, name, parties, client, timeout=None, group=None, connect_timeout=CONNECT_TIMEOUT, schedule=None):
+    ''' Enter a named barrier of a number of parties as the given client,
+        returning the coordinator's reply once all have arrived.  With the
+        schedule of an adaptive sweep, the reply holds the next point to
+        run as 'next'.  Raises BarrierError if the barrier times out or the
+        request is refused, and OSError if the coordinator cannot be
+        reached. '''
+
+    request = {'barrier': name, 'parties': int(parties), 'client': client}
+    if timeout is not None:
+        request['timeout'] = timeout
+    if group is not None:
+        request['group'] = group
+    if schedule is not None:
+        request['schedule'] = schedule
+    sock = connect(address, connect_timeout)
+    try:
+        sock.sendall((json.dumps(request) + '\n').encode('utf-8'))
+        reply = b''
+        while not reply.endswith(b'\n'):
+            data = sock.recv(65536)
+            if not data:
+                raise BarrierError({'status': 'error', 'message': "Coordinator closed the connection"})
+            reply += data
+    finally:
+        sock.close()
+    reply = json.loads(reply.decode('utf-8'))
+    if reply.get('status') != 'go':
+        raise BarrierError(reply)
+    return reply
+
+####################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synchronise fio clients at named barriers')
+    commands = parser.add_subparsers(dest='command')
+    serve_parser = commands.add_parser('serve', help='Run the barrier coordinator')
+    serve_parser.add_argument('-a', '--address', metavar='<host:port|path>',
+        dest="address", type=str, default='0.0.0.0:%d' % DEFAULT_PORT,
+        help='TCP address or Unix socket path to listen on')
+    serve_parser.add_argument('-t', '--timeout', metavar='<seconds>',
+        dest="timeout", type=float, default=3600.0,
+        help='Time from the first arrival after which a barrier times out, unless clients give their own')
+    serve_parser.add_argument('-r', '--results', metavar='<path>',
+        dest="results", type=str, default=None,
+        help='Results root of adaptive sweeps, to choose the next point of each for its clients (needs fiotools)')
+    wait_parser = commands.add_parser('wait', help='Enter a barrier and wait for every client to arrive')
+    wait_parser.add_argument('-a', '--address', metavar='<host:port|path>',
+        dest="address", type=str, required=True,
+        help='TCP address or Unix socket path of the coordinator')
+    wait_parser.add_argument('-n', '--name', metavar='<barrier>',
+        dest="name", type=str, required=True,
+        help='Name of the barrier, the same for every client')
+    wait_parser.add_argument('-p', '--parties', metavar='<N>',
+        dest="parties", type=int, required=True,
+        help='Number of clients to wait for')
+    wait_parser.add_argument('-c', '--client', metavar='<name>',
+        dest="client", type=str, default=socket.gethostname(),
+        help='Name of this client (default the host name)')
+    wait_parser.add_argument('-g', '--group', metavar='<name>',
+        dest="group", type=str, default=None,
+        help='Group of barriers passed by the same clients, to report missing clients by name')
+    wait_parser.add_argument('-t', '--timeout', metavar='<seconds>',
+        dest="timeout", type=float, default=None,
+        help='Time from the first arrival after which the barrier times out')
+    wait_parser.add_argument('-s', '--schedule', metavar='<sweep>',
+        dest="schedule", choices=['bs'], default=None,
+        help='Print the next I/O size of the adaptive sweep of the input directory, or nothing once it is done')
+    wait_parser.add_argument('-i', '--input-dir', metavar='<path>',
+        dest="input_dir", type=str, default='.',
+        help='With --schedule, the results of the sweep, relative to the coordinator\'s results root')
+    wait_parser.add_argument('--tolerance', metavar='<fraction>',
+        dest="tolerance", type=float, default=None,
+        help='With --schedule, changes in throughput and latency within this fraction are taken as flat')
+    wait_parser.add_argument('--max-points', metavar='<N>',
+        dest="max_points", type=int, default=None,
+        help='With --schedule, stop refining once this many points have been run')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        choose = None
+        if args.results is not None:
+            from fiotools.Schedule import Scheduler
+            choose = Scheduler(args.results)
+        coordinator = Coordinator(args.address, args.timeout,
+                                  log=lambda message: print( message, flush=True ), choose=choose)
+        try:
+            coordinator.run()
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == 'wait':
+        schedule = None
+        if args.schedule is not None:
+            schedule = {'sweep': args.schedule, 'input_dir': args.input_dir,
+                        'tolerance': args.tolerance, 'max_points': args.max_points}
+        try:
+            reply = wait(args.address, args.name, args.parties, args.client, args.timeout, args.group,
+                         schedule=schedule)
+        except BarrierError as E:
+            sys.stderr.write("%s\n" % E)
+            return 1
+        except OSError as E:
+            sys.stderr.write("Could not reach the barrier coordinator at %s: %s\n" % (args.address, E))
+            return 2
+        if reply.get('next') is not None:
+            print( reply['next'] )
+        return 0
+    parser.print_help()
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# Copyright 2021 StackHPC Ltd
+# Benchmarks of the analysis pipeline on synthetic fio results
+
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+
+import fiotools
+import fiotools.Data
+import fiotools.Plot
+from fiotools.Synthetic import SWEEP_BS, write_client_sweep, write_group_sweep
+
+SCENARIO = 'synthetic'
+RW = 'randread'
+
+
+def best_time(fn, repeat=3):
+    ''' The shortest of repeat timings of fn(), and its last result '''
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def prepare(work_dir, clients, block_sizes=SWEEP_BS, density=600):
+    ''' Generate the synthetic results for a benchmark size, unless already
+        present in work_dir.  Returns the per-client and group-reporting
+        result directories. '''
+
+    size_dir = os.path.join(str(work_dir), '%d-clients-%d-bs-%d' % (clients, len(block_sizes), density))
+    client_dir = os.path.join(size_dir, 'clients', '%s-%s' % (SCENARIO, RW), str(clients))
+    group_dir = os.path.join(size_dir, 'group', '%s-%s' % (SCENARIO, RW))
+    if not os.path.isdir(size_dir):
+        print( "Generating synthetic results for %d clients x %d block sizes in %s" % (clients, len(block_sizes), size_dir) )
+        write_client_sweep(os.path.join(size_dir, 'clients'), SCENARIO, RW, clients, block_sizes, density=density)
+        client_counts = sorted(set([1, max(1, clients // 2), clients]))
+        write_group_sweep(os.path.join(size_dir, 'group'), SCENARIO, RW, client_counts, block_sizes, density=density)
+    return client_dir, group_dir
+
+
+def benchmark_size(client_dir, group_dir, clients, block_sizes=SWEEP_BS, repeat=3, jobs=1):
+    ''' Time each stage of the analysis of one benchmark size, returning a
+        dict of stage name to seconds (the best of repeat runs). '''
+
+    times = {}
+    file_list = fiotools.get_fio_file_list(client_dir)
+    out_dir = tempfile.mkdtemp()
+    try:
+        times['get_fio_results'], _ = best_time(
+            lambda: fiotools.get_fio_results(file_list, cache=False, jobs=jobs), repeat)
+        fiotools.get_fio_results(file_list, jobs=jobs)
+        times['get_fio_results_cached'], _ = best_time(
+            lambda: fiotools.get_fio_results(file_list, jobs=jobs), repeat)
+
+        grid = fiotools.ClatGrid(
+            input_dirs=[client_dir], output_dir=out_dir, granularity=200, scenario=SCENARIO,
+            mode=RW, force=True, logscale=True, clients=clients, max_bs=max(block_sizes),
+            bs_list=[], plot=False, jobs=jobs)
+        populate = aggregate = 0.0
+        specs = []
+        for bs in block_sizes:
+            grid.reset_grid()
+            T, _ = best_time(lambda: grid.populate_for_clients(bs), 1)
+            populate += T
+            T, _ = best_time(grid.aggregate_and_normalise, 1)
+            aggregate += T
+            specs += grid.specs_for_clients(bs)
+        times['populate_for_clients'] = populate
+        times['aggregate_and_normalise'] = aggregate
+        times['render_clatgrid'], _ = best_time(lambda: fiotools.Plot.render_figures(specs, jobs, False), 1)
+
+        times['SeriesGroup'], run_data = best_time(
+            lambda: fiotools.Data.SeriesGroup(group_dir, cache=False, jobs=jobs), repeat)
+        times['StackedLine'], plots = best_time(
+            lambda: [ fiotools.Plot.BandwidthClient(SCENARIO, bs, run_data) for bs in block_sizes ], repeat)
+        specs = [ P.spec('Bandwidth', 'MB/s', 1000.0, os.path.join(out_dir, 'bw-%d.png' % bs))
+                  for P, bs in zip(plots, block_sizes) ]
+        times['render_stacked'], _ = best_time(lambda: fiotools.Plot.render_figures(specs, jobs, False), 1)
+    finally:
+        shutil.rmtree(out_dir)
+    return times
+
+
+def startup_time(repeat=3):
+    ''' The time a fresh interpreter takes to import fiotools and
+        fiotools.Data, beyond starting up at all (the best of repeat runs) '''
+
+    def run(code):
+        return lambda: subprocess.check_call([sys.executable, '-c', code])
+    bare, _ = best_time(run('pass'), repeat)
+    loaded, _ = best_time(run('import fiotools, fiotools.Data'), repeat)
+    return max(loaded - bare, 0.0)
+
+
+def run_benchmarks(work_dir, client_sizes=(1, 64, 1024), block_sizes=SWEEP_BS, density=600, repeat=3, jobs=1):
+    ''' Run the benchmark suite at each size, returning a dict keyed by
+        '<clients>-clients/<stage>' of seconds, with the import time of
+        fiotools as 'startup/import_fiotools'. '''
+
+    results = {'startup/import_fiotools': startup_time(repeat)}
+    print( "%-40s %10.3f s" % ('startup/import_fiotools', results['startup/import_fiotools']) )
+    for clients in client_sizes:
+        client_dir, group_dir = prepare(work_dir, clients, block_sizes, density)
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            times = benchmark_size(client_dir, group_dir, clients, block_sizes, repeat, jobs)
+        for stage, T in iter(times.items()):
+            results['%d-clients/%s' % (clients, stage)] = T
+            print( "%-40s %10.3f s" % ('%d-clients/%s' % (clients, stage), T) )
+    return results
+
+
+def environment():
+    ''' A description of the machine the benchmarks were run on '''
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_baseline(path, results, **settings):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'settings': settings, 'results': results},
+                  f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(results, baseline, tolerance=0.25, floor=0.05):
+    ''' Compare benchmark results against a baseline, returning a list of
+        (benchmark, baseline seconds, seconds) for each benchmark slower
+        than the baseline by more than the tolerance fraction.  Differences
+        under floor seconds are timing noise and are ignored. '''
+
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        slower = results[key] - baseline[key]
+        if slower > floor and results[key] > baseline[key] * (1.0 + tolerance):
+            regressions.append((key, baseline[key], results[key]))
+    return regressions
@@ -0,0 +1,359 @@
+# Copyright 2021 StackHPC Ltd
+# Persistent parse cache for fio result files
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from fiotools import Instrument
+from fiotools.Archive import read_members, split_archive_path
+from fiotools.Histogram import LatencyHistogram
+from fiotools.Instrument import count, profiled
+from fiotools.Projection import JOB_FIELDS, SECTION_FIELDS, SECTIONS, STEADYSTATE_FIELDS, read_fio_file, read_fio_stream
+
+####################################################################################################
+
+class ResultCache:
+    ''' A columnar sidecar cache of projected fio results for the files
+        of one results directory.  Entries are keyed by file name and
+        are valid for as long as the file size and mtime are unchanged.
+        Records are only decoded from the columnar data when looked up. '''
+
+    filename = '.fiotools-cache.npz'
+    version = 3
+
+    def __init__(self, directory, rebuild=False):
+        self.directory = str(directory)
+        self.path = os.path.join(self.directory, self.filename)
+        self.arrays = {}        # Columnar data loaded from the sidecar
+        self.rows = {}          # file name -> (size, mtime_ns, histograms, row in arrays)
+        self.entries = {}       # file name -> (size, mtime_ns, histograms, record or error)
+        self.dirty = False
+        if not rebuild:
+            self.load()
+
+    def stat_key(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+
+    def lookup(self, path, histograms=True, stat_key=None):
+        ''' Return the cached record for a file, or None if the file is not
+            cached, has changed since, or was cached without the histograms
+            now required.  A cached parse failure is raised again as its
+            original exception type.  The (size, mtime_ns) of the file is
+            looked up unless already known, as from a manifest. '''
+        name = os.path.basename(path)
+        entry = self.entries.get(name) or self.rows.get(name)
+        if entry is None or entry[:2] != (stat_key or self.stat_key(path)):
+            return None
+        if histograms and not entry[2]:
+            return None
+        if name in self.entries:
+            record = entry[3]
+        else:
+            record = decode_file(self.arrays, entry[3], histograms)
+        if isinstance(record, Exception):
+            raise record
+        return record
+
+    def store(self, path, record, histograms=True, stat_key=None):
+        ''' Add a parsed record (or the exception raised parsing it) '''
+        self.entries[os.path.basename(path)] = (stat_key or self.stat_key(path)) + (histograms, record)
+        self.dirty = True
+
+    def prune(self, names):
+        ''' Drop entries for files other than those named, the results
+            found in the directory by discovery (see fiotools.Discovery), so
+            that the directory need not be listed again '''
+        names = set(names)
+        for cached in (self.rows, self.entries):
+            for name in list(cached):
+                if name not in names:
+                    del cached[name]
+                    self.dirty = True
+
+    def load(self):
+        try:
+            with np.load(self.path, allow_pickle=False) as A:
+                if int(A['version']) != self.version:
+                    return
+                self.arrays = { K: A[K] for K in A.files }
+        except (OSError, ValueError, KeyError) as E:
+            if os.path.exists(self.path):
+                print( "Ignoring unreadable parse cache %s: %s" % (self.path, str(E)) )
+            return
+        A = self.arrays
+        for i, name in enumerate(A['file_name'].tolist()):
+            self.rows[name] = (int(A['file_size'][i]), int(A['file_mtime'][i]),
+                               bool(A['file_histograms'][i]), i)
+
+    def save(self):
+        ''' Write the cache back if anything changed.  Results directories
+            may be read-only, in which case the cache is simply not kept. '''
+        if not self.dirty:
+            return
+        entries = {}
+        for name, (size, mtime, histograms, row) in iter(self.rows.items()):
+            entries[name] = (size, mtime, histograms, decode_file(self.arrays, row, histograms))
+        entries.update(self.entries)
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, version=self.version, **encode_entries(entries))
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as E:
+            print( "Could not write parse cache %s: %s" % (self.path, str(E)) )
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+####################################################################################################
+# Columnar encoding of cache entries
+
+ERROR_TYPES = { E.__name__: E for E in (ValueError, KeyError, TypeError) }
+EMPTY_HISTOGRAM = LatencyHistogram([], [])
+
+# Steady state report fields held as strings, and as numbers
+SS_STRINGS = [ F for F, T in STEADYSTATE_FIELDS if T is str ]
+SS_SCALARS = [ (F, T) for F, T in STEADYSTATE_FIELDS if T is not str ]
+
+
+def ragged(dicts, key_type, value_type):
+    ''' Flatten a list of dicts into offsets, keys and values arrays '''
+    offsets = np.zeros(len(dicts) + 1, dtype=np.int64)
+    keys, values = [], []
+    for i, D in enumerate(dicts):
+        keys += list(D.keys())
+        values += list(D.values())
+        offsets[i+1] = len(keys)
+    return offsets, np.array(keys, dtype=key_type), np.array(values, dtype=value_type)
+
+
+def unragged(offsets, keys, values, i):
+    return dict(zip(keys[offsets[i]:offsets[i+1]].tolist(), values[offsets[i]:offsets[i+1]].tolist()))
+
+
+def scalars(D, fields):
+    return [ float(D[F]) if F in D else np.nan for F, _ in fields ]
+
+
+def unscalars(row, fields):
+    return { F: T(v) for (F, T), v in zip(fields, row.tolist()) if not np.isnan(v) }
+
+
+def encode_entries(entries):
+    names = sorted(entries)
+    file_cols = {'name': [], 'size': [], 'mtime': [], 'histograms': [], 'status': [], 'kind': [], 'total_clients': []}
+    gopts, jobs = [], []
+    job_offset = [0]
+    for name in names:
+        size, mtime, histograms, record = entries[name]
+        file_cols['name'].append(name)
+        file_cols['size'].append(size)
+        file_cols['mtime'].append(mtime)
+        file_cols['histograms'].append(histograms)
+        if isinstance(record, Exception):
+            file_cols['status'].append("%s:%s" % (type(record).__name__, record.args[0] if record.args else ''))
+            record = {}
+        else:
+            file_cols['status'].append('')
+        kind = 'client_stats' if 'client_stats' in record else 'jobs' if 'jobs' in record else ''
+        file_cols['kind'].append(kind)
+        file_cols['total_clients'].append(int(record['meta']['total_clients']) if 'meta' in record else -1)
+        gopts.append({ str(k): str(v) for k, v in iter(record.get('global options', {}).items()) })
+        jobs += record.get(kind, [])
+        job_offset.append(len(jobs))
+
+    A = {
+        'file_name': np.array(file_cols['name'], dtype=str),
+        'file_size': np.array(file_cols['size'], dtype=np.int64),
+        'file_mtime': np.array(file_cols['mtime'], dtype=np.int64),
+        'file_histograms': np.array(file_cols['histograms'], dtype=bool),
+        'file_status': np.array(file_cols['status'], dtype=str),
+        'file_kind': np.array(file_cols['kind'], dtype=str),
+        'file_total_clients': np.array(file_cols['total_clients'], dtype=np.int64),
+        'job_offset': np.array(job_offset, dtype=np.int64),
+    }
+    A['gopt_offset'], A['gopt_key'], A['gopt_val'] = ragged(gopts, str, str)
+
+    # Job-level columns
+    A['job_name'] = np.array([ J.get('jobname', '') for J in jobs ], dtype=str)
+    A['job_host'] = np.array([ J.get('hostname', '') for J in jobs ], dtype=str)
+    A['job_has_host'] = np.array([ 'hostname' in J for J in jobs ], dtype=bool)
+    A['job_scalars'] = np.array([ scalars(J, JOB_FIELDS) for J in jobs ], dtype=np.double).reshape(len(jobs), len(JOB_FIELDS))
+    A['jopt_offset'], A['jopt_key'], A['jopt_val'] = ragged(
+        [ { str(k): str(v) for k, v in iter(J.get('job options', {}).items()) } for J in jobs ], str, str)
+    steady = [ J.get('steadystate') for J in jobs ]
+    A['job_has_ss'] = np.array([ S is not None for S in steady ], dtype=bool)
+    A['job_ss_scalars'] = np.array([ scalars(S or {}, SS_SCALARS) for S in steady ], dtype=np.double).reshape(len(jobs), len(SS_SCALARS))
+    for F in SS_STRINGS:
+        A['job_ss_' + F] = np.array([ str(S.get(F, '')) if S else '' for S in steady ], dtype=str)
+
+    # Section-level columns, two rows (read, write) per job
+    sections = [ J.get(D) for J in jobs for D in SECTIONS ]
+    A['sec_present'] = np.array([ S is not None for S in sections ], dtype=bool)
+    A['sec_has_clat'] = np.array([ S is not None and 'clat_ns' in S for S in sections ], dtype=bool)
+    A['sec_scalars'] = np.array([ scalars(S or {}, SECTION_FIELDS) for S in sections ], dtype=np.double).reshape(len(sections), len(SECTION_FIELDS))
+    clat = [ S['clat_ns'] if S is not None and 'clat_ns' in S else {} for S in sections ]
+    A['pct_offset'], A['pct_key'], A['pct_val'] = ragged([ C.get('percentile', {}) for C in clat ], str, np.int64)
+    hists = [ C.get('bins', EMPTY_HISTOGRAM) for C in clat ]
+    A['bin_offset'] = np.concatenate(([0], np.cumsum([ len(H) for H in hists ]))).astype(np.int64)
+    A['bin_y'] = np.concatenate([ H.values for H in hists ] + [EMPTY_HISTOGRAM.values])
+    A['bin_z'] = np.concatenate([ H.counts for H in hists ] + [EMPTY_HISTOGRAM.counts])
+    return A
+
+
+def decode_file(A, i, histograms=True):
+    ''' Reconstruct the record (or parse error) for row i of the file columns '''
+    status = str(A['file_status'][i])
+    if status:
+        E, _, msg = status.partition(':')
+        return ERROR_TYPES.get(E, ValueError)(msg)
+    record = {'global options': unragged(A['gopt_offset'], A['gopt_key'], A['gopt_val'], i)}
+    if A['file_total_clients'][i] >= 0:
+        record['meta'] = {'total_clients': int(A['file_total_clients'][i])}
+    kind = str(A['file_kind'][i])
+    if kind:
+        record[kind] = [ decode_job(A, j, histograms)
+                         for j in range(A['job_offset'][i], A['job_offset'][i+1]) ]
+    return record
+
+
+def decode_job(A, j, histograms=True):
+    J = unscalars(A['job_scalars'][j], JOB_FIELDS)
+    J['jobname'] = str(A['job_name'][j])
+    if A['job_has_host'][j]:
+        J['hostname'] = str(A['job_host'][j])
+    J['job options'] = unragged(A['jopt_offset'], A['jopt_key'], A['jopt_val'], j)
+    if A['job_has_ss'][j]:
+        J['steadystate'] = unscalars(A['job_ss_scalars'][j], SS_SCALARS)
+        J['steadystate'].update({ F: str(A['job_ss_' + F][j]) for F in SS_STRINGS })
+    for d, D in enumerate(SECTIONS):
+        s = 2*j + d
+        if not A['sec_present'][s]:
+            continue
+        S = unscalars(A['sec_scalars'][s], SECTION_FIELDS)
+        if histograms and A['sec_has_clat'][s]:
+            S['clat_ns'] = {
+                'percentile': unragged(A['pct_offset'], A['pct_key'], A['pct_val'], s),
+                'bins': LatencyHistogram(A['bin_y'][A['bin_offset'][s]:A['bin_offset'][s+1]],
+                                         A['bin_z'][A['bin_offset'][s]:A['bin_offset'][s+1]]),
+            }
+        J[D] = S
+    return J
+
+####################################################################################################
+
+@profiled('load_fio_files')
+def load_fio_files(paths, cache=True, rebuild=False, histograms=True, jobs=1, stats=None, complete=False):
+    ''' Read a list of fio result files, returning a list of tuples of
+        (path, projected data, error) in the order given.  Either the data or
+        the error is None: a parse error (ValueError, KeyError or TypeError),
+        or an OSError for a file that could not be read, which is not cached.
+        Without histograms, no completion latency data is loaded at all.
+        With the cache enabled, only new or changed files are parsed and
+        the sidecar cache of each results directory is updated.  Files may
+        be compressed, or be members of tar archives (see fiotools.Archive).
+        Files are parsed by a pool of worker processes if jobs > 1.  stats
+        maps paths to their (size, mtime_ns) where already known, as from
+        a manifest (see fiotools.Discovery), to save looking them up.  With
+        complete set, the paths are every result found in their directories,
+        and entries for any other files are dropped from their caches. '''
+
+    caches = {}
+    stats = stats or {}
+    paths = [ str(P) for P in paths ]
+    count(files=len(paths))
+    results = [None] * len(paths)
+    misses = []
+    members = {}            # archive -> [(index in paths, member name)]
+    for i, path in enumerate(paths):
+        # Members of tar archives are read together in one pass over each
+        # archive.  They are not cached, having no directory to cache in.
+        archive, member = split_archive_path(path)
+        if archive is not None:
+            members.setdefault(archive, []).append((i, member))
+            continue
+        if cache:
+            directory = os.path.dirname(path)
+            if directory not in caches:
+                caches[directory] = ResultCache(directory, rebuild=rebuild)
+            try:
+                record = caches[directory].lookup(path, histograms, stats.get(path))
+                if record is not None:
+                    results[i] = (path, record, None)
+                    continue
+            except (ValueError, KeyError, TypeError, OSError) as E:
+                results[i] = (path, None, E)
+                continue
+        misses.append(i)
+
+    for i, (record, error) in zip(misses, parse_fio_files([ paths[i] for i in misses ], histograms, jobs)):
+        path = paths[i]
+        if cache and not isinstance(error, OSError):
+            caches[os.path.dirname(path)].store(path, record if error is None else error, histograms, stats.get(path))
+        results[i] = (path, record, error)
+
+    archives = sorted(members)
+    for archive, parsed in zip(archives, parse_archives(archives, [ [ M for i, M in members[A] ] for A in archives ], histograms, jobs)):
+        for (i, member), (record, error) in zip(members[archive], parsed):
+            results[i] = (paths[i], record, error)
+
+    for directory, result_cache in caches.items():
+        if complete:
+            result_cache.prune(os.path.basename(P) for P in paths if os.path.dirname(P) == directory)
+        result_cache.save()
+    return results
+
+
+def parse_fio_file(path, histograms=True):
+    ''' Parse one fio result file, returning (data, error) '''
+    try:
+        return read_fio_file(path, histograms), None
+    except (ValueError, KeyError, TypeError, OSError) as E:
+        return None, E
+
+
+def parse_fio_stream(fd, histograms=True):
+    try:
+        return read_fio_stream(fd, histograms), None
+    except (ValueError, KeyError, TypeError) as E:
+        return None, E
+
+
+def parse_archive(archive, names, histograms=True):
+    ''' Parse the named members of a tar archive, decompressing it in a
+        single sequential pass, returning a list of (data, error) in the
+        order given '''
+    parsed = read_members(archive, names, lambda fd: parse_fio_stream(fd, histograms))
+    return [ (None, KeyError("%s not found in %s" % (name, archive))) if P is None else P
+             for name, P in zip(names, parsed) ]
+
+
+@profiled('parse_archives')
+def parse_archives(archives, names, histograms=True, jobs=1):
+    ''' Parse the named members of each of a list of tar archives,
+        returning a list of the results of parse_archive for each.  With
+        jobs > 1 the archives are shared among a pool of worker processes,
+        each decompressing and parsing whole archives. '''
+
+    count(paths=archives)
+    if jobs <= 1 or len(archives) <= 1:
+        return [ parse_archive(A, N, histograms) for A, N in zip(archives, names) ]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=Instrument.disable) as pool:
+        return list(pool.map(parse_archive, archives, names, [histograms] * len(archives)))
+
+
+@profiled('parse_fio_files')
+def parse_fio_files(paths, histograms=True, jobs=1):
+    ''' Parse fio result files, returning a list of (data, error) in the
+        order given.  With jobs > 1 the files are shared among a pool of
+        worker processes, which return only the projected data. '''
+
+    count(paths=paths)
+    if jobs <= 1 or len(paths) <= 1:
+        return [ parse_fio_file(P, histograms) for P in paths ]
+    chunksize = max(1, len(paths) // (4 * jobs))
+    with ProcessPoolExecutor(max_workers=jobs, initializer=Instrument.disable) as pool:
+        return list(pool.map(parse_fio_file, paths, [histograms] * len(paths), chunksize=chunksize))
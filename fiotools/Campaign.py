@@ -0,0 +1,232 @@
+# Copyright 2021 StackHPC Ltd
+# Campaign reports: every scenario, mode, client count and I/O size in a results tree
+
+import html
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import fiotools
+import fiotools.Data
+import fiotools.Plot
+from fiotools import Instrument
+from fiotools.Cache import load_fio_files
+from fiotools.Instrument import profiled
+
+####################################################################################################
+
+def scenario_of(rel_dir, rw, default):
+    ''' The scenario of a result from its directory relative to the results
+        root: run_fio.sh writes <scenario>-<rw>/<clients>/<client>/<bs>.json '''
+    parts = [ P for P in rel_dir.split(os.sep) if P not in ('', '.') ]
+    if not parts:
+        return default
+    suffix = '-' + rw
+    return parts[0][:-len(suffix)] if parts[0].endswith(suffix) else parts[0]
+
+
+def clients_of(rel_dir, fio_run_data):
+    ''' The number of test clients of a per-client result: as recorded in
+        the result, else the first numeric directory below the scenario '''
+    if 'meta' in fio_run_data:
+        return int(fio_run_data['meta']['total_clients'])
+    for P in rel_dir.split(os.sep)[1:]:
+        if P.isdigit():
+            return int(P)
+    return 1
+
+
+class Campaign:
+    ''' The fio results of a whole campaign, read once from a results root
+        and grouped by scenario and I/O mode.
+
+        Per-client results (as written by run_fio.sh) are indexed by
+        (test clients, I/O size) for ClatGrid, and group-reporting results
+        (from fio's client/server mode) are gathered into a Series.  Result
+        files are found by the include and exclude globs given. '''
+
+    def __init__(self, results_root, cache=True, rebuild_cache=False, jobs=1, include=None, exclude=None):
+        self.results_root = str(results_root)
+        self.client_index = {}      # (scenario, rw) -> {(test clients, I/O size): [fio result]}
+        self.group_series = {}      # (scenario, rw) -> Series of group-reporting samples
+        self.ingest(cache, rebuild_cache, jobs, include, exclude)
+
+    @profiled('Campaign.ingest')
+    def ingest(self, cache, rebuild_cache, jobs, include=None, exclude=None):
+        default = os.path.basename(os.path.normpath(self.results_root))
+        stats = dict(fiotools.find_fio_files(self.results_root, include, exclude))
+        paths = list(stats)
+        group_samples = {}
+        for path, fio_run_data, error in load_fio_files(paths, cache, rebuild_cache, jobs=jobs, stats=stats, complete=True):
+            rel_dir = os.path.relpath(os.path.dirname(path), self.results_root)
+            if isinstance(error, ValueError):
+                print( "Skipping %s: could not be parsed as JSON" % (path) )
+                continue
+            try:
+                if error is not None:
+                    raise error
+                if 'client_stats' in fio_run_data:
+                    sample = fiotools.Data.SampleGroup(path, fio_run_data)
+                    group_samples.setdefault((sample.jobname, sample.sample_group[0].rw), []).append(sample)
+                else:
+                    rw = fio_run_data['jobs'][0]['job options']['rw']
+                    key = (scenario_of(rel_dir, rw, default), rw)
+                    bs = int(fio_run_data['global options']['bs'])
+                    clients = clients_of(rel_dir, fio_run_data)
+                    self.client_index.setdefault(key, {}).setdefault((clients, bs), []).append(fio_run_data)
+            except (KeyError, TypeError, ValueError, IndexError, OSError) as E:
+                print( "Skipping %s: data structure could not be parsed: %s" % (path, str(E)) )
+        for key, samples in iter(group_samples.items()):
+            self.group_series[key] = fiotools.Data.Series(samples)
+        print( "Found %d fio results in %s: %d per-client and %d group-reporting scenarios" %
+               (len(paths), self.results_root, len(self.client_index), len(self.group_series)) )
+
+    def scenarios(self):
+        ''' The sorted list of (scenario, rw) found '''
+        return sorted(set(self.client_index) | set(self.group_series))
+
+####################################################################################################
+
+class CampaignReport:
+    ''' All the outputs of a campaign: for each scenario and mode, the
+        ClatGrid latency, bandwidth and IOPS outputs by number of clients
+        for every I/O size of the per-client results, the stacked
+        bandwidth and IOPS plots of every I/O size of the group-reporting
+        results, and an index page linking them all.
+
+        The CSVs and plot specs of each output set are computed first, and
+        the figures of every output set are then rendered together, both
+        shared among jobs worker processes.
+
+        The output directory may hold other outputs, such as those of
+        fio_blocksize for the same scenarios: only the report's own output
+        sets and index page are replaced. '''
+
+    def __init__(self, campaign, output_dir, force=False, logscale=False, timescale='us',
+                 output_format='png', heatmap='auto', plot=True, jobs=1, verbose=False):
+        self.campaign = campaign
+        self.results_root = campaign.results_root
+        self.output_dir = str(output_dir)
+        self.logscale = logscale
+        self.timescale = timescale
+        self.output_format = output_format
+        self.heatmap = heatmap
+        self.plot = plot
+        self.jobs = jobs
+        self.verbose = verbose
+        self.plot_specs = []
+        self.sections = []          # (title, output directory)
+        self.ensure_output_dir(force)
+
+    def __getstate__(self):
+        # Worker processes are sent the results of one output set at a
+        # time, rather than the whole campaign with every output set
+        state = dict(self.__dict__)
+        state['campaign'] = None
+        return state
+
+    def outputs(self):
+        ''' The paths the report writes: the index page and a directory for
+            each output set '''
+        paths = [os.path.join(self.output_dir, 'index.html')]
+        for scenario, rw in self.campaign.scenarios():
+            if (scenario, rw) in self.campaign.client_index:
+                paths.append(os.path.join(self.output_dir, '%s-%s' % (scenario, rw), 'clients'))
+            if (scenario, rw) in self.campaign.group_series:
+                paths.append(os.path.join(self.output_dir, '%s-%s' % (scenario, rw), 'group'))
+        return paths
+
+    def ensure_output_dir(self, force):
+        # Only the outputs of a previous report are replaced, leaving
+        # anything else in the output directory alone
+        existing = [ P for P in self.outputs() if os.path.lexists(P) ]
+        if existing and not force:
+            raise ValueError("Output directory %s holds a report already: use --force to overwrite it" % (self.output_dir))
+        for P in existing:
+            print( "Deleting existing output data %s" % (P) )
+            if os.path.isdir(P) and not os.path.islink(P):
+                shutil.rmtree(P)
+            else:
+                os.unlink(P)
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    @profiled('CampaignReport.generate')
+    def generate(self):
+        ''' Write every output of the campaign, returning the path of the index page '''
+        tasks = []
+        for scenario, rw in self.campaign.scenarios():
+            if (scenario, rw) in self.campaign.client_index:
+                tasks.append((self.client_outputs, scenario, rw, self.campaign.client_index[(scenario, rw)]))
+            if (scenario, rw) in self.campaign.group_series:
+                tasks.append((self.group_outputs, scenario, rw, self.campaign.group_series[(scenario, rw)]))
+        if self.jobs <= 1 or len(tasks) <= 1:
+            output_sets = [ F(*args) for F, *args in tasks ]
+        else:
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=Instrument.disable) as pool:
+                futures = [ pool.submit(F, *args) for F, *args in tasks ]
+                output_sets = [ F.result() for F in futures ]
+        for plot_specs, section in output_sets:
+            self.plot_specs += plot_specs
+            self.sections.append(section)
+        if self.plot:
+            self.render_times = fiotools.Plot.render_figures(self.plot_specs, self.jobs, self.verbose)
+        return self.write_index()
+
+    @profiled('CampaignReport.client_outputs')
+    def client_outputs(self, scenario, rw, fio_index):
+        ''' ClatGrid outputs by number of clients for each I/O size of the
+            per-client results indexed, returning the plot specs and the
+            section of the index page '''
+        output_dir = os.path.join(self.output_dir, '%s-%s' % (scenario, rw), 'clients')
+        grid = fiotools.ClatGrid(
+            input_dirs=[os.path.join(self.results_root, '%s-%s' % (scenario, rw))],
+            output_dir=output_dir, granularity=50 if self.logscale else 2000,
+            scenario=scenario, mode=rw, force=True, logscale=self.logscale, timescale=self.timescale,
+            max_bs=max(bs for clients, bs in fio_index), clients=max(clients for clients, bs in fio_index),
+            verbose=self.verbose, plot=self.plot, output_format=self.output_format, heatmap=self.heatmap,
+            fio_index=fio_index, render=False, keep_going=True)
+        return grid.plot_specs, ('%s %s: latency, bandwidth and IOPS by number of clients' % (scenario, rw), output_dir)
+
+    @profiled('CampaignReport.group_outputs')
+    def group_outputs(self, scenario, rw, run_data):
+        ''' Stacked bandwidth and IOPS by number of clients for each I/O size
+            of a series of group-reporting results, and the table of every
+            result, returning the plot specs and the section of the index page '''
+        output_dir = os.path.join(self.output_dir, '%s-%s' % (scenario, rw), 'group')
+        os.makedirs(output_dir)
+        plot_specs = []
+        run_data.write_table(os.path.join(output_dir, '%s-%s-results.csv' % (scenario, rw)))
+        for bs in sorted(run_data.io_sizes()):
+            for plot_class, metric, title, ylabel in (
+                    (fiotools.Plot.BandwidthClient, 'bandwidth', 'Bandwidth', '%s bandwidth ($MB/s$)'),
+                    (fiotools.Plot.IOPSClient, 'iops', 'IOPS', '%s IOPS ($kIOPS$)')):
+                outfile = os.path.join(output_dir, '%s-test-clients-vs-%s-%d.%s' % (scenario, metric, bs, self.output_format))
+                spec = plot_class(scenario, bs, run_data).spec(
+                    '%s vs clients - %s - %d' % (title, scenario, bs), ylabel % scenario.capitalize(), 1000.0, outfile)
+                if self.plot:
+                    plot_specs.append(spec)
+                else:
+                    spec.data.to_csv(os.path.splitext(outfile)[0] + '.csv')
+        return plot_specs, ('%s %s: group-reported bandwidth and IOPS by number of clients' % (scenario, rw), output_dir)
+
+    def write_index(self):
+        ''' Write index.html linking every figure and data file, by section '''
+        lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>fio campaign report</title></head><body>',
+                 '<h1>fio campaign report: %s</h1>' % html.escape(self.campaign.results_root)]
+        for title, output_dir in self.sections:
+            lines.append('<h2>%s</h2>' % html.escape(title))
+            files = sorted(os.listdir(output_dir))
+            for F in files:
+                href = html.escape(os.path.relpath(os.path.join(output_dir, F), self.output_dir))
+                if F.endswith(('.png', '.svg')):
+                    lines.append('<p><a href="%s"><img src="%s" alt="%s" width="800"></a></p>' % (href, href, html.escape(F)))
+            links = [ '<li><a href="%s">%s</a></li>' % (html.escape(os.path.relpath(os.path.join(output_dir, F), self.output_dir)), html.escape(F))
+                      for F in files if not F.endswith(('.png', '.svg')) ]
+            if links:
+                lines += ['<ul>'] + links + ['</ul>']
+        lines.append('</body></html>')
+        path = os.path.join(self.output_dir, 'index.html')
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        print( "Wrote campaign report index %s" % path )
+        return path
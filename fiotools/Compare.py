@@ -0,0 +1,225 @@
+# Copyright 2021 StackHPC Ltd
+# Regression comparison of a candidate set of fio results against a baseline
+
+import json
+import os
+
+import numpy as np
+
+import fiotools
+from fiotools.Histogram import PlatHistogram
+from fiotools.Instrument import profiled
+from fiotools.Plot import PlotSpec
+
+# Results are aligned on I/O mode, I/O size and number of test clients
+KEYS = ('rw', 'bs', 'clients')
+
+# The completion latency percentiles compared, from the histogram of each result
+PERCENTILES = (50.0, 99.0, 99.9)
+
+# Metrics compared, with the direction of improvement: +1 where higher is
+# better (bandwidth in KiB/s, IOPS), -1 where lower is (latency in us)
+METRICS = [('bw', 1), ('iops', 1)] + [ ('clat_p%g' % P, -1) for P in PERCENTILES ]
+
+# Columns of the comparison table
+COMPARE_COLUMNS = KEYS + ('metric', 'baseline', 'candidate', 'delta_pct', 't',
+                          'n_baseline', 'n_candidate', 'regression')
+
+####################################################################################################
+
+def select_scenario(campaign, rw, scenario, label):
+    ''' The scenario of a campaign to compare for an I/O mode, which must be
+        given where the campaign holds more than one '''
+    scenarios = sorted(S for S, S_rw in campaign.scenarios() if S_rw == rw)
+    if scenario is not None:
+        return scenario if scenario in scenarios else None
+    if len(scenarios) > 1:
+        raise ValueError("The %s results hold %s scenarios %s: choose one to compare" %
+                         (label, rw, ', '.join(scenarios)))
+    return scenarios[0] if scenarios else None
+
+
+def result_rows(campaign, scenario=None, label='baseline'):
+    ''' The results of a campaign as a table with one row per client result,
+        with the columns KEYS and the value of each metric, and the merged
+        latency histogram of each (rw, bs, clients).  Group-reporting
+        results have no latency histograms, so only their bandwidth and
+        IOPS are compared. '''
+
+    import pandas as pd
+    rows = []
+    histograms = {}
+    for rw in sorted(set(rw for S, rw in campaign.scenarios())):
+        S = select_scenario(campaign, rw, scenario, label)
+        if S is None:
+            continue
+        section = 'write' if 'write' in rw else 'read'
+        for (clients, bs), results in sorted(campaign.client_index.get((S, rw), {}).items()):
+            merged = histograms.setdefault((rw, bs, clients), PlatHistogram())
+            for R in results:
+                plat = PlatHistogram()
+                for J in R['jobs']:
+                    if 'clat_ns' in J[section]:
+                        plat.add(J[section]['clat_ns']['bins'])
+                row = {'rw': rw, 'bs': bs, 'clients': clients,
+                       'bw': sum(J[section]['bw'] for J in R['jobs']),
+                       'iops': sum(J[section]['iops'] for J in R['jobs'])}
+                latency = plat.percentiles(PERCENTILES) / 1000.0 if plat.total() else [np.nan] * len(PERCENTILES)
+                row.update({ 'clat_p%g' % P: L for P, L in zip(PERCENTILES, latency) })
+                rows.append(row)
+                merged.merge(plat)
+        if (S, rw) in campaign.group_series:
+            frame = campaign.group_series[(S, rw)].to_frame()
+            for row in frame.rename(columns={'io_size': 'bs'})[list(KEYS) + ['bw', 'iops']].to_dict('records'):
+                rows.append(row)
+    columns = list(KEYS) + [ M for M, sign in METRICS ]
+    return pd.DataFrame(rows, columns=columns), histograms
+
+
+def summarise(rows):
+    ''' The mean, standard deviation and number of results of each metric
+        for each (rw, bs, clients), indexed by KEYS and metric '''
+    long = rows.melt(id_vars=list(KEYS), value_vars=[ M for M, sign in METRICS ], var_name='metric')
+    return long.dropna(subset=['value']).groupby(list(KEYS) + ['metric'])['value'].agg(['mean', 'std', 'count'])
+
+
+def compare_summaries(baseline, candidate, threshold=5.0, min_t=2.0):
+    ''' Compare the summaries of two result sets on their common keys.
+        The change in the mean of each metric is given as a percentage of
+        the baseline, and its significance as Welch's t statistic over the
+        client results of each set.  A change is a regression when the
+        metric worsens by more than threshold percent, unless t shows it
+        to be within the run-to-run variation (|t| < min_t).  With a single
+        result in either set there is no estimate of the variation: t is
+        NaN and the change is taken at face value.  Where no result varies
+        (latency percentiles fall on fio's buckets), any change is
+        significant and t is infinite. '''
+
+    joined = baseline.join(candidate, how='inner', lsuffix='_baseline', rsuffix='_candidate')
+    mb, mc = joined['mean_baseline'].values, joined['mean_candidate'].values
+    nb, nc = joined['count_baseline'].values, joined['count_candidate'].values
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (mc - mb) / mb * 100.0
+        se = np.sqrt(joined['std_baseline'].values**2 / nb + joined['std_candidate'].values**2 / nc)
+        t = (mc - mb) / se
+    sign = joined.index.get_level_values('metric').map(dict(METRICS)).values.astype(np.double)
+    regression = (-sign * delta > threshold) & ~(np.abs(t) < min_t)
+    table = joined.index.to_frame(index=False)
+    table['baseline'] = mb
+    table['candidate'] = mc
+    table['delta_pct'] = delta
+    table['t'] = t
+    table['n_baseline'] = nb
+    table['n_candidate'] = nc
+    table['regression'] = regression
+    order = { M: i for i, (M, sign) in enumerate(METRICS) }
+    table = table.sort_values(list(KEYS) + ['metric'], key=lambda C: C.map(order) if C.name == 'metric' else C)
+    return table[list(COMPARE_COLUMNS)].reset_index(drop=True)
+
+
+def latency_mass(plat, grid_Y):
+    ''' The probability mass of a latency histogram (in us) in each row of grid_Y '''
+    hist = plat.histogram()
+    return fiotools.regrid_cdf([fiotools.histogram_cdf(hist.values / 1000.0, hist.counts, float(hist.total()))], grid_Y)
+
+####################################################################################################
+
+class Comparison:
+    ''' A candidate set of fio results compared with a baseline, aligned on
+        (rw, bs, clients).  Each set is a Campaign, of which one scenario per
+        I/O mode is compared: the only one, or that given.
+
+        table holds the comparison of each metric (see compare_summaries),
+        and density_diff() the change in the latency distribution of each
+        I/O size by number of clients, on the grid of ClatGrid. '''
+
+    @profiled('Comparison')
+    def __init__(self, baseline, candidate, baseline_scenario=None, candidate_scenario=None,
+                 threshold=5.0, min_t=2.0):
+        self.threshold = threshold
+        self.min_t = min_t
+        self.baseline_rows, self.baseline_hists = result_rows(baseline, baseline_scenario, 'baseline')
+        self.candidate_rows, self.candidate_hists = result_rows(candidate, candidate_scenario, 'candidate')
+        baseline_summary = summarise(self.baseline_rows)
+        candidate_summary = summarise(self.candidate_rows)
+        self.table = compare_summaries(baseline_summary, candidate_summary, threshold, min_t)
+        self.unmatched = len(set(baseline_summary.index) ^ set(candidate_summary.index))
+        print( "Compared %d metrics of %d configurations: %d regressions beyond %g%%" %
+               (len(self.table), len(self.table.groupby(list(KEYS))), self.table['regression'].sum(), threshold) )
+        if self.unmatched:
+            print( "%d metrics were found in only one of the result sets" % self.unmatched )
+
+    def regressions(self):
+        ''' The rows of the comparison table that are regressions '''
+        return self.table[self.table['regression']]
+
+    def write_table(self, path):
+        self.table.to_csv(str(path), index=False)
+
+    def common_histograms(self):
+        ''' The (rw, bs) with latency histograms in both sets, and the client
+            counts of each with results in both '''
+        common = {}
+        for key in sorted(set(self.baseline_hists) & set(self.candidate_hists)):
+            if self.baseline_hists[key].total() and self.candidate_hists[key].total():
+                common.setdefault(key[:2], []).append(key[2])
+        return common
+
+    def density_diff(self, rw, bs, clients, granularity=200, logscale=True):
+        ''' The change in the distribution of latency for an I/O size, by
+            number of clients: the candidate probability mass in each
+            latency row less that of the baseline, on a grid covering
+            both.  Returns the column and row edges (test clients and us)
+            and the grid, NaN where neither set has any I/Os. '''
+
+        hists = [ (self.baseline_hists[(rw, bs, C)], self.candidate_hists[(rw, bs, C)]) for C in clients ]
+        lo = min(H.histogram().min() for pair in hists for H in pair) / 1000.0
+        hi = max(H.histogram().max() for pair in hists for H in pair) / 1000.0
+        if logscale:
+            grid_Y = np.logspace(np.log10(max(lo, 1e-3)), np.log10(hi), granularity)
+        else:
+            grid_Y = np.linspace(lo, hi, granularity)
+        grid_X = np.linspace(min(clients) - 0.5, max(clients) + 0.5, max(clients) - min(clients) + 2)
+        grid = np.full((granularity - 1, len(grid_X) - 1), np.nan)
+        for C, (B, K) in zip(clients, hists):
+            before, after = latency_mass(B, grid_Y), latency_mass(K, grid_Y)
+            column = after - before
+            column[(before == 0) & (after == 0)] = np.nan
+            grid[:, C - min(clients)] = column
+        return grid_X, grid_Y, grid
+
+    def percentile_lines(self, rw, bs, clients):
+        ''' The pooled latency percentiles (us) of each set by number of clients '''
+        import pandas as pd
+        columns = {}
+        for label, hists in (('baseline', self.baseline_hists), ('candidate', self.candidate_hists)):
+            values = np.array([ hists[(rw, bs, C)].percentiles(PERCENTILES) / 1000.0 for C in clients ])
+            for i, P in enumerate(PERCENTILES):
+                columns['%s p%g' % (label, P)] = values[:, i]
+        return pd.DataFrame(columns, index=pd.Index(clients, name='test_clients'))
+
+    @profiled('Comparison.write_outputs')
+    def write_outputs(self, output_dir, plot=True, output_format='png', granularity=200, logscale=True):
+        ''' Write the comparison table and the latency density difference of
+            each I/O size: as plot specs to render, returned, or without
+            plots as JSON in the form of ClatGrid.write_grid. '''
+
+        output_dir = str(output_dir)
+        self.write_table(os.path.join(output_dir, 'comparison.csv'))
+        specs = []
+        for (rw, bs), clients in iter(self.common_histograms().items()):
+            grid_X, grid_Y, grid = self.density_diff(rw, bs, clients, granularity, logscale)
+            name = os.path.join(output_dir, '%s-commit-latency-diff-by-client-%d' % (rw, bs))
+            if not plot:
+                with open(name + '.json', 'w') as f:
+                    json.dump({'bs': bs, 'rw': rw, 'x': 'test_clients', 'x_edges': grid_X.tolist(),
+                               'y_edges': grid_Y.tolist(), 'timescale': 'us',
+                               'grid': [ [ None if np.isnan(Z) else Z for Z in row ] for row in grid.tolist() ]}, f)
+                continue
+            specs.append(PlotSpec('diffmap', '%s.%s' % (name, output_format), self.percentile_lines(rw, bs, clients),
+                                  title='Change in %s commit latency - %d - candidate vs baseline' % (rw, bs),
+                                  xlabel='Test clients', ylabel='Commit latency - $\\mu s$',
+                                  xticks=clients, ylim=[grid_Y[0], grid_Y[-1]],
+                                  grid_X=grid_X, grid_Y=grid_Y, grid=grid, logy=logscale,
+                                  colorbar_label='Change in probability mass'))
+        return specs
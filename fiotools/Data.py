@@ -1,9 +1,14 @@
 # Copyright 2021 StackHPC Ltd
 # Begun by Stig Telfer, StackHPC Ltd, March 2021
 
-import json
 import os
 
+from fiotools.Discovery import find_results
+from fiotools.Cache import load_fio_files
+from fiotools.Instrument import profiled
+from fiotools.Projection import read_fio_file
+from fiotools.SteadyState import converged, log_steady_state
+
 ####################################################################################################
 
 class Result:
@@ -26,9 +31,14 @@ class Result:
         self.hostname = hostname
         self.rw = fio_data['job options']['rw']
         self.io_size = int(self.fio_data['io_bytes'] / self.fio_data['total_ios'])
+        # Completion latency histogram, only present when loaded with histograms
+        self.clat = self.fio_data['clat_ns']['bins'] if 'clat_ns' in self.fio_data else None
         self.usr_cpu = fio_data['usr_cpu']
         self.sys_cpu = fio_data['sys_cpu']
         self.jobname = fio_data['jobname']
+        # Whether the job reached steady state, if run with a criterion
+        self.steadystate = fio_data.get('steadystate')
+        self.converged = converged(fio_data)
 
 ####################################################################################################
 
@@ -66,13 +76,26 @@ class Sample:
             H.update( (S.hostname,) )
         return H
 
+    def unconverged(self):
+        ''' The results that did not reach steady state '''
+        return [ R for R in self.sample_group if R.converged is False ]
+
+    def converged(self):
+        ''' Whether every result reached steady state: None if any was
+            not judged, by a steady state criterion or from its logs '''
+        if self.unconverged():
+            return False
+        if any(R.converged is None for R in self.sample_group):
+            return None
+        return True
+
 class SampleGroup(Sample):
     ''' A SampleGroup is a Sample that was generated using fio's client-server model
         and group reporting. '''
 
-    def __init__(self, path):
-        with open(path) as f:
-            S = json.load(f)
+    def __init__(self, path, S=None):
+        if S is None:
+            S = read_fio_file(path, histograms=False)
 
         # Validation of input format
         if 'global options' not in S or 'client_stats' not in S:
@@ -88,10 +111,13 @@ class SampleGroup(Sample):
         super(SampleGroup,self).__init__( sample_group )
 
 class SampleDir(Sample):
+    ''' A result of a single client.  With a steady state criterion, a
+        result run without one is judged from its bandwidth or IOPS logs,
+        where logged (see fiotools.SteadyState). '''
 
-    def __init__(self, path, hostname='localhost'):
-        with open(path) as f:
-            S = json.load(f)
+    def __init__(self, path, hostname='localhost', S=None, steadystate=None):
+        if S is None:
+            S = read_fio_file(path, histograms=False)
 
         # Validation of input format
         if 'global options' not in S:
@@ -102,82 +128,200 @@ class SampleDir(Sample):
             raise TypeError("FIO job data includes more than one result")
 
         sample_group = [ Result(S['jobs'][0], hostname) ]
+        for R in sample_group:
+            if steadystate is not None and R.converged is None:
+                try:
+                    R.converged = log_steady_state(path, steadystate, rw=R.rw) is not None
+                except ValueError:
+                    pass
         super(SampleDir,self).__init__( sample_group )
 
 
 ####################################################################################################
 
+def load_result(S, E):
+    ''' Unpack a result from the parse cache, raising any parse error '''
+    if E is not None:
+        raise E
+    return S
+
+####################################################################################################
+
+# Columns of the tidy table of results: bw is in KiB/s and runtime in ms, as reported by fio,
+# and converged is 1.0 if the result reached steady state, 0.0 if not and NaN if not judged,
+# which reads back the same from CSV
+TABLE_COLUMNS = ('hostname', 'jobname', 'clients', 'io_size', 'rw', 'bw', 'iops', 'usr_cpu', 'sys_cpu', 'runtime',
+                 'converged')
+
 class Series:
-    ''' Construct a series of samples for plotting '''
+    ''' Construct a series of samples for plotting.
+        The results of the samples are indexed by each of INDEX_KEYS as
+        they are added, so that they can be queried by any combination of
+        keys in time proportional to the number of matches. '''
+
+    # Keys of the result tuples (hostname, jobname, num clients, io_size, Result)
+    INDEX_KEYS = ('hostname', 'jobname', 'clients', 'io_size')
 
     def __init__(self, samples):
         ''' Given a directory of results, iterate the results to create a collection of samples '''
         # A dict indexed by number of client and returning sample data
-        self.samples = samples
+        self.samples = []
+        self.reset_index()
+        self.add_samples(samples)
+
+    def __copy__(self):
+        ''' A shallow copy of the series, with its own index so that it
+            can be added to or constrained independently '''
+        other = object.__new__(type(self))
+        other.__dict__.update(self.__dict__)
+        other.samples = list(self.samples)
+        other.results = list(self.results)
+        other.index = { K: { V: list(R) for V, R in iter(I.items()) } for K, I in iter(self.index.items()) }
+        return other
+
+    def reset_index(self):
+        self.results = []
+        self.index = { K: {} for K in self.INDEX_KEYS }
+
+    def add_samples(self, samples):
+        ''' Add samples to the series and index their results '''
+        for S in samples:
+            self.samples.append(S)
+            for R in S.extract_results(lambda R: True):
+                self.results.append(R)
+                for K, V in zip(self.INDEX_KEYS, R):
+                    self.index[K].setdefault(V, []).append(R)
 
     def select_samples(self, selector):
-        ''' Constrain a series only to samples that match a given criteria '''
-        self.samples[:] = [S for S in self.samples if selector(S)]
+        ''' Constrain a series only to samples that match a given criteria.
+            The list of samples is replaced rather than modified, so that
+            shallow copies of a series can be constrained independently. '''
+        samples = [S for S in self.samples if selector(S)]
+        self.samples = []
+        self.reset_index()
+        self.add_samples(samples)
+
+    def query(self, hostname=None, jobname=None, clients=None, io_size=None):
+        ''' Results matching all of the given keys, in the order they were
+            added, as a list of tuples of hostname, jobname, num clients,
+            io_size, Result.  Keys left as None match anything. '''
+        keys = [ (K, V) for K, V in zip(self.INDEX_KEYS, (hostname, jobname, clients, io_size)) if V is not None ]
+        if not keys:
+            return list(self.results)
+        # Scan the fewest candidates: those of the most selective key
+        candidates = min((self.index[K].get(V, []) for K, V in keys), key=len)
+        positions = [ self.INDEX_KEYS.index(K) for K, V in keys ]
+        values = tuple(V for K, V in keys)
+        return [ R for R in candidates if tuple(R[i] for i in positions) == values ]
 
     def extract_results(self, selector):
         ''' Extract results in each sample that match the given criteria.
             The selector function is applied against each Result object for match.
-            The data returned is a list of tuples of hostname, jobname, num clients, io_size, Result '''
-        result = []
-        for S in self.samples:
-            result += S.extract_results(selector)
-        return result
+            The data returned is a list of tuples of hostname, jobname, num clients, io_size, Result.
+            Use query() to select by hostname, jobname, client count or I/O size. '''
+        return [ R for R in self.results if selector(R[4]) ]
 
     def hostnames(self):
         ''' Find the set of unique hostnames within the series of samples '''
-        H = set()
-        for S in self.samples:
-            H.update( S.hostnames() )
-        return H
+        return set(self.index['hostname'])
+
+    def jobnames(self):
+        ''' Find the set of unique jobnames within the series of samples '''
+        return set(self.index['jobname'])
+
+    def client_counts(self):
+        ''' Find the set of unique numbers of clients within the series of samples '''
+        return set(self.index['clients'])
 
     def io_sizes(self):
         ''' Find the set of unique IO sizes within the series of samples '''
-        return set(S.io_size for S in self.samples)
+        return set(self.index['io_size'])
+
+    def to_frame(self):
+        ''' The results as a tidy table: a pandas DataFrame with one row
+            per result, in the order added, and the columns TABLE_COLUMNS '''
+        import pandas as pd
+
+        columns = { C: [] for C in TABLE_COLUMNS }
+        for hostname, jobname, clients, io_size, R in self.results:
+            columns['hostname'].append(hostname)
+            columns['jobname'].append(jobname)
+            columns['clients'].append(clients)
+            columns['io_size'].append(io_size)
+            columns['rw'].append(R.rw)
+            columns['bw'].append(R.fio_data['bw'])
+            columns['iops'].append(R.fio_data['iops'])
+            columns['usr_cpu'].append(R.usr_cpu)
+            columns['sys_cpu'].append(R.sys_cpu)
+            columns['runtime'].append(R.fio_data['runtime'])
+            columns['converged'].append(float('nan') if R.converged is None else float(R.converged))
+        return pd.DataFrame(columns, columns=TABLE_COLUMNS)
+
+    def report_unconverged(self):
+        ''' Print the number of results that did not reach steady state, if any '''
+        unconverged = [ R for S in self.samples for R in S.unconverged() ]
+        if unconverged:
+            print( "%d of %d fio results did not reach steady state" % (len(unconverged), len(self.results)) )
+
+    def write_table(self, path):
+        ''' Write the tidy table of results to path: as Parquet if the path
+            ends in .parquet (which needs pyarrow or fastparquet), otherwise
+            as CSV '''
+        frame = self.to_frame()
+        if str(path).endswith('.parquet'):
+            frame.to_parquet(str(path), index=False)
+        else:
+            frame.to_csv(str(path), index=False)
 
 
 
 class SeriesGroup(Series):
     ''' Construct a series of samples for plotting '''
 
-    def __init__(self, input_dir=None):
-        ''' Given a directory of results, iterate the results to create a collection of samples '''
+    @profiled('SeriesGroup')
+    def __init__(self, input_dir=None, cache=True, rebuild_cache=False, jobs=1, include=None, exclude=None):
+        ''' Given a directory of results, iterate the results to create a collection of samples.
+            Result files are found by the include and exclude globs given. '''
         # A dict indexed by number of client and returning sample data
         samples = []
         if input_dir:
             try:
-                for root, dirs, files in os.walk(input_dir):
-                    samples += [ SampleGroup(os.path.join(root, F)) for F in files if not F.startswith('.') ]
+                stats = dict(find_results(input_dir, include, exclude))
+                samples = [ SampleGroup(path, load_result(S, E))
+                            for path, S, E in load_fio_files(list(stats), cache, rebuild_cache, histograms=False, jobs=jobs,
+                                                             stats=stats, complete=True) ]
             except OSError as E:
                 print( "Could not access input path %s" % (input_dir) )
                 raise E
-        
+
             print( "Found %d fio results in %s" % (len(samples), input_dir) )
 
         super(SeriesGroup,self).__init__( samples )
+        self.report_unconverged()
 
 
 class SeriesDir(Series):
     ''' A single directory of results, which may have been executed
         concurrently on a constant number of clients '''
 
-    def __init__(self, input_dir):
+    @profiled('SeriesDir')
+    def __init__(self, input_dir, cache=True, rebuild_cache=False, jobs=1, include=None, exclude=None,
+                 steadystate=None):
         # Recursive explore to find samples and read them in
         # List JSON files in the fio input directory
         samples = []
         hostname = os.path.split(input_dir)[-1]
         try:
             # Directory traversal
-            for root, dirs, files in os.walk(str(input_dir)):
-                samples += [ SampleDir(os.path.join(root, F), hostname) for F in files if not F.startswith('.') ] 
+            stats = dict(find_results(input_dir, include, exclude))
+            samples = [ SampleDir(path, hostname, load_result(S, E), steadystate)
+                        for path, S, E in load_fio_files(list(stats), cache, rebuild_cache, histograms=False, jobs=jobs,
+                                                         stats=stats, complete=True) ]
         except OSError as E:
             print( "Could not access input path %s" % (input_dir) )
             raise E
 
         print( "Found %d fio results in %s" % (len(samples), input_dir) )
         super(SeriesDir,self).__init__( samples )
+        self.report_unconverged()
 
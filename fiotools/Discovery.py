@@ -0,0 +1,196 @@
+# Copyright 2021 StackHPC Ltd
+# Finding fio result files with as few filesystem metadata operations as possible
+
+import fnmatch
+import os
+
+from fiotools.Archive import COMPRESSED, TAR_SUFFIXES, is_result_name, list_archive, split_archive_path
+
+# Result files are selected by name.  Other files in results trees, such as
+# the fio-*.dat stdout of mpi_fio.sh or editor backups, are never opened, and
+# the *.lock barrier directories of run_fio.sh are never listed.
+DEFAULT_INCLUDE = ('*.json',)
+DEFAULT_EXCLUDE = ('*.lock',)
+
+# A manifest lists the result files below the directory holding it, one per
+# line as: size, mtime (integer ns, or seconds with a fractional part as
+# written by GNU find -printf %T@) and path relative to the directory, tab
+# separated.  A directory with a manifest is not walked while the manifest
+# is up to date: no newer than it are the directory itself and every
+# directory between it and the files listed, whose mtimes change as files
+# are added, removed or renamed in them, and every file listed has the size
+# and mtime listed, which change as a file is rewritten in place.
+MANIFEST_NAME = '.fiotools-manifest'
+
+####################################################################################################
+
+def strip_compression(name):
+    ''' A file name without any compression suffix: 4096.json.gz is matched as 4096.json '''
+    base, suffix = os.path.splitext(name)
+    return base if suffix in COMPRESSED or suffix in ('.zst', '.zstd') else name
+
+
+def matches(name, patterns):
+    return any(fnmatch.fnmatchcase(name, P) for P in patterns)
+
+
+class ResultFilter:
+    ''' Include and exclude globs for the names of result files.  A file
+        is a result if its name, less any compression suffix, matches an
+        include glob and neither name matches an exclude glob.  Directories
+        and archives matching an exclude glob are skipped whole.  Include
+        globs given replace the default, and exclude globs add to it. '''
+
+    def __init__(self, include=None, exclude=None):
+        self.include = tuple(include or DEFAULT_INCLUDE)
+        self.exclude = DEFAULT_EXCLUDE + tuple(exclude or ())
+
+    def excluded(self, name):
+        return name.startswith('.') or matches(name, self.exclude) or matches(strip_compression(name), self.exclude)
+
+    def selects(self, name):
+        return is_result_name(name) and not self.excluded(name) and matches(strip_compression(name), self.include)
+
+    def archive_members(self, archive, prefix='.'):
+        return [ P for P in list_archive(archive, prefix) if self.selects(os.path.basename(P)) ]
+
+####################################################################################################
+
+def parse_mtime(field):
+    ''' A manifest mtime in integer nanoseconds '''
+    if '.' not in field:
+        return int(field)
+    seconds, fraction = field.split('.', 1)
+    return int(seconds) * 10**9 + int((fraction + '0' * 9)[:9])
+
+
+def read_manifest(directory, result_filter):
+    ''' The (path, (size, mtime_ns)) of each result listed in the manifest
+        of a directory, or None if the manifest is out of date: older than
+        a directory that a listed file is in, or any between, or listing a
+        file that has since changed or gone.  Members of a listed archive
+        take its size and mtime. '''
+
+    manifest = os.path.join(directory, MANIFEST_NAME)
+    listed = []
+    with open(manifest) as f:
+        manifest_mtime = os.fstat(f.fileno()).st_mtime_ns
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            size, mtime, name = line.rstrip('\n').split('\t', 2)
+            listed.append((name, (int(size), parse_mtime(mtime))))
+
+    # The directories show files added or removed, and the files themselves
+    # any rewritten in place, whose stats are then safe to use as the keys of
+    # the parse cache.  Each is one stat, with no directory listed.
+    directories = set(['.'])
+    for name, stat_key in listed:
+        parent = os.path.dirname(os.path.normpath(name))
+        while parent and parent not in directories:
+            directories.add(parent)
+            parent = os.path.dirname(parent)
+    try:
+        if any(os.stat(os.path.join(directory, D)).st_mtime_ns > manifest_mtime for D in directories):
+            return None
+        for name, stat_key in listed:
+            st = os.stat(os.path.join(directory, name))
+            if (st.st_size, st.st_mtime_ns) != stat_key:
+                return None
+    except OSError:
+        return None
+
+    results = []
+    for name, stat_key in listed:
+        path = os.path.join(directory, name)
+        basename = os.path.basename(name)
+        if name.endswith(TAR_SUFFIXES) and not result_filter.excluded(basename):
+            results += [ (P, stat_key) for P in result_filter.archive_members(path) ]
+        elif result_filter.selects(basename):
+            results.append((path, stat_key))
+    return results
+
+
+def scan_directory(directory, result_filter, manifests=True):
+    ''' Walk a directory tree with os.scandir, which reports the type of each
+        entry without a stat on most filesystems, returning the
+        (path, (size, mtime_ns) or None) of each result in sorted walk
+        order.  Subtrees with an up to date manifest are read from it
+        instead. '''
+
+    results = []
+    pending = [str(directory)]
+    while pending:
+        D = pending.pop()
+        try:
+            with os.scandir(D) as it:
+                entries = sorted(it, key=lambda E: E.name)
+        except OSError:
+            # Directories can vanish mid-walk, such as barrier directories
+            # removed at the end of a sweep
+            if D == str(directory):
+                raise
+            continue
+        if manifests and any(E.name == MANIFEST_NAME for E in entries):
+            listed = read_manifest(D, result_filter)
+            if listed is not None:
+                results += listed
+                continue
+            print( "Manifest in %s is out of date: listing the directory instead" % D )
+        subdirs = []
+        for E in entries:
+            if result_filter.excluded(E.name):
+                continue
+            if E.is_dir():
+                subdirs.append(E.path)
+            elif E.name.endswith(TAR_SUFFIXES):
+                results += [ (P, None) for P in result_filter.archive_members(E.path) ]
+            elif result_filter.selects(E.name):
+                results.append((E.path, None))
+        pending += reversed(subdirs)
+    return results
+
+
+def find_results(input_dir, include=None, exclude=None, manifests=True):
+    ''' Find the result files below a directory, including the members of
+        any tar archives found, returning a list of (path, stat key), where
+        the stat key is the (size, mtime_ns) read from a manifest or None.
+        input_dir may itself be an archive, or a directory within one. '''
+
+    result_filter = ResultFilter(include, exclude)
+    archive, prefix = split_archive_path(input_dir)
+    if archive is None and str(input_dir).endswith(TAR_SUFFIXES) and os.path.isfile(str(input_dir)):
+        archive, prefix = str(input_dir), '.'
+    if archive is not None:
+        return [ (P, None) for P in result_filter.archive_members(archive, prefix) ]
+    return scan_directory(input_dir, result_filter, manifests)
+
+
+def list_result_files(input_dir, include=None, exclude=None, manifests=True):
+    ''' The paths of the result files below a directory (see find_results) '''
+    return [ P for P, stat_key in find_results(input_dir, include, exclude, manifests) ]
+
+
+def write_manifest(directory, include=None, exclude=None):
+    ''' Write the manifest of the results below a directory, as found by a
+        full walk, returning the number of files listed.  Archives are
+        listed as themselves, and expanded when the manifest is read. '''
+
+    directory = str(directory)
+    lines = []
+    for path, stat_key in scan_directory(directory, ResultFilter(include, exclude), manifests=False):
+        archive, member = split_archive_path(path)
+        path = archive or path
+        st = os.stat(path)
+        line = "%d\t%d\t%s\n" % (st.st_size, st.st_mtime_ns, os.path.relpath(path, directory))
+        if not lines or lines[-1] != line:
+            lines.append(line)
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        f.writelines(lines)
+    os.replace(tmp_path, path)
+    # Renaming the manifest into place updates the directory mtime, which
+    # the manifest must not be older than to be read
+    os.utime(path)
+    return len(lines)
@@ -0,0 +1,273 @@
+# Copyright 2021 StackHPC Ltd
+# Running fio in client/server mode over a ladder of client counts and I/O sizes
+
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from fiotools.Archive import ArchiveWriter
+from fiotools.Data import SampleGroup, SeriesGroup
+from fiotools.Instrument import profiled
+from fiotools.Projection import fio_spec, project, project_fio_data
+from fiotools.Schedule import BS_SHAPE_METRICS, CLIENTS_SHAPE_METRICS, next_value, peak_metrics, result_metrics
+
+# The port fio --server listens on by default
+FIO_SERVER_PORT = 8765
+
+# Time allowed to connect to each fio server when checking they are up
+PROBE_TIMEOUT = 5.0
+
+####################################################################################################
+
+def parse_host(host):
+    ''' The (hostname, port) of a fio server given as fio does: host or
+        host,port, optionally prefixed ip: or ip6: '''
+    name, _, port = str(host).partition(',')
+    name = re.sub(r'^ip6?:', '', name)
+    return name, int(port) if port else FIO_SERVER_PORT
+
+
+def read_hosts(path):
+    ''' The fio servers listed in a file, one per line, as for fio --client '''
+    with open(path) as f:
+        return [ L.strip() for L in f if L.strip() and not L.startswith('#') ]
+
+
+def client_ladder(num_hosts):
+    ''' The default client counts: powers of two up to the number of hosts,
+        and all the hosts '''
+    ladder = [ 2**n for n in range(num_hosts.bit_length()) ]
+    return ladder + [num_hosts] if ladder[-1] != num_hosts else ladder
+
+
+def render_jobfile(template, bs, variables, options=()):
+    ''' A fio job file for one I/O size.  ${NAME} references to the given
+        variables, or else to the environment, are expanded here, since fio
+        servers expand them in their own environment.  The I/O size, then
+        any other options given as (name, value), are set as the first
+        options of the global section. '''
+    text = re.sub(r'\$\{(\w+)\}', lambda M: str(variables.get(M.group(1), os.environ.get(M.group(1), M.group(0)))),
+                  template)
+    head = ''.join([ 'bs=%d' % bs ] + [ '\n%s=%s' % (K, V) for K, V in options ])
+    if re.search(r'^\[global\]', text, re.M):
+        return re.sub(r'^\[global\][ \t]*$', lambda M: '[global]\n' + head, text, count=1, flags=re.M)
+    return '[global]\n%s\n\n%s' % (head, text)
+
+
+def parse_output(text):
+    ''' The JSON document in the output of a fio client, which reports each
+        server it connects to before the results '''
+    start = re.search(r'^\{', text, re.M)
+    if start is None:
+        raise ValueError("No JSON result in fio output: %s" % text[:200])
+    return json.JSONDecoder().raw_decode(text, start.start())[0]
+
+####################################################################################################
+
+class Driver:
+    ''' Run fio as a client of fio servers (fio --server) on a list of hosts,
+        for each number of clients and I/O size of a sweep: the first N
+        hosts for N clients, with group reporting.  Each result is parsed
+        from fio's output as it completes and added to series, a
+        SeriesGroup, with no result files written.  The results are kept in
+        a compressed tar archive, in the layout of a group-reporting
+        results directory: <scenario>-<rw>/<run>/<clients>-<bs>.json.  Each
+        is appended to an uncompressed tar as it completes, which is
+        compressed into the archive once at the end of the sweep, however
+        it ends (see fiotools.Archive.ArchiveWriter).  Only the fields of
+        each result that fiotools reads are kept (see fiotools.Projection),
+        and the archive can be read in place by SeriesGroup and
+        fio_group_bw.
+
+        fio itself, as a client, fans each point out to the servers.  The
+        servers used at each client count are first checked to be
+        accepting connections, concurrently, and each result is parsed
+        and archived while fio runs the next point.  fio is a command as a
+        list, so that it can be run through a wrapper, or replaced by
+        fiotools.Synthetic for testing.
+
+        With a tolerance, the sweep is adaptive: each point is chosen from
+        the results so far by fiotools.Schedule.next_value, among the I/O
+        sizes for each number of clients and among the client counts (by
+        default every number up to all the hosts).  Later runs repeat the
+        points chosen in the first.
+
+        options are further fio job options (name, value) for every point,
+        such as those of fiotools.SteadyState.steadystate_options to end
+        each point once it is stable.  Points that did not reach steady
+        state are reported as they are parsed. '''
+
+    def __init__(self, hosts, jobfile, scenario, rw, block_sizes, client_counts=None, runs=1,
+                 archive=None, fio=('fio',), variables=None, timeout=None, probe=True,
+                 tolerance=None, max_points=None, options=()):
+        self.hosts = list(hosts)
+        if not self.hosts:
+            raise ValueError("No fio server hosts given")
+        if tolerance is not None and not client_counts:
+            client_counts = range(1, len(self.hosts) + 1)
+        self.client_counts = sorted(client_counts or client_ladder(len(self.hosts)))
+        if self.client_counts[-1] > len(self.hosts):
+            raise ValueError("Cannot run %d clients on %d hosts" % (self.client_counts[-1], len(self.hosts)))
+        with open(jobfile) as f:
+            self.template = f.read()
+        self.scenario = scenario
+        self.rw = rw
+        self.block_sizes = list(block_sizes)
+        self.runs = runs
+        self.archive = archive
+        self.fio = list(fio)
+        self.variables = dict(variables or {}, FIO_RW=rw)
+        self.timeout = timeout
+        self.probe = probe
+        self.tolerance = tolerance
+        self.max_points = max_points
+        self.options = list(options)
+        self.series = SeriesGroup()
+        self.writer = None
+        self.work_dir = None
+
+    def points(self):
+        ''' The (run, clients, I/O size) of each point, in the order run '''
+        return [ (run, clients, bs) for run in range(self.runs)
+                 for clients in self.client_counts for bs in self.block_sizes ]
+
+    def block_size_points(self, clients):
+        ''' The measurements of each I/O size run on a number of clients
+            (see fiotools.Schedule.result_metrics) '''
+        sizes = {}
+        for hostname, jobname, C, bs, R in self.series.query(clients=clients):
+            sizes.setdefault(bs, []).append(R)
+        return { bs: result_metrics(results) for bs, results in iter(sizes.items()) }
+
+    def next_point(self, done):
+        ''' The next (run, clients, I/O size) to run after the points done,
+            or None once the sweep is complete '''
+        if self.tolerance is None:
+            remaining = self.points()[len(done):]
+            return remaining[0] if remaining else None
+
+        first = [ (C, bs) for run, C, bs in done if run == 0 ]
+        if len(first) < len(done):
+            # Repeat the points of the first run
+            n = len(done) - len(first)
+            run = 1 + n // len(first)
+            return (run,) + first[n % len(first)] if run < self.runs else None
+        if first:
+            clients = first[-1][0]
+            bs = next_value(self.block_sizes, self.block_size_points(clients), self.tolerance, self.max_points,
+                            shape_metrics=BS_SHAPE_METRICS)
+            if bs is not None:
+                return (0, clients, bs)
+        counts = { C: peak_metrics(list(self.block_size_points(C).values())) for C in set(C for C, bs in first) }
+        clients = next_value(self.client_counts, counts, self.tolerance, self.max_points,
+                             plateau_metrics=('bw', 'iops'), shape_metrics=CLIENTS_SHAPE_METRICS)
+        if clients is None:
+            return (1,) + first[0] if self.runs > 1 else None
+        return (0, clients, next_value(self.block_sizes, {}, self.tolerance))
+
+    def member_name(self, run, clients, bs):
+        return '%s-%s/%d/%d-%d.json' % (self.scenario, self.rw, run, clients, bs)
+
+    async def check_servers(self, hosts):
+        ''' Raise OSError naming any of the fio servers not accepting connections '''
+        async def connect(host):
+            try:
+                name, port = parse_host(host)
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(name, port), PROBE_TIMEOUT)
+                writer.close()
+                return None
+            except (OSError, asyncio.TimeoutError) as E:
+                return "%s (%s)" % (host, str(E) or 'timed out')
+        failed = [ F for F in await asyncio.gather(*[ connect(H) for H in hosts ]) if F ]
+        if failed:
+            raise OSError("fio servers not reachable: %s" % ', '.join(failed))
+
+    async def run_fio(self, clients, bs):
+        ''' Run fio for one point, returning its output '''
+        hostfile = os.path.join(self.work_dir, 'hosts-%d' % clients)
+        if not os.path.exists(hostfile):
+            with open(hostfile, 'w') as f:
+                f.writelines('%s\n' % H for H in self.hosts[:clients])
+        jobfile = os.path.join(self.work_dir, 'job-%d.fio' % bs)
+        if not os.path.exists(jobfile):
+            with open(jobfile, 'w') as f:
+                f.write(render_jobfile(self.template, bs, self.variables, self.options))
+
+        process = await asyncio.create_subprocess_exec(
+            *(self.fio + ['--output-format=json+', '--client=%s' % hostfile, jobfile]),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise RuntimeError("fio timed out after %g s on %d clients at I/O size %d" % (self.timeout, clients, bs))
+        if process.returncode != 0:
+            raise RuntimeError("fio exited with status %d on %d clients at I/O size %d: %s" %
+                               (process.returncode, clients, bs, stderr.decode('utf-8', 'replace').strip()))
+        return stdout.decode('utf-8')
+
+    def ingest(self, run, clients, bs, output):
+        ''' Parse the output of one point into the series and the archive '''
+        name = self.member_name(run, clients, bs)
+        document = project(parse_output(output), fio_spec(histograms=True))
+        # With the latency percentiles, which adaptive sweeps measure
+        sample = SampleGroup(name, project_fio_data(document, histograms=True))
+        if sample.clients != clients:
+            print( "Expected results from %d clients at I/O size %d, found %d" % (clients, bs, sample.clients) )
+        self.series.add_samples([sample])
+        if self.writer is not None:
+            self.writer.add(name, json.dumps(document, separators=(',', ':')).encode('utf-8'))
+        print( "%s: %d clients, I/O size %d: %.0f KiB/s" %
+               (self.rw, clients, bs, sum(R[4].fio_data['bw'] for R in sample.extract_results(lambda R: True))) )
+        if sample.unconverged():
+            print( "%s: %d clients, I/O size %d: %d of %d clients did not reach steady state" %
+                   (self.rw, clients, bs, len(sample.unconverged()), sample.clients) )
+
+    async def sweep(self):
+        loop = asyncio.get_event_loop()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            pending = None
+            checked = set()
+            done = []
+            while True:
+                if self.tolerance is not None and pending is not None:
+                    # The next point depends on the last
+                    await pending
+                    pending = None
+                point = self.next_point(done)
+                if point is None:
+                    break
+                run, clients, bs = point
+                if self.probe and clients not in checked:
+                    await self.check_servers(self.hosts[:clients])
+                    checked.add(clients)
+                output = await self.run_fio(clients, bs)
+                if pending is not None:
+                    await pending
+                pending = loop.run_in_executor(executor, self.ingest, run, clients, bs, output)
+                done.append(point)
+            if pending is not None:
+                await pending
+
+    @profiled('Driver.run')
+    def run(self):
+        ''' Run every point of the sweep, returning the series of results '''
+        self.work_dir = tempfile.mkdtemp(prefix='fiotools-driver-')
+        if self.archive:
+            self.writer = ArchiveWriter(self.archive)
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(self.sweep())
+        finally:
+            loop.close()
+            shutil.rmtree(self.work_dir)
+            # The points completed are archived however the sweep ended
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        return self.series
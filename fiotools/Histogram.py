@@ -0,0 +1,163 @@
+# Copyright 2021 StackHPC Ltd
+# Compact latency histograms
+
+import numpy as np
+
+
+class LatencyHistogram:
+    ''' A latency histogram held as a pair of arrays: the sorted bin values
+        (latency in ns, as reported by fio's json+ clat_ns bins) and the
+        number of samples in each bin. '''
+
+    __slots__ = ('values', 'counts')
+
+    def __init__(self, values, counts):
+        values = np.asarray(values, dtype=np.int64)
+        counts = np.asarray(counts, dtype=np.int64)
+        if values.shape != counts.shape:
+            raise ValueError("Histogram bin values and counts differ in length")
+        if len(values) > 1 and np.any(values[1:] < values[:-1]):
+            order = np.argsort(values, kind='stable')
+            values, counts = values[order], counts[order]
+        self.values = values
+        self.counts = counts
+
+    @classmethod
+    def from_bins(cls, bins):
+        ''' Construct from a fio clat_ns bins dict of { latency: count } '''
+        values = np.fromiter((int(y) for y in bins.keys()), dtype=np.int64, count=len(bins))
+        counts = np.fromiter(bins.values(), dtype=np.int64, count=len(bins))
+        return cls(values, counts)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __eq__(self, other):
+        if not isinstance(other, LatencyHistogram):
+            return NotImplemented
+        return np.array_equal(self.values, other.values) and np.array_equal(self.counts, other.counts)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "LatencyHistogram(%d bins, %d samples)" % (len(self), self.total())
+
+    def __getstate__(self):
+        return self.values, self.counts
+
+    def __setstate__(self, state):
+        self.values, self.counts = state
+
+    def total(self):
+        ''' Total number of samples '''
+        return int(self.counts.sum())
+
+    def min(self):
+        ''' Lowest populated latency bin '''
+        if not len(self):
+            raise ValueError("Empty latency histogram has no minimum")
+        return int(self.values[0])
+
+    def max(self):
+        ''' Highest populated latency bin '''
+        if not len(self):
+            raise ValueError("Empty latency histogram has no maximum")
+        return int(self.values[-1])
+
+    def normalise(self, total=None):
+        ''' Fraction of samples in each bin, relative to total if given '''
+        if total is None:
+            total = self.total()
+        return self.counts / float(total)
+
+    def density(self, total=None, divider=1):
+        ''' Frequency density of each bin, taking each bin as extending down
+            to the previous bin value (or zero), with latency scaled by divider '''
+        widths = np.diff(np.concatenate(([0], self.values))) / float(divider)
+        return self.normalise(total) / widths
+
+
+####################################################################################################
+# fio's log-linear latency bucket scheme (FIO_IO_U_PLAT_* in fio's stat.h)
+
+FIO_IO_U_PLAT_BITS = 6
+FIO_IO_U_PLAT_VAL = 1 << FIO_IO_U_PLAT_BITS
+FIO_IO_U_PLAT_GROUP_NR = 29
+FIO_IO_U_PLAT_NR = FIO_IO_U_PLAT_GROUP_NR * FIO_IO_U_PLAT_VAL
+
+
+def plat_val_to_idx(values):
+    ''' Map latency values to fio's bucket indices, as fio's plat_val_to_idx '''
+    values = np.asarray(values, dtype=np.int64)
+    msb = np.where(values > 0, np.frexp(values.astype(np.double))[1] - 1, 0)
+    error_bits = np.maximum(msb - FIO_IO_U_PLAT_BITS, 0)
+    base = (error_bits + 1) << FIO_IO_U_PLAT_BITS
+    offset = (FIO_IO_U_PLAT_VAL - 1) & (values >> error_bits)
+    idx = np.minimum(base + offset, FIO_IO_U_PLAT_NR - 1)
+    return np.where(msb <= FIO_IO_U_PLAT_BITS, values, idx)
+
+
+def plat_idx_to_val(idx):
+    ''' Map fio bucket indices to the latency value fio reports for them,
+        the middle of the bucket, as fio's plat_idx_to_val '''
+    idx = np.asarray(idx, dtype=np.int64)
+    error_bits = np.maximum((idx >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    base = np.left_shift(1, error_bits + FIO_IO_U_PLAT_BITS)
+    k = idx % FIO_IO_U_PLAT_VAL
+    values = (base + (k + 0.5) * np.left_shift(1, error_bits)).astype(np.int64)
+    return np.where(idx < (FIO_IO_U_PLAT_VAL << 1), idx, values)
+
+
+def plat_idx_lower(idx):
+    ''' The lowest latency value falling in each of fio's buckets '''
+    idx = np.asarray(idx, dtype=np.int64)
+    error_bits = np.maximum((idx >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    base = np.left_shift(1, error_bits + FIO_IO_U_PLAT_BITS)
+    lower = base + (idx % FIO_IO_U_PLAT_VAL) * np.left_shift(1, error_bits)
+    return np.where(idx < (FIO_IO_U_PLAT_VAL << 1), idx, lower)
+
+
+class PlatHistogram:
+    ''' Latency samples accumulated on fio's fixed bucket scheme.
+        Histograms from any number of clients, jobs and runs merge exactly
+        by adding into one fixed-length array of bucket counts. '''
+
+    __slots__ = ('counts',)
+
+    def __init__(self, counts=None):
+        if counts is None:
+            counts = np.zeros(FIO_IO_U_PLAT_NR, dtype=np.int64)
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    def __getstate__(self):
+        return self.counts
+
+    def __setstate__(self, state):
+        self.counts = state
+
+    def add(self, hist):
+        ''' Accumulate a LatencyHistogram of fio json+ bins '''
+        np.add.at(self.counts, plat_val_to_idx(hist.values), hist.counts)
+        return self
+
+    def merge(self, other):
+        ''' Accumulate another PlatHistogram '''
+        self.counts += other.counts
+        return self
+
+    def total(self):
+        return int(self.counts.sum())
+
+    def histogram(self):
+        ''' The populated buckets as a LatencyHistogram, as fio would report them '''
+        idx = np.flatnonzero(self.counts)
+        return LatencyHistogram(plat_idx_to_val(idx), self.counts[idx])
+
+    def percentiles(self, percentiles):
+        ''' Latency (ns) at each of the given percentiles, following fio's
+            calc_clat_percentiles: the value of the first bucket at which
+            the cumulative count reaches the percentile. '''
+        cumulative = np.cumsum(self.counts)
+        thresholds = np.asarray(percentiles, dtype=np.double) / 100.0 * cumulative[-1]
+        idx = np.minimum(np.searchsorted(cumulative, thresholds, side='left'), FIO_IO_U_PLAT_NR - 1)
+        return plat_idx_to_val(idx)
@@ -0,0 +1,164 @@
+# Copyright 2021 StackHPC Ltd
+# Per-stage timing and memory instrumentation
+
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# The active Profiler, or None when instrumentation is disabled
+profiler = None
+
+
+class StageRecord:
+    ''' Accumulated measurements for one named stage '''
+
+    __slots__ = ('depth', 'calls', 'wall', 'cpu', 'files', 'nbytes', 'peak')
+
+    def __init__(self, depth=0):
+        self.depth = depth          # Nesting depth when first entered
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.files = 0
+        self.nbytes = 0
+        self.peak = 0
+
+    def as_dict(self):
+        return { K: getattr(self, K) for K in self.__slots__ }
+
+
+class Frame:
+    ''' A stage in progress '''
+
+    __slots__ = ('record', 'wall', 'cpu', 'current', 'peak')
+
+    def __init__(self, record, current):
+        self.record = record
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        self.current = current      # Traced memory at the start of the stage
+        self.peak = current         # Highest traced memory seen in nested stages
+
+
+class Profiler:
+    ''' Records wall time, CPU time, file and byte counts and (optionally)
+        peak traced memory for each named stage.  Stages may nest, and are
+        measured inclusive of their nested stages.  Memory is traced with
+        tracemalloc in this process only, not in worker processes. '''
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.records = {}
+        self.order = []
+        self.stack = []
+        self.tracing = memory and not tracemalloc.is_tracing()
+        if self.tracing:
+            tracemalloc.start()
+
+    def stop(self):
+        if self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def enter(self, name):
+        if name not in self.records:
+            self.records[name] = StageRecord(len(self.stack))
+            self.order.append(name)
+        current = 0
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        self.stack.append(Frame(self.records[name], current))
+
+    def exit(self):
+        frame = self.stack.pop()
+        record = frame.record
+        record.calls += 1
+        record.wall += time.perf_counter() - frame.wall
+        record.cpu += time.process_time() - frame.cpu
+        if self.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame.peak)
+            record.peak = max(record.peak, peak - frame.current)
+            if self.stack:
+                self.stack[-1].peak = max(self.stack[-1].peak, peak)
+
+    def count(self, files=0, nbytes=0):
+        ''' Add file and byte counts to the innermost stage '''
+        if self.stack:
+            self.stack[-1].record.files += files
+            self.stack[-1].record.nbytes += nbytes
+
+    def as_dict(self):
+        return { name: self.records[name].as_dict() for name in self.order }
+
+    def report(self, stream=None):
+        ''' Print a summary table of the stages, in order of first use '''
+        stream = stream or sys.stdout
+        stream.write("%-32s %8s %10s %10s %8s %10s %10s\n" %
+                     ('Stage', 'Calls', 'Wall (s)', 'CPU (s)', 'Files', 'Read (MB)', 'Peak (MB)'))
+        for name in self.order:
+            R = self.records[name]
+            stream.write("%-32s %8d %10.3f %10.3f %8d %10.1f %10s\n" %
+                         ('  ' * R.depth + name, R.calls, R.wall, R.cpu, R.files, R.nbytes / 1.0e6,
+                          '%.1f' % (R.peak / 1.0e6) if self.memory else '-'))
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def enable(memory=True):
+    ''' Start recording stages, returning the Profiler '''
+    global profiler
+    profiler = Profiler(memory)
+    return profiler
+
+
+def disable():
+    ''' Stop recording stages, returning the Profiler with its records '''
+    global profiler
+    P, profiler = profiler, None
+    if P is not None:
+        P.stop()
+    return P
+
+
+def profiled(name):
+    ''' Decorator recording each call of a function as the named stage.
+        When instrumentation is disabled the only cost is one test of the
+        profiler global per call. '''
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            P = profiler
+            if P is None:
+                return fn(*args, **kwargs)
+            P.enter(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                P.exit()
+        return wrapper
+    return decorate
+
+
+def count(files=0, nbytes=0, paths=None):
+    ''' Count files and bytes read in the current stage.  Given paths, the
+        files are counted and their sizes looked up, only when enabled. '''
+    P = profiler
+    if P is None:
+        return
+    if paths is not None:
+        files += len(paths)
+        for path in paths:
+            try:
+                nbytes += os.path.getsize(path)
+            except OSError:
+                pass
+    P.count(files, nbytes)
@@ -0,0 +1,228 @@
+# Copyright 2021 StackHPC Ltd
+# fio bandwidth, latency and IOPS logs (write_bw_log, write_lat_log, write_iops_log)
+
+import glob
+import mmap
+import os
+import re
+
+import numpy as np
+
+from fiotools.Instrument import count, profiled
+
+# Each line of a fio log is: time (ms), value, data direction, block size,
+# then optionally the offset (log_offset=1) and the I/O priority (fio >= 3.23).
+LOG_COLUMNS = ('time', 'value', 'ddir', 'bs', 'offset', 'prio')
+
+# Log kinds, as suffixed to the log file prefix by fio
+LOG_KINDS = ('bw', 'iops', 'lat', 'clat', 'slat')
+
+# Logs are parsed this many bytes at a time
+CHUNK_BYTES = 64 * 1024 * 1024
+
+DDIR_READ = 0
+DDIR_WRITE = 1
+DDIR_TRIM = 2
+
+####################################################################################################
+
+class FioLog:
+    ''' The entries of a fio log as columns of NumPy arrays: time (ms),
+        value, data direction, block size, and offset and priority where
+        logged.  Values are KiB/s for bandwidth logs, I/Os per second for
+        IOPS logs and ns for latency logs (as fio 3.x writes them). '''
+
+    def __init__(self, columns):
+        self.columns = columns
+        for C in LOG_COLUMNS:
+            setattr(self, C, columns.get(C))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __repr__(self):
+        return "FioLog(%d entries)" % len(self)
+
+    def select(self, mask):
+        ''' The entries selected by a boolean mask or index array '''
+        return FioLog({ C: V[mask] for C, V in iter(self.columns.items()) })
+
+    def direction(self, ddir):
+        ''' The entries for one data direction (DDIR_READ, DDIR_WRITE or DDIR_TRIM) '''
+        return self.select(self.ddir == ddir)
+
+
+def parse_log_text(text, ncols):
+    ''' Parse complete lines of log text into a 2D array of ncols columns.
+        Newlines are turned into separators so that NumPy parses the
+        whole block at once, without any Python per-line work. '''
+    text = text.replace(b'\r', b'').replace(b'\n', b',').rstrip(b', ')
+    if not text:
+        return np.empty((0, ncols))
+    values = np.fromstring(text.decode('ascii'), dtype=np.double, sep=',')
+    if len(values) % ncols:
+        raise ValueError("fio log has lines of differing lengths: expected %d columns" % ncols)
+    return values.reshape(-1, ncols)
+
+
+@profiled('read_fio_log')
+def read_fio_log(path, chunk_bytes=CHUNK_BYTES):
+    ''' Read a fio log file into a FioLog.  The file is memory-mapped and
+        parsed in chunks of whole lines, so memory use beyond the
+        resulting arrays is bounded by the chunk size. '''
+
+    size = os.path.getsize(path)
+    count(files=1, nbytes=size)
+    if size == 0:
+        return FioLog({ C: np.empty(0, dtype=np.int64) for C in LOG_COLUMNS[:4] })
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        newline = mm.find(b'\n')
+        ncols = len(mm[:newline if newline >= 0 else size].split(b','))
+        if not 4 <= ncols <= len(LOG_COLUMNS):
+            raise ValueError("%s is not a fio log: found %d columns" % (path, ncols))
+        chunks = []
+        start = 0
+        while start < size:
+            end = min(start + chunk_bytes, size)
+            if end < size:
+                # Parse whole lines only, leaving the rest for the next chunk
+                newline = mm.rfind(b'\n', start, end)
+                if newline >= start:
+                    end = newline + 1
+                else:
+                    end = mm.find(b'\n', end)
+                    end = size if end < 0 else end + 1
+            chunks.append(parse_log_text(mm[start:end], ncols))
+            start = end
+    values = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+    return FioLog({ C: values[:, i].astype(np.int64) for i, C in enumerate(LOG_COLUMNS[:ncols]) })
+
+
+def find_logs(result_path, kind):
+    ''' The log files of the given kind written alongside a fio result
+        file: for <dir>/<bs>.json run with --write_<kind>_log=<dir>/<bs>,
+        fio writes <dir>/<bs>_<kind>.log, or <dir>/<bs>_<kind>.<job>.log
+        for each job. '''
+
+    if kind not in LOG_KINDS:
+        raise ValueError("Unknown fio log kind %s: expected one of %s" % (kind, ', '.join(LOG_KINDS)))
+    prefix = os.path.splitext(str(result_path))[0]
+    job_log = re.compile(re.escape(os.path.basename(prefix)) + r'_' + kind + r'(\.(\d+))?\.log$')
+    paths = [ P for P in glob.glob(glob.escape(prefix) + '_' + kind + '*.log') if job_log.match(os.path.basename(P)) ]
+    return sorted(paths, key=lambda P: int(job_log.match(os.path.basename(P)).group(2) or 0))
+
+####################################################################################################
+# Downsampling and alignment
+
+class Downsampled:
+    ''' A log reduced to time buckets: the start time (ms) of each bucket,
+        and the minimum, mean and maximum of the values logged in it and
+        their number.  Buckets with no entries have a count of zero and
+        NaN statistics. '''
+
+    __slots__ = ('time', 'min', 'mean', 'max', 'count')
+
+    def __init__(self, time, min, mean, max, count):
+        self.time = time
+        self.min = min
+        self.mean = mean
+        self.max = max
+        self.count = count
+
+    def __len__(self):
+        return len(self.time)
+
+
+def downsample(log, bucket_ms, start_ms=0, nbuckets=None):
+    ''' Reduce a FioLog to the min, mean and max of each bucket_ms
+        interval, from start_ms.  Entries before start_ms, or beyond
+        nbuckets buckets when given, are left out. '''
+
+    bucket = (log.time - start_ms) // bucket_ms
+    if nbuckets is None:
+        nbuckets = int(bucket.max()) + 1 if len(bucket) else 0
+    keep = (bucket >= 0) & (bucket < nbuckets)
+    bucket, values = bucket[keep], log.value[keep].astype(np.double)
+
+    n = np.bincount(bucket, minlength=nbuckets)
+    total = np.bincount(bucket, weights=values, minlength=nbuckets)
+    lo = np.full(nbuckets, np.inf)
+    hi = np.full(nbuckets, -np.inf)
+    np.minimum.at(lo, bucket, values)
+    np.maximum.at(hi, bucket, values)
+    empty = n == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / n
+    lo[empty] = hi[empty] = mean[empty] = np.nan
+    return Downsampled(start_ms + np.arange(nbuckets, dtype=np.int64) * bucket_ms, lo, mean, hi, n)
+
+
+def merge_logs(logs):
+    ''' Merge logs (such as those of each job of one client) into one,
+        ordered by time '''
+    columns = set.intersection(*[ set(L.columns) for L in logs ])
+    merged = { C: np.concatenate([ L.columns[C] for L in logs ]) for C in columns }
+    order = np.argsort(merged['time'], kind='stable')
+    return FioLog({ C: V[order] for C, V in iter(merged.items()) })
+
+
+def common_buckets(logs, bucket_ms):
+    ''' The start (ms) and number of bucket_ms buckets spanning all of the logs '''
+    populated = [ L for L in logs if len(L) ]
+    if not populated:
+        return 0, 0
+    start_ms = min(int(L.time.min()) for L in populated) // bucket_ms * bucket_ms
+    return start_ms, (max(int(L.time.max()) for L in populated) - start_ms) // bucket_ms + 1
+
+
+def sum_downsampled(parts):
+    ''' Combine the Downsampled logs of concurrent jobs, on the same
+        buckets, into their total: the sum of the job means.  The minimum
+        and maximum are the sums of the job extremes, and so bound the
+        extremes of the total rather than being exact. '''
+    if len(parts) == 1:
+        return parts[0]
+    populated = np.any([ P.count > 0 for P in parts ], axis=0)
+    total = {}
+    for F in ('min', 'mean', 'max'):
+        total[F] = np.nansum([ getattr(P, F) for P in parts ], axis=0)
+        total[F][~populated] = np.nan
+    return Downsampled(parts[0].time, total['min'], total['mean'], total['max'],
+                       np.sum([ P.count for P in parts ], axis=0))
+
+
+def align_logs(logs, bucket_ms, offsets_ms=None):
+    ''' Align logs on a common time base of bucket_ms buckets.  fio log
+        times are relative to the start of each job, and the clients of a
+        Sample start together, so by default the logs are aligned on their
+        start; offsets_ms, if given, is the start time of each log relative
+        to the others.  Each entry of logs is the FioLog of one client, or
+        a list of FioLogs of concurrent jobs to be totalled (for bandwidth
+        and IOPS).  Returns the bucket start times and a Downsampled per
+        entry, all of the same length. '''
+
+    logs = [ L if isinstance(L, list) else [L] for L in logs ]
+    if offsets_ms is not None:
+        logs = [ [ FioLog(dict(J.columns, time=J.time + int(offset))) for J in L ]
+                 for L, offset in zip(logs, offsets_ms) ]
+    start_ms, nbuckets = common_buckets([ J for L in logs for J in L ], bucket_ms)
+    reduced = [ sum_downsampled([ downsample(J, bucket_ms, start_ms, nbuckets) for J in L ]) for L in logs ]
+    return start_ms + np.arange(nbuckets, dtype=np.int64) * bucket_ms, reduced
+
+
+def sample_logs(result_paths, kind, bucket_ms=1000, ddir=None):
+    ''' Read and align the logs of the given kind for the result files of
+        each client of a Sample, optionally for one data direction.  The
+        bandwidth or IOPS of each client is the total over its jobs, and
+        its latency is over the I/Os of all its jobs.  Returns the bucket
+        start times and a Downsampled per client, in the order given. '''
+
+    logs = []
+    for path in result_paths:
+        job_logs = [ read_fio_log(P) for P in find_logs(path, kind) ]
+        if not job_logs:
+            raise ValueError("No fio %s logs found for %s" % (kind, path))
+        if ddir is not None:
+            job_logs = [ L.direction(ddir) for L in job_logs ]
+        logs.append(job_logs if kind in ('bw', 'iops') else merge_logs(job_logs))
+    return align_logs(logs, bucket_ms)
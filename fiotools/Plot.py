@@ -3,55 +3,280 @@
 
 import copy
 import math
-import pandas as pd
+import time
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt 
+from fiotools import Instrument
+from fiotools.Instrument import profiled
+
+
+def pyplot():
+    ''' matplotlib's pyplot, loaded on first use with the Agg backend.
+        matplotlib takes longer to import than the rest of fiotools, so
+        it is left unloaded until a figure is drawn. '''
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    return plt
+
+####################################################################################################
+# Rendering stage: figures are described by fully computed plot specs,
+# which can be rendered in any process.
+
+class PlotSpec:
+    ''' A fully computed figure: the data to draw and its labelling.
+        A spec holds no matplotlib state, so it can be pickled and
+        rendered in a worker process.
+
+        kind is one of:
+          'stacked' - a stacked line per row of data against its columns
+          'boxplot' - a box per column of data
+          'heatmap' - a colour map of grid on (grid_X, grid_Y), with a line
+                      per column of data drawn over it
+          'timeseries' - downsampled fio logs against time (see draw_timeseries)
+          'diffmap' - a diverging colour map of signed differences in grid on
+                      (grid_X, grid_Y), with a line per column of data
+
+        The output format follows the extension of outfile (png, svg or
+        pdf).  Heatmaps are drawn as a single rasterized layer (see
+        draw_heatmap), so vector output stays small. '''
+
+    def __init__(self, kind, outfile, data, title='', xlabel='', ylabel='',
+                 xticks=None, xlim=None, ylim=None, figsize=(10, 8), **options):
+        if kind not in RENDERERS:
+            raise ValueError("Unknown plot kind %s" % kind)
+        self.kind = kind
+        self.outfile = str(outfile)
+        self.data = data
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.xticks = xticks
+        self.xlim = xlim
+        self.ylim = ylim
+        self.figsize = figsize
+        self.options = options
+
+
+def draw_stacked(spec, ax):
+    plt = pyplot()
+    colours = spec.options.get('colours', len(spec.data))
+    ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, colours)])
+    spec.data.T.plot(ax=ax, stacked=True, legend=False, grid=True, ylim=spec.ylim, linewidth=1)
+
+
+def draw_boxplot(spec, ax):
+    spec.data.boxplot(ax=ax)
+
+
+def draw_timeseries(spec, ax):
+    ''' A line of the mean of each downsampled log in data, a list of
+        (label, fiotools.Log.Downsampled), over a band from its minimum to
+        its maximum, against time in seconds.  Values are multiplied by
+        the scale option. '''
+    plt = pyplot()
+    scale = spec.options.get('scale', 1.0)
+    ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, max(len(spec.data), 1))])
+    for label, D in spec.data:
+        line, = ax.plot(D.time / 1000.0, D.mean * scale, linewidth=1, label=label)
+        ax.fill_between(D.time / 1000.0, D.min * scale, D.max * scale, color=line.get_color(), alpha=0.2, linewidth=0)
+    if spec.xlim is not None:
+        ax.set_xlim(spec.xlim)
+    if spec.ylim is not None:
+        ax.set_ylim(spec.ylim)
+    ax.grid(True)
+    if len(spec.data) <= 16:
+        ax.legend(title=spec.options.get('legend_title'))
+
+
+OUTPUT_FORMATS = ('png', 'svg', 'pdf')
+
+HEATMAP_MODES = ('auto', 'image', 'mesh', 'pcolor')
+
+
+def grid_spacing(edges):
+    ''' Classify grid cell edges as 'linear' or 'log' spaced, or None '''
+    edges = np.asarray(edges, dtype=np.double)
+    if len(edges) < 2:
+        return None
+    if np.allclose(np.diff(edges), edges[1] - edges[0]):
+        return 'linear'
+    if edges[0] > 0:
+        log_edges = np.log10(edges)
+        if np.allclose(np.diff(log_edges), log_edges[1] - log_edges[0]):
+            return 'log'
+    return None
+
+
+def heatmap_rgba(grid, cmap):
+    ''' Pre-bin a normalised grid to an RGBA image, empty (NaN) cells transparent '''
+    plt = pyplot()
+    return plt.get_cmap(cmap)(np.ma.masked_invalid(grid), bytes=True)
+
+
+def draw_heatmap_image(ax, grid_X, grid_Y, grid, cmap, spacing):
+    ''' Draw the grid as one image.  A log-spaced grid is regular in
+        log10(Y), so the image is placed in those coordinates and mapped
+        back to data coordinates, whatever the scale of the axis. '''
+
+    from matplotlib import scale, transforms
+    if spacing == 'log':
+        transform = transforms.blended_transform_factory(
+            transforms.IdentityTransform(), scale.InvertedLogTransform(10)) + ax.transData
+        extent = [grid_X[0], grid_X[-1], np.log10(grid_Y[0]), np.log10(grid_Y[-1])]
+    else:
+        transform = ax.transData
+        extent = [grid_X[0], grid_X[-1], grid_Y[0], grid_Y[-1]]
+    # The image extent is not in data coordinates, so must not autoscale the axes
+    autoscale = ax.get_autoscale_on()
+    ax.set_autoscale_on(False)
+    ax.imshow(heatmap_rgba(grid, cmap), extent=extent, transform=transform,
+              origin='lower', aspect='auto', interpolation='nearest')
+    ax.set_autoscale_on(autoscale)
+
+
+def draw_heatmap(spec, ax):
+    ''' Draw the heatmap layer according to the heatmap option:
+          'image'  - a pre-binned RGBA image, for grids with linear or log
+                     spaced rows and linear columns
+          'mesh'   - a rasterized pcolormesh, for any rectilinear grid
+          'pcolor' - one polygon per cell (slow, for reference)
+          'auto'   - image where the grid allows, otherwise mesh '''
+
+    O = spec.options
+    grid_X, grid_Y, grid = O['grid_X'], O['grid_Y'], O['grid']
+    cmap = O.get('cmap', 'gist_heat')
+    mode = O.get('heatmap', 'auto')
+    if mode not in HEATMAP_MODES:
+        raise ValueError("Unknown heatmap mode %s" % mode)
+    spacing = grid_spacing(grid_Y)
+    if mode in ('auto', 'image') and spacing and grid_spacing(grid_X) == 'linear':
+        ax.set_xlim(grid_X[0], grid_X[-1])
+        ax.set_ylim(grid_Y[0], grid_Y[-1])
+        draw_heatmap_image(ax, grid_X, grid_Y, grid, cmap, spacing)
+    elif mode == 'pcolor':
+        ax.pcolor(grid_X, grid_Y, grid, cmap=cmap, vmin=0.0, vmax=1.0)
+    else:
+        ax.pcolormesh(grid_X, grid_Y, grid, cmap=cmap, vmin=0.0, vmax=1.0, rasterized=True)
+    spec.data.plot(ax=ax, xlim=spec.xlim, ylim=spec.ylim, linewidth=1, style='-', logy=O.get('logy', False))
+    ax.legend(title=O.get('legend_title'))
+
+
+def draw_diffmap(spec, ax):
+    ''' Draw a grid of signed differences, such as the change in latency
+        density between two result sets, on a diverging colour map centred
+        on zero, with a line per column of data drawn over it '''
+
+    O = spec.options
+    grid = np.ma.masked_invalid(O['grid'])
+    limit = float(np.abs(grid).max()) if grid.count() else 1.0
+    mesh = ax.pcolormesh(O['grid_X'], O['grid_Y'], grid, cmap=O.get('cmap', 'RdBu_r'),
+                         vmin=-limit, vmax=limit, rasterized=True)
+    ax.figure.colorbar(mesh, ax=ax, label=O.get('colorbar_label', ''))
+    spec.data.plot(ax=ax, xlim=spec.xlim, ylim=spec.ylim, linewidth=1,
+                   style=[ '--' if str(C).startswith('baseline') else '-' for C in spec.data.columns ],
+                   logy=O.get('logy', False))
+    ax.legend(title=O.get('legend_title'))
+
+
+RENDERERS = {
+    'stacked': draw_stacked,
+    'boxplot': draw_boxplot,
+    'heatmap': draw_heatmap,
+    'timeseries': draw_timeseries,
+    'diffmap': draw_diffmap,
+}
+
+
+def draw_figure(spec, ax):
+    ''' Draw a plot spec onto existing axes '''
+    RENDERERS[spec.kind](spec, ax)
+    ax.set_title(spec.title)
+    if spec.xticks is not None:
+        ax.set_xticks(spec.xticks)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+
+
+@profiled('render_figure')
+def render_figure(spec, fig=None, ax=None):
+    ''' Render a plot spec to its output file, returning the render time
+        in seconds.  A figure is created for the spec unless one is given,
+        in which case the caller remains responsible for closing it.  A
+        figure created here is always closed, even if rendering fails. '''
+
+    start = time.perf_counter()
+    plt = pyplot()
+    owned = fig is None or ax is None
+    if owned:
+        fig, ax = plt.subplots(figsize=spec.figsize)
+    try:
+        draw_figure(spec, ax)
+        fig.savefig(spec.outfile)
+    finally:
+        if owned:
+            plt.close(fig)
+    return time.perf_counter() - start
+
+
+@profiled('render_figures')
+def render_figures(specs, jobs=1, verbose=True):
+    ''' Render a list of plot specs, returning a list of (outfile, seconds)
+        in the order given.  With jobs > 1 the figures are shared among a
+        pool of worker processes. '''
+
+    specs = list(specs)
+    if jobs <= 1 or len(specs) <= 1:
+        times = [ render_figure(S) for S in specs ]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=Instrument.disable) as pool:
+            times = list(pool.map(render_figure, specs))
+    if verbose:
+        for S, T in zip(specs, times):
+            print( "Rendered %s in %.3f s" % (S.outfile, T) )
+    return [ (S.outfile, T) for S, T in zip(specs, times) ]
+
+
+####################################################################################################
 
 class StackedLine:
-    ''' Stacked Line plots '''
-    def __init__(self, jobname, sub_data, metric, scale_factor=1.0):
+    ''' Stacked Line plots: a line per host of metric against the number
+        of clients, pivoted from the tidy table of a series (see
+        fiotools.Data.Series.to_frame) '''
+    @profiled('StackedLine')
+    def __init__(self, jobname, sub_data, metric, scale_factor=1.0, io_size=None):
 
         self.sub_data = sub_data
 
-        # Extract data for each host in the series.
-        # SeriesGroup - contains samples from many runs
-        #   Sample - contains results from many hosts
-        #     Result - contains data for one host, including hostname
-        self.clients = self.sub_data.hostnames()
-        self.client_index = set()
-        client_sample_data = {}
-        client_sample_len = {}
-        for client in self.clients:
-            # We get back a list of tuples - (hostname, jobname, num clients, io size, Result)
-            client_data = self.sub_data.extract_results( lambda S: S.hostname == client and S.jobname == jobname )
-
-            # Ordering of clients for plotting: sample length->[hostnames]
-            print("Host %s Runs %d" % (client, len(client_data)))
-            sample_len = len(client_data)
-            if sample_len not in client_sample_len:
-                client_sample_len[sample_len] = []
-            client_sample_len[sample_len].append(client)
-
-            # Pivoted data sample hostname->num_clients->bandwidth_value
-            client_result = { x[2]: x[4].fio_data[metric]*scale_factor for x in client_data }
-            client_sample_data[client] = pd.Series(data=client_result, name=client).sort_index()
-
-            # Construct a set of populated client values
-            self.client_index.update( [x[2] for x in client_data] )
-
-        # Generate an ordering of clients for neater stacking
-        client_sample_ordered = []
-        for nsamples in sorted(client_sample_len.keys(), reverse=True):
-            for client in client_sample_len[nsamples]:
-                client_sample_ordered.append(client_sample_data[client])
-
-        # Convert to pandas dataframes
-        self.DF = pd.DataFrame(client_sample_ordered)
+        # Select the results of the job, and I/O size if given, from a tidy
+        # table with a row for each result (see Series.to_frame)
+        table = sub_data.to_frame()
+        selected = table['jobname'] == jobname
+        if io_size is not None:
+            selected &= table['io_size'] == io_size
+        table = table[selected]
+        self.clients = set(table['hostname'])
+        self.client_index = set(table['clients'])
 
-    def plot(self, title, ylabel, quantisation, outfile):
+        # Ordering of clients for plotting: hosts with the most results
+        # first for neater stacking, then by hostname
+        runs = table.groupby('hostname').size()
+        for client, nruns in iter(runs.items()):
+            print("Host %s Runs %d" % (client, nruns))
+        order = sorted(runs.index, key=lambda H: (-runs[H], H))
+
+        # Pivot to hostname->num_clients->metric value, taking the last
+        # result of each host for each number of clients
+        table = table.drop_duplicates(['hostname', 'clients'], keep='last')
+        self.DF = (table.pivot(index='hostname', columns='clients', values=metric) * scale_factor) \
+            .reindex(order).sort_index(axis=1)
+        self.DF.index.name = None
+        self.DF.columns.name = None
+
+    @profiled('StackedLine.spec')
+    def spec(self, title, ylabel, quantisation, outfile):
+        ''' The plot spec for this stacked line plot '''
 
         # Find the maximum stacked value, rounded up to the nearest 1000 MB/s
         ymax = 0.0
@@ -60,15 +285,13 @@ class StackedLine:
         ymax = math.ceil(ymax / quantisation) * quantisation
         ylim = (0.0, ymax)
 
-        figsize=(10, 8)
-        fig, ax = plt.subplots(figsize=figsize)
-        ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, len(self.clients))])
-        self.DF.T.plot(ax=ax, stacked=True, legend=False, grid=True, ylim=ylim, linewidth=1)
-        ax.set_title(title)
-        ax.set_xticks(sorted(self.client_index))
-        ax.set_xlabel('Test clients')
-        ax.set_ylabel(ylabel)
-        fig.savefig(outfile)
+        return PlotSpec('stacked', outfile, self.DF, title=title,
+                        xlabel='Test clients', ylabel=ylabel,
+                        xticks=sorted(self.client_index), ylim=ylim,
+                        colours=len(self.clients))
+
+    def plot(self, title, ylabel, quantisation, outfile):
+        return render_figure(self.spec(title, ylabel, quantisation, outfile))
 
 
 ####################################################################################################
@@ -79,13 +302,8 @@ class BandwidthClient(StackedLine):
     def __init__(self, jobname, io_size, run_data, output_dir='.'):
         ''' Constructor from a series of samples and refining parameters '''
 
-        # Reduce to a subset selecting all samples matching required criteria
-        # sub_data will contain only the samples we require
-        sub_data = copy.copy( run_data )
-        sub_data.select_samples( lambda S: S.io_size == io_size and S.jobname == jobname )
-
-        # Extract the required data
-        super(BandwidthClient, self).__init__( jobname, sub_data, 'bw', 0.001 )
+        # Pivot the results of the job at the required I/O size
+        super(BandwidthClient, self).__init__( jobname, run_data, 'bw', 0.001, io_size )
 
 class IOPSClient(StackedLine):
     ''' Stacked Line plot of IOPS againstknumber of clients '''
@@ -93,13 +311,8 @@ class IOPSClient(StackedLine):
     def __init__(self, jobname, io_size, run_data, output_dir='.'):
         ''' Constructor from a series of samples and refining parameters '''
 
-        # Reduce to a subset selecting all samples matching required criteria
-        # sub_data will contain only the samples we require
-        sub_data = copy.copy( run_data )
-        sub_data.select_samples( lambda S: S.io_size == io_size and S.jobname == jobname )
-
-        # Extract the required data
-        super(IOPSClient, self).__init__( jobname, sub_data, 'iops', 0.001 )
+        # Pivot the results of the job at the required I/O size
+        super(IOPSClient, self).__init__( jobname, run_data, 'iops', 0.001, io_size )
 
 
 class BandwidthBS(StackedLine):
@@ -0,0 +1,266 @@
+# Copyright 2021 StackHPC Ltd
+# Selective loading of fio JSON output
+
+import json
+import re
+
+from fiotools.Archive import open_text
+from fiotools.Histogram import LatencyHistogram
+
+####################################################################################################
+# The subset of fio JSON output used by fiotools
+
+# Scalar fields retained for each I/O direction, with their natural type
+SECTION_FIELDS = (
+    ('io_bytes', int),
+    ('io_kbytes', int),
+    ('bw', int),
+    ('iops', float),
+    ('runtime', int),
+    ('total_ios', int),
+)
+SECTIONS = ('read', 'write')
+
+# Scalar fields retained for each job or client
+JOB_FIELDS = (
+    ('error', int),
+    ('usr_cpu', float),
+    ('sys_cpu', float),
+)
+
+# Fields retained from the steadystate report of each job or client run with
+# a steady state criterion (without the per-second data)
+STEADYSTATE_FIELDS = (
+    ('ss', str),
+    ('duration', int),
+    ('attained', int),
+    ('criterion', str),
+    ('max_deviation', float),
+    ('slope', float),
+)
+
+
+def fio_spec(histograms=True):
+    ''' The projection of a fio result document used by fiotools.
+        A dict selects the listed keys of an object, a single-entry list
+        applies its spec to every element of an array and True keeps the
+        whole value.  Without histograms the completion latency data
+        (clat_ns) is left out entirely. '''
+
+    section = { F: True for F, _ in SECTION_FIELDS }
+    if histograms:
+        section['clat_ns'] = {'percentile': True, 'bins': True}
+    job = { F: True for F, _ in JOB_FIELDS }
+    job.update({'jobname': True, 'hostname': True, 'job options': True})
+    job['steadystate'] = { F: True for F, _ in STEADYSTATE_FIELDS }
+    job.update({ D: section for D in SECTIONS })
+    return {
+        'global options': True,
+        'meta': {'total_clients': True},
+        'jobs': [job],
+        'client_stats': [job],
+    }
+
+
+def project(data, spec):
+    ''' Apply a projection spec to an already-parsed JSON value '''
+    if isinstance(spec, dict) and isinstance(data, dict):
+        return { K: project(V, spec[K]) for K, V in iter(data.items()) if K in spec }
+    if isinstance(spec, list) and isinstance(data, list):
+        return [ project(V, spec[0]) for V in data ]
+    return data
+
+
+def normalise_bins(fio_data):
+    ''' Convert fio's clat_ns histogram bins dicts to LatencyHistograms '''
+    for K in ('jobs', 'client_stats'):
+        for job in fio_data.get(K, []):
+            for D in SECTIONS:
+                clat = job.get(D, {}).get('clat_ns', {})
+                if 'bins' in clat:
+                    clat['bins'] = LatencyHistogram.from_bins(clat['bins'])
+    return fio_data
+
+
+def project_fio_data(fio_data, histograms=True):
+    ''' Reduce a parsed fio JSON document to the subset of fields used by
+        fiotools.  The result keeps fio's own key layout, so it can be used
+        in place of the full document, except that the histogram bins are
+        held as a LatencyHistogram. '''
+    return normalise_bins(project(fio_data, fio_spec(histograms)))
+
+
+def read_fio_stream(fio_fd, histograms=True):
+    ''' Parse fio JSON output from a text stream, returning the projected data '''
+    return normalise_bins(ProjectingReader(fio_fd).load(fio_spec(histograms)))
+
+
+def read_fio_file(path, histograms=True):
+    ''' Parse a fio JSON result file, returning the projected data.
+        The file is streamed and only the projected fields are built.
+        Files compressed with gzip, bzip2, xz or zstd (by suffix) are
+        decompressed as they are read. '''
+    with open_text(path) as fio_fd:
+        return read_fio_stream(fio_fd, histograms)
+
+####################################################################################################
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+SCALAR = re.compile(r'[^,:{}\[\]\s"]+')
+# Any run of text not containing brackets or braces (outside complete strings)
+FLAT = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+
+
+class ProjectingReader:
+    ''' A streaming JSON reader that builds only the parts of a document
+        selected by a projection spec (see fio_spec).  Everything else is
+        scanned over in chunks without constructing any Python objects,
+        and values that are kept are decoded by the json module. '''
+
+    chunk_size = 1 << 20
+
+    def __init__(self, fd, chunk_size=None):
+        self.fd = fd
+        if chunk_size:
+            self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.keep = None        # Start of a value being kept, not to be discarded
+        self.eof = False
+
+    def error(self, msg):
+        return ValueError("%s: offset %d in buffer" % (msg, self.pos))
+
+    def fill(self):
+        ''' Read the next chunk, discarding data that has been consumed '''
+        if self.eof:
+            return False
+        chunk = self.fd.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        cut = self.pos if self.keep is None else self.keep
+        if cut >= self.chunk_size:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            if self.keep is not None:
+                self.keep -= cut
+        self.buf += chunk
+        return True
+
+    def peek(self):
+        ''' Skip whitespace and return the next character, or '' at the end '''
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, c):
+        if self.peek() != c:
+            raise self.error("Expecting '%s'" % c)
+        self.pos += 1
+
+    def skip_string(self):
+        while True:
+            m = STRING.match(self.buf, self.pos)
+            if m:
+                self.pos = m.end()
+                return m
+            if not self.fill():
+                raise self.error("Unterminated string")
+
+    def read_string(self):
+        return json.loads(self.skip_string().group())
+
+    def skip_value(self):
+        ''' Move past the next value without decoding it '''
+        c = self.peek()
+        if c == '':
+            raise self.error("Expecting value")
+        if c in '{[':
+            self.pos += 1
+            depth = 1
+            while depth:
+                self.pos = FLAT.match(self.buf, self.pos).end()
+                if self.pos == len(self.buf) or self.buf[self.pos] == '"':
+                    # End of buffer, or a string continuing into the next chunk
+                    if not self.fill():
+                        raise self.error("Unterminated %s" % ('object' if c == '{' else 'array'))
+                    continue
+                depth += 1 if self.buf[self.pos] in '{[' else -1
+                self.pos += 1
+        elif c == '"':
+            self.skip_string()
+        else:
+            while True:
+                m = SCALAR.match(self.buf, self.pos)
+                if m and m.end() == len(self.buf) and self.fill():
+                    continue
+                if not m:
+                    raise self.error("Expecting value")
+                self.pos = m.end()
+                break
+
+    def decode_value(self):
+        ''' Decode the next value in full '''
+        self.peek()
+        self.keep = self.pos
+        self.skip_value()
+        text = self.buf[self.keep:self.pos]
+        self.keep = None
+        return json.loads(text)
+
+    def parse(self, spec):
+        c = self.peek()
+        if isinstance(spec, dict) and c == '{':
+            return self.parse_object(spec)
+        if isinstance(spec, list) and c == '[':
+            return self.parse_array(spec[0])
+        return self.decode_value()
+
+    def parse_object(self, spec):
+        result = {}
+        self.pos += 1
+        if self.peek() == '}':
+            self.pos += 1
+            return result
+        while True:
+            if self.peek() != '"':
+                raise self.error("Expecting property name")
+            key = self.read_string()
+            self.expect(':')
+            if key in spec:
+                result[key] = self.parse(spec[key])
+            else:
+                self.skip_value()
+            c = self.peek()
+            self.pos += 1
+            if c == '}':
+                return result
+            if c != ',':
+                raise self.error("Expecting ',' delimiter")
+
+    def parse_array(self, spec):
+        result = []
+        self.pos += 1
+        if self.peek() == ']':
+            self.pos += 1
+            return result
+        while True:
+            result.append(self.parse(spec))
+            c = self.peek()
+            self.pos += 1
+            if c == ']':
+                return result
+            if c != ',':
+                raise self.error("Expecting ',' delimiter")
+
+    def load(self, spec):
+        ''' Read a complete document, returning its projection '''
+        value = self.parse(spec)
+        if self.peek() != '':
+            raise self.error("Extra data")
+        return value
@@ -0,0 +1,150 @@
+# Copyright 2021 StackHPC Ltd
+# A latency grid at several resolutions, computed once and kept beside the CSVs
+
+import json
+import os
+
+import numpy as np
+
+from fiotools.Plot import PlotSpec
+
+# Format of the saved pyramid: bump this whenever the layout changes
+PYRAMID_VERSION = 1
+
+# Rows of each level are summed in groups of this many to give the next
+PYRAMID_FACTOR = 2
+
+# Levels are made until one has fewer rows than this
+PYRAMID_MIN_ROWS = 8
+
+####################################################################################################
+
+def coarsen(y_edges, mass, factor=PYRAMID_FACTOR):
+    ''' Sum each group of factor adjacent rows of a grid of probability mass
+        exactly, returning the row edges and mass of the coarser grid.  If
+        the rows do not divide evenly, the last row takes what remains. '''
+    starts = np.arange(0, mass.shape[0], factor)
+    return np.append(y_edges[starts], y_edges[-1]), np.add.reduceat(mass, starts, axis=0)
+
+
+def density_grid(y_edges, mass):
+    ''' The density of a grid of probability mass in each row, normalised
+        to a peak of 1, with empty cells NaN so that they are not plotted '''
+    grid = mass / np.diff(y_edges)[:, np.newaxis]
+    peak = grid.max() if grid.size else 0.0
+    if peak > 0:
+        grid = grid / peak
+    grid[grid == 0.0] = np.nan
+    return grid
+
+
+class GridPyramid:
+    ''' A latency grid at decreasing resolutions.  Each level is the
+        probability mass in each cell of a grid of latency rows by columns
+        with edges x_edges, the finest first, and each coarser level sums
+        groups of PYRAMID_FACTOR rows of the one before, so that every level
+        holds exactly the same I/Os.  A grid at any of the resolutions, over
+        all latencies or a window of them, is drawn from a level without
+        going back to the results.  percentiles is a pandas DataFrame of
+        the latency percentiles of each column, to draw over the grid, and
+        meta a dict of labelling. '''
+
+    def __init__(self, x_edges, levels, percentiles=None, meta=None):
+        self.x_edges = np.asarray(x_edges, dtype=np.double)
+        self.levels = levels
+        self.percentiles = percentiles
+        self.meta = dict(meta or {})
+
+    @classmethod
+    def build(cls, x_edges, y_edges, mass, percentiles=None, meta=None,
+              factor=PYRAMID_FACTOR, min_rows=PYRAMID_MIN_ROWS):
+        ''' The pyramid over a grid of probability mass, coarsened until a
+            level has fewer than min_rows rows '''
+        levels = [ (np.asarray(y_edges, dtype=np.double), np.asarray(mass, dtype=np.double)) ]
+        while levels[-1][1].shape[0] >= max(min_rows, 2):
+            levels.append(coarsen(levels[-1][0], levels[-1][1], factor))
+        return cls(x_edges, levels, percentiles, meta)
+
+    def rows(self):
+        ''' The number of latency rows of each level, the finest first '''
+        return [ mass.shape[0] for y_edges, mass in self.levels ]
+
+    def window(self, level, ylim=None):
+        ''' The slice of the rows of a level that overlap ylim (low, high) '''
+        y_edges = self.levels[level][0]
+        if ylim is None:
+            return slice(0, len(y_edges) - 1)
+        lo = max(np.searchsorted(y_edges, ylim[0], side='right') - 1, 0)
+        hi = min(np.searchsorted(y_edges, ylim[1], side='left'), len(y_edges) - 1)
+        return slice(lo, max(hi, lo + 1))
+
+    def level_for(self, rows, ylim=None):
+        ''' The coarsest level with at least rows rows over ylim, or the finest '''
+        for level in reversed(range(len(self.levels))):
+            window = self.window(level, ylim)
+            if window.stop - window.start >= rows:
+                return level
+        return 0
+
+    def grid(self, level, ylim=None):
+        ''' The row edges and the normalised density of a level, over the
+            rows that overlap ylim if given, as ClatGrid draws them '''
+        y_edges, mass = self.levels[level]
+        window = self.window(level, ylim)
+        return y_edges[window.start:window.stop + 1], density_grid(y_edges[window.start:window.stop + 1], mass[window])
+
+    def spec(self, outfile, rows=200, ylim=None, figsize=(10, 8), cmap='gist_heat', heatmap='auto'):
+        ''' A heatmap plot spec of the coarsest level with at least rows
+            rows over ylim, labelled as by ClatGrid '''
+        M = self.meta
+        grid_Y, grid = self.grid(self.level_for(rows, ylim), ylim)
+        if ylim is None:
+            ylim = [max(1, grid_Y[0]), grid_Y[-1]]
+        return PlotSpec('heatmap', outfile, self.percentiles,
+                        title='Number of clients vs %s commit latency - %s - %d %s' %
+                              (M.get('mode'), M.get('scenario'), M.get('bs'), M.get('rw')),
+                        xlabel='Test clients',
+                        ylabel='%s commit latency - $%s$' % (str(M.get('mode')).capitalize(), M.get('ts_label')),
+                        xticks=list(self.percentiles.index), xlim=[self.x_edges[0], self.x_edges[-1]], ylim=ylim,
+                        figsize=figsize, grid_X=self.x_edges, grid_Y=grid_Y, grid=grid, cmap=cmap,
+                        heatmap=heatmap, logy=bool(M.get('logscale')), legend_title='percentiles')
+
+    def save(self, path):
+        ''' Write the pyramid as a compressed npz file, replacing any
+            previous one only once it is complete '''
+        arrays = {
+            'version': PYRAMID_VERSION,
+            'meta': json.dumps(self.meta),
+            'x_edges': self.x_edges,
+            'levels': len(self.levels),
+        }
+        for i, (y_edges, mass) in enumerate(self.levels):
+            arrays['y_edges_%d' % i] = y_edges
+            arrays['mass_%d' % i] = mass
+        if self.percentiles is not None:
+            arrays['percentile_index'] = np.asarray(self.percentiles.index)
+            arrays['percentile_columns'] = np.asarray(self.percentiles.columns, dtype=np.double)
+            arrays['percentile_values'] = self.percentiles.values.astype(np.double)
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, str(path))
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    @classmethod
+    def load(cls, path):
+        ''' Read a pyramid written by save, raising ValueError if it is not
+            one or is of another version '''
+        with np.load(str(path), allow_pickle=False) as A:
+            if 'version' not in A.files or int(A['version']) != PYRAMID_VERSION:
+                raise ValueError("%s is not a latency grid pyramid of version %d" % (path, PYRAMID_VERSION))
+            levels = [ (A['y_edges_%d' % i], A['mass_%d' % i]) for i in range(int(A['levels'])) ]
+            percentiles = None
+            if 'percentile_values' in A.files:
+                import pandas as pd
+                percentiles = pd.DataFrame(A['percentile_values'], index=A['percentile_index'],
+                                           columns=A['percentile_columns'].tolist())
+            return cls(A['x_edges'], levels, percentiles, json.loads(str(A['meta'])))
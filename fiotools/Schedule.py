@@ -0,0 +1,300 @@
+# Copyright 2021 StackHPC Ltd
+# Adaptive choice of the I/O sizes and client counts of a sweep
+#
+# The next point of a sweep is chosen in one place, by mpi_master.sh or by the
+# barrier coordinator that run_fio.sh clients wait at (fio_barrier serve
+# --results), and handed to the clients, so that every client runs the same.
+
+import argparse
+import math
+import os
+import sys
+
+from fiotools.Cache import load_fio_files
+from fiotools.Data import Result
+from fiotools.Discovery import list_result_files
+
+# Changes in throughput within this fraction are taken as flat
+DEFAULT_TOLERANCE = 0.05
+
+# Completion latency percentile measured at each point, as fio keys it
+LATENCY_PERCENTILE = '99.000000'
+
+# Metrics whose curves are refined where they bend: across I/O sizes, the
+# latency rises in proportion once bandwidth saturates, and across client
+# counts, it rises where the storage is contended
+BS_SHAPE_METRICS = ('bw', 'lat')
+CLIENTS_SHAPE_METRICS = ('bw', 'iops', 'lat')
+
+# Number of values first measured across the range of a sweep
+COARSE_POINTS = 5
+
+# The I/O sizes swept by run_fio.sh: 256 bytes to 16 MiB
+BS_MIN = 256
+BS_MAX = 16 * 1024 * 1024
+
+####################################################################################################
+# Choosing the next value to measure
+
+def coarse_values(values, points=COARSE_POINTS):
+    ''' Evenly spaced values from a sorted list, including both ends '''
+    if len(values) <= points:
+        return list(values)
+    return [ values[int(round(i * (len(values) - 1) / float(points - 1)))] for i in range(points) ]
+
+
+def log_ratio(a, b):
+    if a <= 0 or b <= 0:
+        return 0.0 if a == b else float('inf')
+    return abs(math.log(b / a))
+
+
+def plateau_end(coarse, measured, metrics, tolerance, plateau):
+    ''' The coarse value at which every metric has changed by less than
+        tolerance over the last plateau coarse steps, or None '''
+    flat = 0
+    for a, b in zip(coarse, coarse[1:]):
+        if b not in measured:
+            return None
+        if all(log_ratio(measured[a][M], measured[b][M]) <= math.log1p(tolerance) for M in metrics):
+            flat += 1
+            if flat >= plateau:
+                return b
+        else:
+            flat = 0
+    return None
+
+
+def bend(xs, ys, k):
+    ''' The change in slope of a curve at the ends of its k'th segment '''
+    slope = lambda i: (ys[i+1] - ys[i]) / (xs[i+1] - xs[i])
+    neighbours = [ abs(slope(k) - slope(i)) for i in (k - 1, k + 1) if 0 <= i < len(xs) - 1 ]
+    return max(neighbours) if neighbours else float('inf')
+
+
+def next_value(values, measured, tolerance=DEFAULT_TOLERANCE, max_points=None,
+               plateau_metrics=('bw',), shape_metrics=('bw',), coarse=COARSE_POINTS, plateau=2):
+    ''' The next of a sorted list of positive values to measure, given the
+        metrics measured so far at some of them ({value: {metric: float}}),
+        or None once the sweep is done.
+
+        Values across the range are measured first, in increasing order,
+        until the plateau_metrics have changed by less than tolerance over
+        plateau steps: larger values are then skipped.  Between the values
+        measured, the curve of each of the shape_metrics is taken as
+        piecewise linear on log-log axes, which holds both while bandwidth
+        scales and once it has saturated.  The gaps where the slope bends,
+        around knees and saturation, are refined, largest first, until
+        linear interpolation across each gap would be within tolerance, or
+        max_points have been measured.  Shape metrics missing from any
+        point measured, such as latency of results without it, are left
+        out. '''
+
+    values = sorted(values)
+    coarse = coarse_values(values, coarse)
+    end = plateau_end(coarse, measured, plateau_metrics, tolerance, plateau)
+    if end is None:
+        for V in coarse:
+            if V not in measured:
+                return V
+
+    if max_points is not None and len(measured) >= max_points:
+        return None
+    end = end or values[-1]
+    done = [ V for V in values if V in measured and V <= end ]
+    xs = [ math.log(V) for V in done ]
+    worst, choice = math.log1p(tolerance), None
+    for k in range(len(done) - 1):
+        between = [ V for V in values if done[k] < V < done[k+1] ]
+        if not between:
+            continue
+        error = 0.0
+        for M in shape_metrics:
+            if any(M not in measured[V] for V in done):
+                continue
+            ys = [ math.log(max(measured[V][M], 1e-9)) for V in done ]
+            error = max(error, bend(xs, ys, k) * (xs[k+1] - xs[k]) / 4.0)
+        if error > worst:
+            middle = (xs[k] + xs[k+1]) / 2.0
+            worst, choice = error, min(between, key=lambda V: abs(math.log(V) - middle))
+    return choice
+
+####################################################################################################
+# Measurements from results in the layout of run_fio.sh and mpi_fio.sh
+
+def result_metrics(results):
+    ''' The total bandwidth (KiB/s) and IOPS of results run together (see
+        fiotools.Data.Result), and their mean completion latency percentile
+        (ns) where every result has it '''
+    metrics = {'bw': float(sum(R.fio_data['bw'] for R in results)),
+               'iops': float(sum(R.fio_data['iops'] for R in results))}
+    latency = [ R.fio_data.get('clat_ns', {}).get('percentile', {}).get(LATENCY_PERCENTILE) for R in results ]
+    if results and None not in latency:
+        metrics['lat'] = sum(latency) / float(len(latency))
+    return metrics
+
+
+def peak_metrics(sizes):
+    ''' The peak bandwidth and IOPS over the measurements of a number of
+        clients at each I/O size, and the latency at the peak bandwidth '''
+    points = { M: max(P[M] for P in sizes) for M in ('bw', 'iops') }
+    peak = max(sizes, key=lambda P: P['bw'])
+    if 'lat' in peak:
+        points['lat'] = peak['lat']
+    return points
+
+
+class BlockSizePoints:
+    ''' The measurements at each I/O size of a directory with a
+        <client>/<bs>.json per client, as written by run_fio.sh and
+        mpi_fio.sh.  Results are read through the parse cache of each
+        client directory (see fiotools.Cache), and each is read once:
+        update only reads the results added since it was last called,
+        since fio writes each result once, at the end of its run. '''
+
+    def __init__(self, client_count_dir, cache=True):
+        self.client_count_dir = str(client_count_dir)
+        self.cache = cache
+        self.results = {}       # path -> (I/O size, Result)
+
+    def update(self):
+        ''' The measurements at each I/O size ({bs: {metric: float}}), as
+            result_metrics over the clients.  Unreadable results are left
+            out, and looked at again at the next update. '''
+        paths = list_result_files(self.client_count_dir) if os.path.isdir(self.client_count_dir) else []
+        new = [ P for P in paths if P not in self.results ]
+        for path, S, E in load_fio_files(new, self.cache):
+            try:
+                if E is not None:
+                    raise E
+                bs = int(S['global options']['bs'])
+                self.results[path] = (bs, Result(S['jobs'][0]))
+            except (ValueError, KeyError, TypeError, IndexError, OSError):
+                continue
+        present = set(paths)
+        for path in list(self.results):
+            if path not in present:
+                del self.results[path]
+        sizes = {}
+        for bs, R in self.results.values():
+            sizes.setdefault(bs, []).append(R)
+        return { bs: result_metrics(results) for bs, results in iter(sizes.items()) }
+
+
+def block_size_points(client_count_dir, cache=True):
+    ''' The measurements at each I/O size of a directory of results of
+        a number of clients (see BlockSizePoints) '''
+    return BlockSizePoints(client_count_dir, cache).update()
+
+
+def client_count_points(scenario_dir, cache=True):
+    ''' The peak total bandwidth and IOPS over the I/O sizes at each number
+        of clients, and the latency at the I/O size of peak bandwidth, from
+        a directory with a <clients>[-<per node>] directory for each '''
+    points = {}
+    for name in os.listdir(scenario_dir):
+        count = name.split('-')[0]
+        if not count.isdigit() or not os.path.isdir(os.path.join(scenario_dir, name)):
+            continue
+        sizes = list(block_size_points(os.path.join(scenario_dir, name), cache).values())
+        if sizes:
+            points[int(count)] = peak_metrics(sizes)
+    return points
+
+
+def doubling(lo, hi):
+    values = []
+    while lo <= hi:
+        values.append(lo)
+        lo *= 2
+    return values
+
+####################################################################################################
+# Choosing for the clients of a barrier coordinator
+
+class Scheduler:
+    ''' Chooses the next point of the sweeps below a results root, for a
+        barrier coordinator (see fiotools.Barrier) to hand to every client
+        it releases.  A schedule is a dict of the sweep ('bs' or
+        'clients'), the input directory relative to the root, and
+        optionally the tolerance, max_points, the min and max I/O size, or
+        the numbers of clients that may be run.  The measurements of each
+        input directory are kept between choices, so that each result is
+        read once. '''
+
+    def __init__(self, results_root, cache=True):
+        self.results_root = os.path.realpath(str(results_root))
+        self.cache = cache
+        self.points = {}        # input directory -> BlockSizePoints
+
+    def input_dir(self, name):
+        path = os.path.realpath(os.path.join(self.results_root, str(name)))
+        if os.path.commonpath([path, self.results_root]) != self.results_root:
+            raise ValueError("Input directory %s is outside the results root %s" % (name, self.results_root))
+        return path
+
+    def __call__(self, schedule):
+        ''' The next value of a sweep, or None once it is done '''
+        input_dir = self.input_dir(schedule['input_dir'])
+        tolerance = float(schedule.get('tolerance') or DEFAULT_TOLERANCE)
+        max_points = schedule.get('max_points')
+        if schedule['sweep'] == 'bs':
+            if input_dir not in self.points:
+                self.points[input_dir] = BlockSizePoints(input_dir, self.cache)
+            return next_value(doubling(int(schedule.get('min') or BS_MIN), int(schedule.get('max') or BS_MAX)),
+                              self.points[input_dir].update(), tolerance, max_points, shape_metrics=BS_SHAPE_METRICS)
+        if schedule['sweep'] == 'clients':
+            measured = client_count_points(input_dir, self.cache) if os.path.isdir(input_dir) else {}
+            return next_value([ int(V) for V in schedule['values'] ], measured, tolerance, max_points,
+                              plateau_metrics=('bw', 'iops'), shape_metrics=CLIENTS_SHAPE_METRICS)
+        raise ValueError("Unknown sweep %s: expected bs or clients" % schedule['sweep'])
+
+####################################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the next point of an adaptive fio sweep, '
+                                                 'or nothing once the sweep is done')
+    commands = parser.add_subparsers(dest='command')
+    bs_parser = commands.add_parser('bs', help='Next I/O size to run for a number of clients')
+    bs_parser.add_argument('-i', '--input-dir', metavar='<path>',
+        dest="input_dir", type=str, required=True,
+        help='Results of a number of clients: a directory per client of <bs>.json')
+    bs_parser.add_argument('--min', metavar='<bytes>',
+        dest="min", type=int, default=BS_MIN,
+        help='Smallest I/O size, doubling up to the largest')
+    bs_parser.add_argument('--max', metavar='<bytes>',
+        dest="max", type=int, default=BS_MAX,
+        help='Largest I/O size')
+    clients_parser = commands.add_parser('clients', help='Next number of clients to run')
+    clients_parser.add_argument('-i', '--input-dir', metavar='<path>',
+        dest="input_dir", type=str, required=True,
+        help='Results of a scenario: a directory per number of clients, named <clients>[-<per node>]')
+    clients_parser.add_argument('--values', metavar='<N>',
+        dest="values", type=int, nargs='+', required=True,
+        help='Numbers of clients that may be run')
+    for P in (bs_parser, clients_parser):
+        P.add_argument('-t', '--tolerance', metavar='<fraction>',
+            dest="tolerance", type=float, default=DEFAULT_TOLERANCE,
+            help='Changes in throughput within this fraction are taken as flat')
+        P.add_argument('-n', '--max-points', metavar='<N>',
+            dest="max_points", type=int, default=None,
+            help='Stop refining once this many points have been run')
+    args = parser.parse_args(argv)
+
+    if args.command == 'bs':
+        V = next_value(doubling(args.min, args.max), block_size_points(args.input_dir), args.tolerance,
+                       args.max_points, shape_metrics=BS_SHAPE_METRICS)
+    elif args.command == 'clients':
+        measured = client_count_points(args.input_dir) if os.path.isdir(args.input_dir) else {}
+        V = next_value(args.values, measured, args.tolerance, args.max_points,
+                       plateau_metrics=('bw', 'iops'), shape_metrics=CLIENTS_SHAPE_METRICS)
+    else:
+        parser.print_help()
+        return 2
+    if V is not None:
+        print( V )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+# Copyright 2021 StackHPC Ltd
+# fio steady state: job options to end each run once it is stable, and the
+# convergence of results from fio's steadystate report or from their logs
+
+import re
+
+import numpy as np
+
+from fiotools.Log import DDIR_READ, DDIR_WRITE, sample_logs
+
+# fio's steady state criteria: the IOPS or bandwidth, or their slope, must
+# stay within a limit, in absolute terms or as a percentage of the mean
+CRITERION = re.compile(r'^(iops|bw)(_slope)?:([0-9]*\.?[0-9]+)(%?)$')
+
+# Stable when the slope of IOPS is within 0.5% of the mean per second, over
+# 10 s after a 5 s ramp, with each run ended after 120 s in any case
+DEFAULT_CRITERION = 'iops_slope:0.5%'
+DEFAULT_DURATION = 10
+DEFAULT_RAMP_TIME = 5
+DEFAULT_RUNTIME = 120
+
+####################################################################################################
+
+def parse_criterion(criterion):
+    ''' The (metric, slope, limit, percent) of a fio steady state criterion
+        such as iops_slope:0.5% or bw:10% '''
+    match = CRITERION.match(str(criterion))
+    if match is None:
+        raise ValueError("Invalid steady state criterion %s: expected <iops|bw>[_slope]:<limit>[%%]" % criterion)
+    metric, slope, limit, percent = match.groups()
+    return metric, bool(slope), float(limit), bool(percent)
+
+
+def steadystate_options(criterion=DEFAULT_CRITERION, duration=DEFAULT_DURATION, ramp_time=DEFAULT_RAMP_TIME,
+                        runtime=DEFAULT_RUNTIME):
+    ''' The fio job options (name, value) to end a job once the criterion
+        has held over duration seconds, after ramp_time seconds, or after
+        runtime seconds if it is never met.  With group_reporting, fio
+        judges the jobs of a group together. '''
+    parse_criterion(criterion)
+    options = [('steadystate', criterion),
+               ('steadystate_duration', '%ds' % duration),
+               ('steadystate_ramp_time', '%ds' % ramp_time)]
+    if runtime is not None:
+        options.append(('runtime', '%d' % runtime))
+    return options
+
+####################################################################################################
+# Convergence
+
+def converged(job):
+    ''' Whether a fio job (or client) result reached steady state: None
+        if it was not run with a steady state criterion '''
+    steadystate = job.get('steadystate')
+    if steadystate is None:
+        return None
+    return bool(int(steadystate['attained']))
+
+
+def count_unconverged(results):
+    ''' The number of the jobs or clients of parsed fio results that did
+        not reach steady state, and the number run with a criterion '''
+    unconverged = judged = 0
+    for S in results:
+        for J in S.get('client_stats', S.get('jobs', [])):
+            C = converged(J)
+            if C is not None:
+                judged += 1
+                unconverged += not C
+    return unconverged, judged
+
+
+def window_measure(values, slope, percent):
+    ''' fio's measure of a window of per-second values: the least squares
+        slope, or the greatest deviation from the mean, optionally as a
+        percentage of the mean '''
+    mean = np.mean(values)
+    if slope:
+        x = np.arange(len(values))
+        measure = abs(np.sum((x - x.mean()) * (values - mean)) / np.sum((x - x.mean())**2))
+    else:
+        measure = np.max(np.abs(values - mean))
+    if percent:
+        return measure * 100.0 / mean if mean > 0 else np.inf
+    return measure
+
+
+def find_steady_state(values, criterion=DEFAULT_CRITERION, duration=DEFAULT_DURATION, ramp_time=DEFAULT_RAMP_TIME):
+    ''' The time (s) at which a series of per-second IOPS or bandwidth
+        values first met a steady state criterion over the preceding
+        duration seconds, as fio judges it, or None if it never did.  fio
+        would have ended the job at that time. '''
+    metric, slope, limit, percent = parse_criterion(criterion)
+    values = np.asarray(values, dtype=np.double)[int(ramp_time):]
+    for end in range(int(duration), len(values) + 1):
+        window = values[end - int(duration):end]
+        if not np.any(np.isnan(window)) and window_measure(window, slope, percent) <= limit:
+            return int(ramp_time) + end
+    return None
+
+
+def log_steady_state(result_path, criterion=DEFAULT_CRITERION, duration=DEFAULT_DURATION,
+                     ramp_time=DEFAULT_RAMP_TIME, rw=None):
+    ''' The time (s) at which a result logged with --write_bw_log or
+        --write_iops_log (see fiotools.Log) first met a steady state
+        criterion, totalled over its jobs each second, or None if it never
+        did.  Raises ValueError if the result has no such logs. '''
+    metric = parse_criterion(criterion)[0]
+    ddir = None if rw is None else DDIR_WRITE if 'write' in rw else DDIR_READ
+    times, (total,) = sample_logs([result_path], metric, bucket_ms=1000, ddir=ddir)
+    return find_steady_state(total.mean, criterion, duration, ramp_time)
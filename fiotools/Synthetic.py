@@ -0,0 +1,333 @@
+# Copyright 2021 StackHPC Ltd
+# Synthetic fio json+ output, for testing and benchmarking at scale
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+import numpy as np
+
+from fiotools.Histogram import FIO_IO_U_PLAT_NR, FIO_IO_U_PLAT_VAL, PlatHistogram, plat_idx_lower
+
+# The block sizes swept by run_fio.sh: 256 bytes to 16 MiB
+SWEEP_BS = [ 2**n for n in range(8, 25) ]
+
+# The completion latency percentiles fio reports by default
+FIO_PERCENTILES = [1.0, 5.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0,
+                   90.0, 95.0, 99.0, 99.5, 99.9, 99.95, 99.99]
+
+# Global options as set by fio_jobfiles/global_config.fio
+GLOBAL_OPTIONS = {
+    'fallocate': 'none',
+    'runtime': '30',
+    'time_based': '1',
+    'ioengine': 'libaio',
+    'iodepth': '8',
+    'direct': '1',
+    'buffered': '0',
+    'thread': '0',
+    'group_reporting': '1',
+    'filesize': '32g',
+    'size': '32g',
+    'filename_format': '$jobnum.dat',
+}
+
+####################################################################################################
+# Latency histograms
+
+def lognormal_cdf(x, median, sigma):
+    erf = np.frompyfunc(math.erf, 1, 1)
+    with np.errstate(divide='ignore'):
+        z = (np.log(np.maximum(x, 0.0)) - math.log(median)) / (sigma * math.sqrt(2.0))
+    return 0.5 * (1.0 + erf(z).astype(np.double))
+
+
+def latency_histogram(rng, total_ios, median, density=600, tail=0.3):
+    ''' A PlatHistogram of total_ios completion latencies (ns), drawn from a
+        log-normal main mode around median plus a slower tail mode, like
+        those seen on shared storage.  density is the approximate number of
+        populated buckets for a run of a million or so I/Os, with fewer
+        populated for shorter runs: each doubling of latency spans 64 buckets. '''
+
+    # Well sampled, the two modes populate about +/- 5 sigma
+    sigma = max(density / (10.0 * FIO_IO_U_PLAT_VAL / math.log(2.0)), 0.01)
+    edges = plat_idx_lower(np.arange(FIO_IO_U_PLAT_NR + 1))
+    edges[-1] = np.iinfo(np.int64).max
+    cdf = (1.0 - tail) * lognormal_cdf(edges, median, sigma) + \
+          tail * lognormal_cdf(edges, 8.0 * median, sigma)
+    p = np.maximum(np.diff(cdf), 0.0)
+    return PlatHistogram(rng.multinomial(total_ios, p / p.sum()))
+
+
+def latency_stats(plat):
+    ''' The clat_ns section fio reports for a PlatHistogram '''
+    hist = plat.histogram()
+    if not len(hist):
+        return {'min': 0, 'max': 0, 'mean': 0.0, 'stddev': 0.0,
+                'percentile': { '%f' % P: 0 for P in FIO_PERCENTILES }, 'bins': {}}
+    mean = float(np.average(hist.values, weights=hist.counts))
+    stddev = float(np.sqrt(np.average((hist.values - mean)**2, weights=hist.counts)))
+    return {
+        'min': hist.min(),
+        'max': hist.max(),
+        'mean': mean,
+        'stddev': stddev,
+        'percentile': { '%f' % P: int(V) for P, V in zip(FIO_PERCENTILES, plat.percentiles(FIO_PERCENTILES)) },
+        'bins': { str(Y): int(Z) for Y, Z in zip(hist.values, hist.counts) },
+    }
+
+####################################################################################################
+# fio result documents
+
+def empty_section():
+    return io_section(PlatHistogram(), 0, 1)
+
+
+def io_section(plat, bs, runtime_ms):
+    ''' A read/write/trim section of a fio job with the given latencies '''
+    total_ios = plat.total()
+    io_bytes = total_ios * bs
+    clat = latency_stats(plat)
+    iops = total_ios * 1000.0 / runtime_ms if total_ios else 0.0
+    bw = int(io_bytes / 1024 * 1000 / runtime_ms) if total_ios else 0
+    slat = {'min': 0, 'max': 0, 'mean': 0.0, 'stddev': 0.0}
+    lat = {'min': 0, 'max': 0, 'mean': 0.0, 'stddev': 0.0}
+    if total_ios:
+        slat = {'min': 5000, 'max': 500000, 'mean': 20000.0, 'stddev': 10000.0}
+        lat = {'min': clat['min'] + 5000, 'max': clat['max'] + 500000,
+               'mean': clat['mean'] + 20000.0, 'stddev': clat['stddev']}
+    return {
+        'io_bytes': io_bytes,
+        'io_kbytes': io_bytes // 1024,
+        'bw': bw,
+        'iops': iops,
+        'runtime': runtime_ms if total_ios else 0,
+        'total_ios': total_ios,
+        'short_ios': 0,
+        'drop_ios': 0,
+        'slat_ns': slat,
+        'clat_ns': clat,
+        'lat_ns': lat,
+        'bw_min': int(bw * 0.5),
+        'bw_max': int(bw * 1.5),
+        'bw_agg': 100.0 if total_ios else 0.0,
+        'bw_mean': float(bw),
+        'bw_dev': bw * 0.1,
+        'bw_samples': runtime_ms // 125 if total_ios else 0,
+        'iops_min': int(iops * 0.5),
+        'iops_max': int(iops * 1.5),
+        'iops_mean': iops,
+        'iops_stddev': iops * 0.1,
+        'iops_samples': runtime_ms // 125 if total_ios else 0,
+    }
+
+
+def fio_job(rng, rw, bs, clients=1, jobname='fio-job', hostname=None, density=600,
+            runtime=30, iodepth=8, numjobs=4, latency_scale=1.0, steadystate=None):
+    ''' A fio json+ job result for one client of a run with the given
+        number of clients.  Latency grows with the I/O size and with the
+        number of clients sharing the storage, and the I/O count follows
+        from the latency, the queue depth and the runtime.  latency_scale
+        models slower (> 1) or faster (< 1) storage.  steadystate is the
+        (criterion, attained) of a job run with a steady state criterion. '''
+
+    # 500us per I/O plus a shared 200 MB/s of bandwidth, with every queue
+    # completing at least one I/O
+    median = (5.0e5 + bs * clients * 5.0) * latency_scale
+    total_ios = int(numjobs * iodepth * runtime * 1.0e9 / median * rng.uniform(0.9, 1.1))
+    total_ios = max(total_ios, numjobs * iodepth)
+    runtime_ms = runtime * 1000 + int(rng.integers(0, 100))
+    plat = latency_histogram(rng, total_ios, median, density)
+    mode = 'write' if 'write' in rw else 'read'
+    job = {
+        'jobname': jobname,
+        'groupid': 0,
+        'error': 0,
+        'eta': 0,
+        'elapsed': runtime + 1,
+        'job options': {'rw': rw},
+    }
+    for D in ('read', 'write', 'trim'):
+        job[D] = io_section(plat, bs, runtime_ms) if D == mode else empty_section()
+    job.update({
+        'usr_cpu': float(rng.uniform(0.5, 5.0)),
+        'sys_cpu': float(rng.uniform(2.0, 10.0)),
+        'ctx': total_ios * 2,
+        'majf': 0,
+        'minf': 356,
+        'iodepth_level': {'1': 0.1, '2': 0.1, '4': 0.1, '8': 99.9, '16': 0.0, '32': 0.0, '>=64': 0.0},
+        'latency_ns': { K: 0.0 for K in ('2', '4', '10', '20', '50', '100', '250', '500', '750', '1000') },
+        'latency_us': { K: 0.0 for K in ('2', '4', '10', '20', '50', '100', '250', '500', '750', '1000') },
+        'latency_ms': { K: 0.0 for K in ('2', '4', '10', '20', '50', '100', '250', '500', '750', '1000', '2000', '>=2000') },
+        'latency_depth': iodepth,
+        'latency_target': 0,
+        'latency_percentile': 100.0,
+        'latency_window': 0,
+    })
+    if steadystate is not None:
+        job['steadystate'] = steadystate_block(*steadystate)
+    if hostname is not None:
+        job['hostname'] = hostname
+    return job
+
+
+def steadystate_block(criterion, attained, duration=10):
+    ''' The steadystate report of a fio job run with a criterion such as
+        iops_slope:0.5% '''
+    ss, limit = criterion.split(':')
+    return {
+        'ss': ss.upper(),
+        'duration': duration,
+        'attained': int(attained),
+        'criterion': limit,
+        'max_deviation': 0.0,
+        'slope': 0.1 if attained else 2.5,
+        'data': {'bw_mean': 0, 'iops_mean': 0, 'iops': [], 'bw': []},
+    }
+
+
+def fio_document(rng, bs, directory='/data'):
+    ''' The outer fields of a fio json+ document '''
+    timestamp = 1542974875 + int(rng.integers(0, 10**6))
+    global_options = dict(GLOBAL_OPTIONS, directory=directory, bs=str(bs))
+    return {
+        'fio version': 'fio-3.1',
+        'timestamp': timestamp,
+        'timestamp_ms': timestamp * 1000,
+        'time': 'Fri Nov 23 12:07:55 2018',
+        'global options': global_options,
+    }
+
+
+def fio_result(rng, rw, bs, clients=1, density=600, latency_scale=1.0, steadystate=None):
+    ''' A single-client fio json+ document, as written by run_fio.sh '''
+    S = fio_document(rng, bs)
+    S['jobs'] = [fio_job(rng, rw, bs, clients, density=density, latency_scale=latency_scale,
+                         steadystate=steadystate)]
+    return S
+
+
+def fio_group_result(rng, rw, bs, clients, jobname='fio-job', density=600, latency_scale=1.0, hostnames=None,
+                     steadystate=None):
+    ''' A group-reporting fio json+ document from fio's client/server mode,
+        with a result for each client (named client-<i>, or by hostnames)
+        and the aggregate for all clients '''
+    S = fio_document(rng, bs)
+    hostnames = hostnames or [ 'client-%d' % i for i in range(clients) ]
+    S['client_stats'] = [ fio_job(rng, rw, bs, clients, jobname, hostname=H, density=density,
+                                  latency_scale=latency_scale, steadystate=steadystate)
+                          for H in hostnames ]
+    total = fio_job(rng, rw, bs, clients, jobname='All clients', density=density, latency_scale=latency_scale)
+    S['client_stats'].append(total)
+    return S
+
+####################################################################################################
+# Result trees
+
+def write_json(path, S):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump(S, f)
+
+
+def write_client_sweep(results_path, scenario, rw, clients, block_sizes=SWEEP_BS, runs=1,
+                       density=600, seed=0, latency_scale=1.0):
+    ''' Write the result tree of a block size sweep in the layout produced
+        by run_fio.sh: <scenario>-<rw>/<clients>/<client>/<bs>.json, with a
+        directory for each client of each run.  Returns the directory of
+        the client count. '''
+
+    rng = np.random.default_rng(seed)
+    scenario_dir = os.path.join(str(results_path), '%s-%s' % (scenario, rw), str(clients))
+    for run in range(runs):
+        for client in range(clients):
+            client_dir = os.path.join(scenario_dir, '%s-%s-%d-%d-%d' % (scenario, rw, clients, run, client))
+            for bs in block_sizes:
+                write_json(os.path.join(client_dir, '%d.json' % bs), fio_result(rng, rw, bs, clients, density, latency_scale))
+    return scenario_dir
+
+
+def write_group_sweep(results_path, scenario, rw, client_counts, block_sizes=SWEEP_BS, runs=1,
+                      density=600, seed=0, latency_scale=1.0):
+    ''' Write group-reporting results for each client count and block size,
+        as <scenario>-<rw>/<run>/<clients>-<bs>.json, with the scenario as
+        the job name.  Returns the directory of all the results. '''
+
+    rng = np.random.default_rng(seed)
+    scenario_dir = os.path.join(str(results_path), '%s-%s' % (scenario, rw))
+    for run in range(runs):
+        for clients in client_counts:
+            for bs in block_sizes:
+                write_json(os.path.join(scenario_dir, str(run), '%d-%d.json' % (clients, bs)),
+                           fio_group_result(rng, rw, bs, clients, scenario, density, latency_scale))
+    return scenario_dir
+
+
+def write_fio_logs(result_path, kind, rng, mean, numjobs=4, runtime=30, interval_ms=500, ddir=0, bs=4096):
+    ''' Write a fio log of the given kind for each job of a result, as
+        written by fio with --write_<kind>_log and log_avg_msec=interval_ms:
+        an entry per interval per job, values scattered around mean / numjobs.
+        Returns the paths written. '''
+
+    prefix = os.path.splitext(str(result_path))[0]
+    time = np.arange(interval_ms, runtime * 1000 + 1, interval_ms)
+    paths = []
+    for job in range(1, numjobs + 1):
+        value = np.maximum(rng.normal(mean / numjobs, mean / numjobs * 0.1, len(time)), 0).astype(np.int64)
+        path = '%s_%s.%d.log' % (prefix, kind, job)
+        with open(path, 'w') as f:
+            f.writelines('%d, %d, %d, %d\n' % (T, V, ddir, bs) for T, V in zip(time, value))
+        paths.append(path)
+    return paths
+
+####################################################################################################
+# A stand-in for fio
+
+def stub_fio(argv, stdout=None):
+    ''' Stand in for fio run as a client of fio servers, as
+        fio --output-format=json+ --client=<host list file> <job file>,
+        writing a synthetic group-reporting result for the hosts listed,
+        with the I/O mode, size and job name of the job file.  A job run
+        with a steadystate criterion reaches it at I/O sizes of 4 KiB and
+        up.  Used to test
+        fiotools.Driver without fio servers:
+        python -m fiotools.Synthetic --client=hosts job.fio '''
+
+    parser = argparse.ArgumentParser(prog='fio')
+    parser.add_argument('--client', action='append', default=[])
+    parser.add_argument('--output-format', default='normal')
+    parser.add_argument('jobfiles', nargs='*')
+    args, unknown = parser.parse_known_args(argv)
+    stdout = stdout or sys.stdout
+
+    hosts = []
+    for C in args.client:
+        if os.path.isfile(C):
+            with open(C) as f:
+                hosts += [ L.strip() for L in f if L.strip() ]
+        else:
+            hosts.append(C)
+    with open(args.jobfiles[0]) as f:
+        job = f.read()
+    options = dict(re.findall(r'^\s*(\w+)\s*=\s*(\S+)\s*$', job, re.M))
+    jobname = re.findall(r'^\[([^\]]+)\]', job, re.M)[-1]
+    bs = int(options.get('bs', options.get('blocksize', 4096)))
+    rng = np.random.default_rng(bs + len(hosts))
+    steadystate = (options['steadystate'], bs >= 4096) if 'steadystate' in options else None
+    # fio reports each server it connects to before the results
+    for H in hosts:
+        stdout.write("hostname=%s, be=0, 64-bit, os=Linux, arch=x86-64, fio=fio-3.1, flags=1\n" % H.split(',')[0])
+    S = fio_group_result(rng, options.get('rw', 'read'), bs, len(hosts), jobname, density=50,
+                         hostnames=[ H.split(',')[0] for H in hosts ], steadystate=steadystate)
+    json.dump(S, stdout)
+    stdout.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(stub_fio(sys.argv[1:]))
@@ -1,14 +1,21 @@
-# .config/matplotlib/matplotlibrc line backend : Agg
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib import pyplot as plt
+# Importing fiotools loads only what parsing and aggregation need.
+# pandas is loaded when a grid is first populated, and matplotlib (with
+# the Agg backend) when a figure is first drawn: see fiotools.Plot.pyplot.
 from pathlib2 import Path
-import pandas as pd
 import numpy as np
 import json
 import math
 import os
-import pdb
+import time
+
+from fiotools.Archive import result_stat
+from fiotools.Cache import load_fio_files
+from fiotools.Discovery import find_results
+from fiotools.Histogram import PlatHistogram
+from fiotools.Instrument import profiled
+from fiotools.Plot import OUTPUT_FORMATS, PlotSpec, pyplot, render_figure, render_figures
+from fiotools.Pyramid import PYRAMID_MIN_ROWS, GridPyramid
+from fiotools.SteadyState import count_unconverged
 
 
 class ClatGrid:
@@ -16,6 +23,9 @@ class ClatGrid:
     timescale = 'us'
     logscale = False
     tolerance = 0.1
+    # The latency grid is computed with 2**refine times the rows requested,
+    # and coarsened from there (see fiotools.Pyramid)
+    refine = 3
     ts_dict = {
         'ns': {'divider': 1, 'label': 'n s'},
         'us': {'divider': 10**3, 'label': '\mu s'},
@@ -28,8 +38,20 @@ class ClatGrid:
 
     def __init__(self, input_dirs, output_dir, granularity, scenario, mode,
                     force=False, skip_bs=[], logscale=False, timescale='us',
-                    bytescale='MB', min_bs=1, max_bs=65536, clients=32, verbose=False, plot=True):
-        ''' Initialisation function. '''
+                    bytescale='MB', min_bs=1, max_bs=None, clients=32, verbose=False, plot=True,
+                    bs_list=None, cache=True, rebuild_cache=False, jobs=1,
+                    output_format='png', heatmap='auto', watch=False, fio_index=None, render=True, keep_going=False,
+                    include=None, exclude=None):
+        ''' Initialisation function.
+            With watch set, existing output is kept rather than replaced,
+            and the grid can be updated incrementally with poll().
+            Given a fio_index of results already read, keyed by (test
+            clients, I/O size), the input directories are not read.
+            With render False, plot specs are built but left in plot_specs
+            for the caller to render.  With keep_going (implied by watch), an
+            I/O size that fails its checks is reported and skipped.
+            Result files are found by the include and exclude globs given
+            (see fiotools.Discovery). '''
 
         # Read input arguments
         self.grid_y = granularity
@@ -43,8 +65,20 @@ class ClatGrid:
         self.scenario = scenario
         self.rw = mode
         self.verbose = verbose
+        self.cache = cache
+        self.rebuild_cache = rebuild_cache
+        self.jobs = jobs
+        self.output_format = output_format
+        self.heatmap = heatmap
+        self.plot = plot
+        self.render = render
+        self.bs_request = bs_list
+        self.include = include
+        self.exclude = exclude
 
         # Infer these from input arguments
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unsupported output format %s: expected one of %s" % (output_format, ', '.join(OUTPUT_FORMATS)))
         self.num_clients = clients
         self.mode = "write" if "write" in mode else "read"
         self.ts_divider = self.ts_dict[timescale]['divider']
@@ -53,170 +87,240 @@ class ClatGrid:
         self.bs_label = self.bs_dict[bytescale]['label']
 
         # Initialise these
+        self.fio_index = {}     # fio results indexed by (test clients, I/O size)
+        self.fio_files = {}     # Ingested files: path -> (size, mtime, index key, fio result)
+        self.known_stats = {}   # path -> (size, mtime) of files listed in manifests
+        self.reset_grid()
+
+        # Function calls
+        self.ensure_output_dir(force, keep=watch)
+        if fio_index is None:
+            self.index_results()
+        else:
+            self.fio_index = fio_index
+        self.bs_list = self.select_bs(bs_list)
+        self.process(self.bs_list, keep_going=watch or keep_going)
+
+    def process(self, bs_list, keep_going=False):
+        ''' Populate, grid and emit the CSVs and plots for each I/O size.
+            Without plots the latency grid is written as JSON instead.
+            With keep_going, an I/O size that fails its checks is reported
+            and skipped rather than raising. '''
+
+        self.plot_specs = []
+        for bs in bs_list:
+            self.reset_grid()
+            try:
+                if self.populate_for_clients(bs):
+                    self.aggregate_and_normalise()
+                    self.write_pyramid(bs)
+                    if self.plot:
+                        self.plot_specs += self.specs_for_clients(bs)
+                    else:
+                        self.write_grid(bs)
+                    #self.plot_cf()
+            except ValueError as E:
+                if not keep_going:
+                    raise
+                print( "I/O size %d: not updated: %s" % (bs, E) )
+        if self.plot and self.render:
+            self.render_times = render_figures(self.plot_specs, self.jobs, self.verbose)
+
+    def reset_grid(self):
+        ''' Clear the accumulated data and grid boundaries before
+            populating the grid for a new I/O size. '''
+
         self.min_X = np.inf
         self.max_X = 0
         self.min_Y = np.inf
         self.max_Y = 0.
-        self.io_data = {}       # Timing data as a function of controlled parameter
-        self.io_density = {}
+        self.io_data = {}       # Merged latency histograms as a function of controlled parameter
+        self.io_cdf = {}        # Cumulative latency distributions for each column
         self.iops_data = {}     # Total IOPS as a function of controlled parameter
 
-        # Function calls
-        self.ensure_output_dir(force)
-        if self.populate_for_clients(1024):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(1024)
-                self.plot_bw_for_clients(1024)
-                self.plot_iops_for_clients(1024)
-                #self.plot_cf()
-
-        self.ensure_output_dir(force)
-        if self.populate_for_clients(4096):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(4096)
-                self.plot_bw_for_clients(4096)
-                self.plot_iops_for_clients(4096)
-                #self.plot_cf()
-
-        if self.populate_for_clients(65536):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(65536)
-                self.plot_bw_for_clients(65536)
-                self.plot_iops_for_clients(65536)
-                #self.plot_cf()
-
-        if self.populate_for_clients(262144):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(262144)
-                self.plot_bw_for_clients(262144)
-                self.plot_iops_for_clients(262144)
-                #self.plot_cf()
-
-        if self.populate_for_clients(1048576):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(1048576)
-                self.plot_bw_for_clients(1048576)
-                self.plot_iops_for_clients(1048576)
-                #self.plot_cf()
-
-        if self.populate_for_clients(2097152):
-            self.aggregate_and_normalise()
-            if plot:
-                self.plot_cl_for_clients(2097152)
-                self.plot_bw_for_clients(2097152)
-                self.plot_iops_for_clients(2097152)
-                #self.plot_cf()
-
-    def add_series(self, x, iops_total, clat_data):
+    @profiled('ClatGrid.index_results')
+    def index_results(self):
+        ''' Read every input directory once, indexing the fio results by
+            (test clients, I/O size).  All populate and plot stages are
+            served from this index. '''
+
+        self.ingest(self.scan_results(), self.rebuild_cache, complete=True)
+        if self.verbose:
+            print( "Indexed %d fio results for %d (clients, I/O size) configurations" %
+                   (sum(len(x) for x in self.fio_index.values()), len(self.fio_index)) )
+
+    def scan_results(self):
+        ''' List the result files in the input directories that are new,
+            or have changed, since they were last ingested. '''
+
+        fio_file_list = []
+        for input_dir in self.input_dirs:
+            if self.verbose or not self.fio_files:
+                print( "Scanning for fio data in %s" % input_dir )
+            for fio_file, stat_key in find_fio_files(input_dir, self.include, self.exclude):
+                if stat_key is not None:
+                    self.known_stats[fio_file] = stat_key
+                else:
+                    try:
+                        stat_key = result_stat(fio_file)
+                    except OSError:
+                        continue
+                ingested = self.fio_files.get(fio_file)
+                if ingested is None or ingested[:2] != stat_key:
+                    fio_file_list.append(fio_file)
+        return fio_file_list
+
+    def ingest(self, fio_file_list, rebuild_cache=False, complete=False):
+        ''' Add fio result files to the index, replacing the results of any
+            file ingested before.  Returns the set of index keys affected.
+            complete is set when the files are every result found in their
+            directories (see fiotools.Cache.load_fio_files). '''
+
+        keys = set()
+        for fio_file, fio_run_data, error in load_fio_files(fio_file_list, self.cache, rebuild_cache, jobs=self.jobs,
+                                                            stats=self.known_stats, complete=complete):
+            ingested = self.fio_files.pop(fio_file, None)
+            if ingested is not None and ingested[2] is not None:
+                self.fio_index[ingested[2]].remove(ingested[3])
+                if not self.fio_index[ingested[2]]:
+                    del self.fio_index[ingested[2]]
+                keys.add(ingested[2])
+            key = index_fio_result(fio_file, fio_run_data, error)
+            if key is not None:
+                self.fio_index.setdefault(key, []).append(fio_run_data)
+                keys.add(key)
+            # Files which could not be parsed may still be being written,
+            # and are looked at again when they next change.  Files removed
+            # since they were found are looked for again at the next scan.
+            try:
+                stat_key = self.known_stats.get(fio_file) or result_stat(fio_file)
+            except OSError:
+                continue
+            self.fio_files[fio_file] = stat_key + (key, fio_run_data)
+        return keys
+
+    @profiled('ClatGrid.poll')
+    def poll(self):
+        ''' Ingest result files that are new or changed since the last scan
+            and emit the CSVs and plots again for the I/O sizes affected.
+            Returns the list of I/O sizes updated. '''
+
+        keys = self.ingest(self.scan_results())
+        self.bs_list = self.select_bs(self.bs_request)
+        bs_list = [ bs for bs in self.bs_list if any(key[1] == bs for key in keys) ]
+        if bs_list:
+            self.process(bs_list, keep_going=True)
+        return bs_list
+
+    def watch(self, interval=30.0):
+        ''' Poll the input directories every interval seconds, until
+            interrupted, updating the output as results arrive. '''
+
+        print( "Watching %s for new fio results every %g s, interrupt to stop" %
+               (', '.join(str(x) for x in self.input_dirs), interval) )
+        try:
+            while True:
+                time.sleep(interval)
+                bs_list = self.poll()
+                if bs_list:
+                    print( "Updated I/O sizes %s" % ', '.join(str(bs) for bs in bs_list) )
+        except KeyboardInterrupt:
+            pass
+
+    def index_bs(self):
+        ''' Return the sorted list of I/O sizes found in the index. '''
+        return sorted(set(bs for num_clients, bs in self.fio_index))
+
+    def index_clients(self, bs=None):
+        ''' Return the sorted list of client counts found in the index,
+            optionally only those with results for the given I/O size. '''
+        return sorted(set(c for c, c_bs in self.fio_index if bs is None or c_bs == bs))
+
+    def select_bs(self, bs_list=None):
+        ''' Determine the I/O sizes to process. By default this is every
+            I/O size present in the input data, within the min/max bounds
+            (max_bs None for no upper bound) and excluding any block sizes
+            to skip. '''
+
+        if bs_list is None:
+            bs_list = [bs for bs in self.index_bs()
+                       if self.min_bs <= bs and (self.max_bs is None or bs <= self.max_bs)]
+        return [bs for bs in bs_list if bs not in self.skip_bs]
+
+    @profiled('ClatGrid.add_series')
+    def add_series(self, x, iops_total, clat_hist):
         ''' Each series is indexed by the controlled parameter x (I/O size or test clients)
             and the test mode.
             The y value is a histogram bin for I/O completion latency.
             The z value is the number of samples in this histogram bin.
-            Multiple client series are stored independently at this stage
-            and will be gridded, aggregated and normalised later on. '''
+            Multiple client series are merged exactly on fio's latency buckets
+            and will be gridded and normalised later on. '''
 
         # Paranoia: Check the iops_total matches the sum of all bins
-        if sum(clat_data.values()) != iops_total:
-            import pdb; pdb.set_trace()
+        if clat_hist.total() != iops_total:
             raise ValueError(
                 "I/O size %d: sum of histogram bins is %d, expected %d" %
-                (2**x, sum(clat_data.values()), iops_total))
-        # Construct a dict of floating-point IO latencies
-        io_data = {}
-        for y_str, z_str in iter(clat_data.items()):
-            y = float(y_str)/self.ts_divider
-            z = float(z_str)
-            io_data[y] = z
-            self.min_Y = min(self.min_Y, y)
-            self.max_Y = max(self.max_Y, y)
+                (2**x, clat_hist.total(), iops_total))
         # Update grid-boundary metrics
+        if len(clat_hist):
+            self.min_Y = min(self.min_Y, clat_hist.min()/self.ts_divider)
+            self.max_Y = max(self.max_Y, clat_hist.max()/self.ts_divider)
         self.min_X = min(self.min_X, x)
         self.max_X = max(self.max_X, x)
-        # Add the data to any existing data sets for this blocksize
-        # Each entry for X is a dict of { Y: Z }
-        self.io_data[x] = self.io_data.get(x, []) + [io_data]
+        # Merge the data into any existing data for this column
+        self.io_data.setdefault(x, PlatHistogram()).add(clat_hist)
         print( "Column %d - IOPS total %d+%d" % (x, self.iops_data.get(x, 0), iops_total) )
         self.iops_data[x] = self.iops_data.get(x, 0) + iops_total
 
 
+    @profiled('ClatGrid.aggregate_and_normalise')
     def aggregate_and_normalise(self):
         ''' We may have sampled multiple results per blocksize.
-            These are stored in io_data[X] as lists of {Y:Z} dicts
+            These are merged in io_data[X] as a PlatHistogram.
             Generate a weighted normalisation across all readings.
             This must be done once all results have been added. '''
 
         # For each blocksize
-        for X, X_results in iter(self.io_data.items()):
+        for X, plat_hist in iter(self.io_data.items()):
             max_X_Z = 0.0
             Z_total = float(self.iops_data[X])
-            io_density = []
-            # For each fio result in this blocksize
-            for YZ_data in X_results:
-                prev_Y = 0
-                # For each datapoint in the result
-                for Y in sorted(YZ_data.keys()):
-                    # Process the IOs in order to construct
-                    # IO frequency densities
-                    Z_norm = YZ_data[Y] / Z_total
-                    delta_Y = Y - prev_Y
-                    io_density_Y = Z_norm / delta_Y
-                    io_density += [{'lower': prev_Y,
-                                    'upper': Y,
-                                    'density': io_density_Y}]
-                    prev_Y = Y
-                    max_X_Z = max(Z_norm, max_X_Z)
-
-            # The generated list of I/O frequency density ranges
+            clat_hist = plat_hist.histogram()
+            io_cdf = [histogram_cdf(clat_hist.values / self.ts_divider, clat_hist.counts, Z_total)]
+            if len(clat_hist):
+                max_X_Z = clat_hist.normalise(Z_total).max()
+
+            # The generated list of cumulative I/O distributions
             # is suitable for resampling on a regularised grid
-            self.io_density[X] = io_density
+            self.io_cdf[X] = io_cdf
             print( "Column %d normalised max %f" % (X, max_X_Z) )
 
         # Now, reinterpolate the data to a regular grid spacing
         # to enable aggregation and plotting.
-        # Make coordinate arrays.
+        # Make coordinate arrays: the finest grid has 2**refine rows for
+        # each row requested, which are summed back to the granularity.
         self.grid_x = self.max_X - self.min_X + 1
         self.grid_X = np.linspace(self.min_X - 0.5,
                                   self.max_X + 0.5,
                                   self.grid_x + 1)
+        fine_y = (self.grid_y - 1) * 2**self.refine + 1
         if self.logscale:
-            self.grid_Y = np.logspace(np.log10(self.min_Y),
-                                      np.log10(self.max_Y),
-                                      self.grid_y)
+            fine_Y = np.logspace(np.log10(self.min_Y),
+                                 np.log10(self.max_Y),
+                                 fine_y)
         else:
-            self.grid_Y = np.linspace(self.min_Y, self.max_Y, self.grid_y)
-        self.grid = grid = np.zeros((self.grid_y, self.grid_x), dtype=np.dtype('double'))
+            fine_Y = np.linspace(self.min_Y, self.max_Y, fine_y)
+        mass = np.zeros((fine_y - 1, self.grid_x), dtype=np.dtype('double'))
 
-        # Perform the gridding interpolation
-        for X, io_density in iter(self.io_density.items()):
+        # Perform the gridding interpolation: the probability mass within
+        # each grid row is the difference of the cumulative distribution
+        # at the row boundaries.
+        for X, io_cdf in iter(self.io_cdf.items()):
             col = X - self.min_X
-            io_density_check = 0.0          # Paranoia
-            grid_check = 0.0                # Paranoia
-            grid_y_lower = 0.0
-            for D in io_density:
-                # for row in range(int(math.floor(D['lower'] / bin_y)), nrow):
-                for row, grid_y_lower in enumerate(self.grid_Y[:-1]):
-                    grid_y_upper = self.grid_Y[row+1]
-                    # Non-overlap: below or above?
-                    if grid_y_upper < D['lower']:
-                        continue
-                    if grid_y_lower > D['upper']:
-                        break
-                    bin_y = grid_y_upper - grid_y_lower
-                    # Determine the extent of overlap
-                    overlap_lower = max(grid_y_lower, D['lower'])
-                    overlap_upper = min(grid_y_upper, D['upper'])
-                    overlap_range = overlap_upper - overlap_lower
-                    grid[row, col] += D['density'] * overlap_range / bin_y
-                    # Paranoia
-                    grid_check += D['density'] * overlap_range
-                # Paranoia
-                io_density_check += D['density']*(D['upper'] - D['lower'])
+            grid_mass = regrid_cdf(io_cdf, fine_Y)
+            mass[:, col] = grid_mass
             # Paranoia
+            io_density_check = sum(cdf[-1] for knots, cdf in io_cdf)
+            grid_check = grid_mass.sum()
             if self.verbose:
                 print( "blocksize: %s cumulative density %f cumulative grid %f" % (2**X, io_density_check,grid_check) )
             if (abs(io_density_check - 1) > self.tolerance or
@@ -225,101 +329,132 @@ class ClatGrid:
                     "CHECK FAILED: blocksize %d cumulative density %f cumulative grid %f"
                     % (2**X, io_density_check, grid_check))
 
-        # Normalize grid
-        grid /= grid.max()
-        # Set empty bins to NaN to ensure they do not get plotted
-        self.grid[grid == 0.0] = np.nan
+        # Coarser levels sum the rows of the finest exactly: the level of the
+        # granularity requested is gridded and normalised for plotting, with
+        # empty bins set to NaN to ensure they do not get plotted
+        self.pyramid = GridPyramid.build(self.grid_X, fine_Y, mass, min_rows=min(self.grid_y - 1, PYRAMID_MIN_ROWS))
+        self.grid_Y, grid = self.pyramid.grid(self.refine)
+        self.grid = np.vstack([grid, np.full((1, self.grid_x), np.nan)])
         #self.cfdf = pd.DataFrame(self.grid, columns=sorted(set(self.cldf.index)), index=self.grid_Y)
         #self.cfdf.to_csv(self.output_dir/(self.mode+'-commit-latency-freq-dist.csv'))
 
-    def plot_bw(self, figsize=(10, 8), fig=None, ax=None, ylim=None, kind='stacked', unit=''):
+    def write_grid(self, bs):
+        ''' Write the normalised latency grid for a constant I/O size as JSON:
+            the cell edges in test clients and latency, and the cell values
+            by latency row, with empty cells as null. '''
+
+        grid = self.grid[:-1]
+        grid_json = {
+            'bs': bs,
+            'x': 'test_clients',
+            'x_edges': self.grid_X.tolist(),
+            'y_edges': self.grid_Y.tolist(),
+            'timescale': self.timescale,
+            'grid': [ [ None if np.isnan(Z) else Z for Z in row ] for row in grid.tolist() ],
+        }
+        with open(str(self.output_dir/('%s-commit-latency-grid-by-client-%d.json' % (self.mode, bs))), 'w') as f:
+            json.dump(grid_json, f)
+
+    def write_pyramid(self, bs):
+        ''' Write the latency grid for a constant I/O size at each of its
+            resolutions, with the latency percentiles and labelling of the
+            heatmap, so that it can be drawn again at any granularity or
+            over any latency window (see fiotools.Pyramid). '''
+
+        self.pyramid.percentiles = self.pctdf
+        self.pyramid.meta = {
+            'bs': bs, 'x': 'test_clients', 'scenario': self.scenario, 'mode': self.mode, 'rw': self.rw,
+            'timescale': self.timescale, 'ts_label': self.ts_label, 'logscale': bool(self.logscale),
+            'rows': self.grid_y - 1,
+        }
+        self.pyramid.save(self.output_dir/('%s-commit-latency-pyramid-by-client-%d.npz' % (self.mode, bs)))
+
+    def bw_spec(self, figsize=(10, 8), ylim=None, kind='stacked', unit=''):
         ylim = [self.min_Y, self.max_Y]
-        if fig == None or ax == None:
-            fig, ax = plt.subplots(figsize=figsize)
-        if kind == 'boxplot':
-            self.bwdf.apply(lambda x: x/self.bs_divider).boxplot(ax=ax)
-        elif kind == 'stacked':
-            ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, len(self.bwdf))])
-            self.bwdf.apply(lambda x: x/self.bs_divider).T.plot(ax=ax, stacked=True, legend=False, grid=True, ylim=ylim, linewidth=1)
-        ax.set_title('Block size vs %s bandwidth - %s - %s - %s client(s)' % (self.mode, self.scenario, self.rw, self.num_clients))
-        #ax.set_xticks(list(self.bwdf.columns))
-        ax.set_xticks(self.bwdf.columns)
-        ax.set_xlabel('Block size - $2^n$')
-        ax.set_ylabel('%s bandwidth ($%s$)' % (self.mode.capitalize(), self.bs_label))
-        fig.savefig(str(self.output_dir/('%s-blocksize-vs-bandwidth.png' % kind)))
-        return fig, ax
-
-    def plot_bw_for_clients(self, bs, figsize=(10, 8), fig=None, ax=None, ylim=None, kind='stacked', unit=''):
-        if fig == None or ax == None:
-            fig, ax = plt.subplots(figsize=figsize)
-        if kind == 'boxplot':
-            self.bwdf.apply(lambda x: x/self.bs_divider).boxplot(ax=ax)
-        elif kind == 'stacked':
-            ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, len(self.bwdf))])
-            self.bwdf.apply(lambda x: x/self.bs_divider).T.plot(ax=ax, stacked=True, legend=False, grid=True, ylim=ylim, linewidth=1)
-        ax.set_title('Number of clients vs %s bandwidth - %s - %d %s' % (self.mode, self.scenario, bs, self.rw))
-        ax.set_xticks(sorted(set(self.bwdf.index)))
-        ax.set_xlabel('Test clients')
-        ax.set_ylabel('%s bandwidth ($%s$)' % (self.mode.capitalize(), self.bs_label))
-        fig.savefig(str(self.output_dir/('%s-test-clients-vs-bandwidth-%d.png' % (kind,bs))))
-        return fig, ax
-
-    def plot_iops_for_clients(self, bs, figsize=(10, 8), fig=None, ax=None, ylim=None, kind='stacked', unit=''):
-        if fig == None or ax == None:
-            fig, ax = plt.subplots(figsize=figsize)
-        if kind == 'boxplot':
-            self.iopsdf.boxplot(ax=ax)
-        elif kind == 'stacked':
-            ax.set_prop_cycle('color', [plt.cm.jet(i) for i in np.linspace(0, 1, len(self.iopsdf))])
-            self.iopsdf.T.plot(ax=ax, stacked=True, legend=False, grid=True, ylim=ylim, linewidth=1)
-        ax.set_title('Number of clients vs %s IOPS - %s - %d %s' % (self.mode, self.scenario, bs, self.rw))
-        ax.set_xticks(sorted(set(self.iopsdf.index)))
-        ax.set_xlabel('Test clients')
-        ax.set_ylabel('%s IOPS' % self.mode.capitalize())
-        fig.savefig(str(self.output_dir/('%s-test-clients-vs-iops-%d.png' % (kind,bs))))
-        return fig, ax
-
-
-    def plot_cl(self, figsize=(10,8), fig=None, ax=None, percentiles=[50.0,95.0,99.0,99.99], xlim=None, ylim=None, cmap='gist_heat'):
-        if fig == None or ax == None:
-            fig, ax = plt.subplots(figsize=figsize)
+        return PlotSpec(kind, self.output_dir/('%s-blocksize-vs-bandwidth.%s' % (kind, self.output_format)),
+                        self.bwdf.apply(lambda x: x/self.bs_divider),
+                        title='Block size vs %s bandwidth - %s - %s - %s client(s)' % (self.mode, self.scenario, self.rw, self.num_clients),
+                        xlabel='Block size - $2^n$',
+                        ylabel='%s bandwidth ($%s$)' % (self.mode.capitalize(), self.bs_label),
+                        xticks=list(self.bwdf.columns), ylim=ylim, figsize=figsize)
+
+    def bw_spec_for_clients(self, bs, figsize=(10, 8), ylim=None, kind='stacked', unit=''):
+        return PlotSpec(kind, self.output_dir/('%s-test-clients-vs-bandwidth-%d.%s' % (kind, bs, self.output_format)),
+                        self.bwdf.apply(lambda x: x/self.bs_divider),
+                        title='Number of clients vs %s bandwidth - %s - %d %s' % (self.mode, self.scenario, bs, self.rw),
+                        xlabel='Test clients',
+                        ylabel='%s bandwidth ($%s$)' % (self.mode.capitalize(), self.bs_label),
+                        xticks=sorted(set(self.bwdf.index)), ylim=ylim, figsize=figsize)
+
+    def iops_spec_for_clients(self, bs, figsize=(10, 8), ylim=None, kind='stacked', unit=''):
+        return PlotSpec(kind, self.output_dir/('%s-test-clients-vs-iops-%d.%s' % (kind, bs, self.output_format)),
+                        self.iopsdf,
+                        title='Number of clients vs %s IOPS - %s - %d %s' % (self.mode, self.scenario, bs, self.rw),
+                        xlabel='Test clients',
+                        ylabel='%s IOPS' % self.mode.capitalize(),
+                        xticks=sorted(set(self.iopsdf.index)), ylim=ylim, figsize=figsize)
+
+    def cl_spec(self, figsize=(10,8), percentiles=[50.0,95.0,99.0,99.99], xlim=None, ylim=None, cmap='gist_heat'):
         if xlim == None:
             xlim = [self.min_X, self.max_X]
         if ylim == None:
             ylim = [max(1, self.min_Y), self.max_Y]
-        ax.pcolor(self.grid_X, self.grid_Y, self.grid, cmap=cmap, vmin=0.0, vmax=1.0)
-        self.cldf[percentiles] \
-            .groupby(self.cldf.index).mean() \
-            .plot(ax=ax, xlim=xlim, ylim=ylim, linewidth=1, style='-', logy=self.logscale)
-        ax.legend(title='percentiles')
-        ax.set_title('Block size vs %s commit latency - %s - %s - %s client(s)' % (self.mode, self.scenario, self.rw, self.num_clients))
-        ax.set_xticks(sorted(set(self.cldf.index)))
-        ax.set_xlabel('Block size - $2^n$')
-        ax.set_ylabel('%s commit latency - $%s$' % (self.mode.capitalize(), self.ts_label))
-        fig.savefig(str(self.output_dir/'blocksize-vs-commit-latency.png'))
-        return fig, ax
-
-    def plot_cl_for_clients(self, bs, figsize=(10,8), fig=None, ax=None, percentiles=[50.0,95.0,99.0,99.99], xlim=None, ylim=None, cmap='gist_heat'):
-        if fig == None or ax == None:
-            fig, ax = plt.subplots(figsize=figsize)
+        return PlotSpec('heatmap', self.output_dir/('blocksize-vs-commit-latency.%s' % self.output_format),
+                        self.pctdf[percentiles],
+                        title='Block size vs %s commit latency - %s - %s - %s client(s)' % (self.mode, self.scenario, self.rw, self.num_clients),
+                        xlabel='Block size - $2^n$',
+                        ylabel='%s commit latency - $%s$' % (self.mode.capitalize(), self.ts_label),
+                        xticks=sorted(set(self.cldf.index)), xlim=xlim, ylim=ylim, figsize=figsize,
+                        grid_X=self.grid_X, grid_Y=self.grid_Y, grid=self.grid[:-1], cmap=cmap,
+                        heatmap=self.heatmap, logy=self.logscale, legend_title='percentiles')
+
+    def cl_spec_for_clients(self, bs, figsize=(10,8), percentiles=[50.0,95.0,99.0,99.99], xlim=None, ylim=None, cmap='gist_heat'):
         if xlim == None:
             xlim = [self.min_X - 0.5, self.max_X + 0.5]
         if ylim == None:
             ylim = [max(1, self.min_Y), self.max_Y]
-        ax.pcolor(self.grid_X, self.grid_Y, self.grid, cmap=cmap, vmin=0.0, vmax=1.0)
-        self.cldf[percentiles] \
-            .groupby(self.cldf.index).mean() \
-            .plot(ax=ax, xlim=xlim, ylim=ylim, linewidth=1, style='-', logy=self.logscale)
-        ax.legend(title='percentiles')
-        ax.set_title('Number of clients vs %s commit latency - %s - %d %s' % (self.mode, self.scenario, bs, self.rw))
-        ax.set_xticks(sorted(set(self.cldf.index)))
-        ax.set_xlabel('Test clients')
-        ax.set_ylabel('%s commit latency - $%s$' % (self.mode.capitalize(), self.ts_label))
-        fig.savefig(str(self.output_dir/('test-clients-vs-commit-latency-%d.png' % bs)))
-        return fig, ax
-
+        return PlotSpec('heatmap', self.output_dir/('test-clients-vs-commit-latency-%d.%s' % (bs, self.output_format)),
+                        self.pctdf[percentiles],
+                        title='Number of clients vs %s commit latency - %s - %d %s' % (self.mode, self.scenario, bs, self.rw),
+                        xlabel='Test clients',
+                        ylabel='%s commit latency - $%s$' % (self.mode.capitalize(), self.ts_label),
+                        xticks=sorted(set(self.cldf.index)), xlim=xlim, ylim=ylim, figsize=figsize,
+                        grid_X=self.grid_X, grid_Y=self.grid_Y, grid=self.grid[:-1], cmap=cmap,
+                        heatmap=self.heatmap, logy=self.logscale, legend_title='percentiles')
+
+    @profiled('ClatGrid.specs_for_clients')
+    def specs_for_clients(self, bs):
+        ''' The plot specs for a constant I/O size, once populated and normalised. '''
+        return [self.cl_spec_for_clients(bs), self.bw_spec_for_clients(bs), self.iops_spec_for_clients(bs)]
+
+    # Each plot method renders its figure immediately, returning the render time.
+    # When fig and ax are given the figure is drawn onto them and left open.
+
+    @profiled('ClatGrid.plot_bw')
+    def plot_bw(self, fig=None, ax=None, **kwargs):
+        return render_figure(self.bw_spec(**kwargs), fig, ax)
+
+    @profiled('ClatGrid.plot_bw_for_clients')
+    def plot_bw_for_clients(self, bs, fig=None, ax=None, **kwargs):
+        return render_figure(self.bw_spec_for_clients(bs, **kwargs), fig, ax)
+
+    @profiled('ClatGrid.plot_iops_for_clients')
+    def plot_iops_for_clients(self, bs, fig=None, ax=None, **kwargs):
+        return render_figure(self.iops_spec_for_clients(bs, **kwargs), fig, ax)
+
+    @profiled('ClatGrid.plot_cl')
+    def plot_cl(self, fig=None, ax=None, **kwargs):
+        return render_figure(self.cl_spec(**kwargs), fig, ax)
+
+    @profiled('ClatGrid.plot_cl_for_clients')
+    def plot_cl_for_clients(self, bs, fig=None, ax=None, **kwargs):
+        return render_figure(self.cl_spec_for_clients(bs, **kwargs), fig, ax)
+
+    @profiled('ClatGrid.plot_cf')
     def plot_cf(self, figsize=(10,8), fig=None, ax=None, xlim=None, ylim=None):
-        if fig == None or ax == None:
+        plt = pyplot()
+        owned = fig == None or ax == None
+        if owned:
             fig, ax = plt.subplots(figsize=figsize)
         legend = sorted(set(self.cfdf.T.index))
         if ylim == None:
@@ -331,120 +466,134 @@ class ClatGrid:
         ax.set_title('Distribution of %s commit latency - %s - %s - %s client(s)' % (self.mode, self.scenario, self.rw, self.num_clients))
         ax.set_xlabel('Relative frequency')
         ax.set_ylabel('%s commit latency - ($%s$)' % (self.mode.capitalize(), self.ts_label))
-        fig.savefig(str(self.output_dir/'commit-latency-freq-dist.png'))
+        fig.savefig(str(self.output_dir/('commit-latency-freq-dist.%s' % self.output_format)))
+        if owned:
+            plt.close(fig)
         return fig, ax
 
+    @profiled('ClatGrid.populate_for_bs')
     def populate_for_bs(self):
+        import pandas as pd
         # For each blocksize found, emit data from each listed job
         # FIXME: need to incorporate hostname and dataset name in the results
         # Emit bandwidth data points in column format
         bw = list()
         cl = list()
-        for input_dir in self.input_dirs:
-            print( "Scanning for fio data in %s" % input_dir )
-            fio_file_list = get_fio_file_list(input_dir)
-            fio_results = get_fio_results(fio_file_list)
-            if self.num_clients not in fio_results:
-                print( "No data for %d-client config found in %s" % (self.num_clients, input_dir) )
+        for bs in self.index_bs():
+            if bs in self.skip_bs or bs < self.min_bs or (self.max_bs is not None and bs > self.max_bs):
+                continue
+            if (self.num_clients, bs) not in self.fio_index:
                 continue
-            bs_list = sorted(fio_results[self.num_clients].keys())
-            for bs in bs_list:
-                if bs in self.skip_bs or bs < self.min_bs or bs > self.max_bs:
-                    continue
-
-                log2_bs = int(math.log(bs,2))
-                for bs_job in fio_results[self.num_clients][bs][0]['jobs']:
-                    if bs_job['error'] > 0:
-                        print( "I/O size %8d, job %s: error code %d, skipping" % (bs, self.mode, bs_job['error']) )
-                        continue
 
-                    # Read and write bandwidth as a function of I/O size
-                    bw.append({'log2_bs': log2_bs, 'bw': bs_job[self.mode]['bw']})
-                    # IOPS and IO latency percentiles as a function of I/O size
-                    row = {'log2_bs': log2_bs, 'iops': bs_job[self.mode]['iops']}
-                    row.update({float(percentile): clat_ns/self.ts_divider for percentile, clat_ns in iter(bs_job[self.mode]['clat_ns']['percentile'].items())})
-                    cl.append(row)
-                    # Aggregate data from each dataset
-                    self.add_series(log2_bs, bs_job[self.mode]['total_ios'], bs_job[self.mode]['clat_ns']['bins'])
-                    if self.verbose:
-                        print( "I/O size %8d, job %s: %d samples" % (bs, self.mode, bs_job[self.mode]['total_ios']) )
+            log2_bs = int(math.log(bs,2))
+            for bs_job in self.fio_index[(self.num_clients, bs)][0]['jobs']:
+                if bs_job['error'] > 0:
+                    print( "I/O size %8d, job %s: error code %d, skipping" % (bs, self.mode, bs_job['error']) )
+                    continue
 
+                # Read and write bandwidth as a function of I/O size
+                bw.append({'log2_bs': log2_bs, 'bw': bs_job[self.mode]['bw']})
+                # IOPS and IO latency percentiles as a function of I/O size
+                row = {'log2_bs': log2_bs, 'iops': bs_job[self.mode]['iops']}
+                row.update({float(percentile): clat_ns/self.ts_divider for percentile, clat_ns in iter(bs_job[self.mode]['clat_ns']['percentile'].items())})
+                cl.append(row)
+                # Aggregate data from each dataset
+                self.add_series(log2_bs, bs_job[self.mode]['total_ios'], bs_job[self.mode]['clat_ns']['bins'])
                 if self.verbose:
-                    print( "%d-client config: Aggregated data for %d I/Os, max latency %f %s" % (self.num_clients, sum([x['iops'] for x in cl]), self.max_Y, self.timescale) )
+                    print( "I/O size %8d, job %s: %d samples" % (bs, self.mode, bs_job[self.mode]['total_ios']) )
+
+        if self.verbose:
+            print( "%d-client config: Aggregated data for %d I/Os, max latency %f %s" % (self.num_clients, sum([x['iops'] for x in cl]), self.max_Y, self.timescale) )
 
         if not bw:
             print( "No data found for %d-client configuration in %s" % (self.num_clients, [str(x) for x in self.input_dirs]) )
             return False
 
         self.cldf = pd.DataFrame(cl).set_index('log2_bs')
+        self.pctdf = self.aggregate_percentiles()
         bwdf = pd.DataFrame(bw).set_index('log2_bs')
         self.bwdf = pd.concat([pd.Series(row, name=i) for i, row in bwdf['bw']
-                       .groupby(bwdf.index).apply(list).iteritems()], axis=1)
+                       .groupby(bwdf.index).apply(list).items()], axis=1)
         self.bwdf.to_csv(self.output_dir/(self.mode+'-bandwidth.csv'))
         self.cldf.to_csv(self.output_dir/(self.mode+'-commit-latency.csv'))
+        self.pctdf.to_csv(self.output_dir/(self.mode+'-commit-latency-percentiles.csv'))
 
         return True
 
+    @profiled('ClatGrid.populate_for_clients')
     def populate_for_clients(self, bs):
+        import pandas as pd
         # For a constant blocksize, generate data using the test clients as variable parameter.
         # Emit data from each listed job
         bw = list()
         iops = list()
         cl = list()
-        for input_dir in self.input_dirs:
-            print( "Scanning for fio data in %s" % input_dir )
-            fio_file_list = get_fio_file_list(input_dir)
-            fio_results = get_fio_results(fio_file_list)
-            for num_clients in sorted(fio_results.keys()):
-                if bs not in fio_results[num_clients]:
-                    continue
+        for num_clients in self.index_clients(bs):
+            for bs_client in self.fio_index[(num_clients, bs)]:
+                bs_job = bs_client['jobs'][0]               # FIXME: Assume one job per client
+                # Read and write bandwidth as a function of I/O size
+                bw.append({'test_clients': num_clients, 'bw': bs_job[self.mode]['bw']})
+                iops.append({'test_clients': num_clients, 'iops': bs_job[self.mode]['iops']})
+                # IOPS and IO latency percentiles as a function of I/O size
+                row = {'test_clients': num_clients, 'iops': bs_job[self.mode]['iops']}
+                row.update({float(percentile): clat_ns/self.ts_divider for percentile, clat_ns in iter(bs_job[self.mode]['clat_ns']['percentile'].items())})
+                cl.append(row)
+                # Aggregate data from each dataset
+                # A curiosity with fio: in some cranky cases the total_ios is not the sum of the histograms.
+                # However it appears the io_kbytes / bs is more reliable.
+                total_ios = bs_job[self.mode]['total_ios']
+                check_ios = bs_job[self.mode]['io_kbytes'] * 1000 / bs
+                sum_ios = bs_job[self.mode]['clat_ns']['bins'].total()
+                if check_ios != total_ios or sum_ios != total_ios:
+                    print( "%d-client config, I/O size %d, job %s: differing total IOs total_ios %d io_kbytes %d clat sum %d" % (num_clients, bs, self.mode, total_ios, check_ios, sum_ios) )
+                    total_ios = sum_ios
+                self.add_series(num_clients, total_ios, bs_job[self.mode]['clat_ns']['bins'])
+                if self.verbose:
+                    print( "%d-client config, I/O size %d, job %s: %d samples" % (num_clients, bs, self.mode, total_ios) )
 
-                for bs_client in fio_results[num_clients][bs]:
-                    bs_job = bs_client['jobs'][0]               # FIXME: Assume one job per client
-                    # Read and write bandwidth as a function of I/O size
-                    bw.append({'test_clients': num_clients, 'bw': bs_job[self.mode]['bw']})
-                    iops.append({'test_clients': num_clients, 'iops': bs_job[self.mode]['iops']})
-                    # IOPS and IO latency percentiles as a function of I/O size
-                    row = {'test_clients': num_clients, 'iops': bs_job[self.mode]['iops']}
-                    row.update({float(percentile): clat_ns/self.ts_divider for percentile, clat_ns in iter(bs_job[self.mode]['clat_ns']['percentile'].items())})
-                    cl.append(row)
-                    # Aggregate data from each dataset
-                    # A curiosity with fio: in some cranky cases the total_ios is not the sum of the histograms.
-                    # However it appears the io_kbytes / bs is more reliable.
-                    total_ios = bs_job[self.mode]['total_ios']
-                    check_ios = bs_job[self.mode]['io_kbytes'] * 1000 / bs
-                    sum_ios = sum(bs_job[self.mode]['clat_ns']['bins'].values())
-                    if check_ios != total_ios or sum_ios != total_ios:
-                        print( "%d-client config, I/O size %d, job %s: differing total IOs total_ios %d io_kbytes %d clat sum %d" % (num_clients, bs, self.mode, total_ios, check_ios, sum_ios) )
-                        total_ios = sum_ios
-                    self.add_series(num_clients, total_ios, bs_job[self.mode]['clat_ns']['bins'])
-                    if self.verbose:
-                        print( "%d-client config, I/O size %d, job %s: %d samples" % (num_clients, bs, self.mode, total_ios) )
-            if self.verbose:
-                print( "%d-client config: Aggregated data for %d I/Os, max latency %f %s" % (self.num_clients, sum([x['iops'] for x in cl]), self.max_Y, self.timescale) )
+        if self.verbose:
+            print( "%d-client config: Aggregated data for %d I/Os, max latency %f %s" % (self.num_clients, sum([x['iops'] for x in cl]), self.max_Y, self.timescale) )
 
         if not bw:
             print( "No data found for %d-client configuration in %s" % (self.num_clients, [str(x) for x in self.input_dirs]) )
             return False
 
         self.cldf = pd.DataFrame(cl).set_index('test_clients')
+        self.pctdf = self.aggregate_percentiles()
         bwdf = pd.DataFrame(bw).set_index('test_clients')
         self.bwdf = pd.concat([pd.Series(row, name=i) for i, row in bwdf['bw']
-                       .groupby(bwdf.index).apply(list).iteritems()], axis=1)
+                       .groupby(bwdf.index).apply(list).items()], axis=1)
         iopsdf = pd.DataFrame(iops).set_index('test_clients')
         self.iopsdf = pd.concat([pd.Series(row, name=i) for i, row in iopsdf['iops']
-                       .groupby(iopsdf.index).apply(list).iteritems()], axis=1)
+                       .groupby(iopsdf.index).apply(list).items()], axis=1)
 
-        self.cldf.to_csv(self.output_dir/(self.mode+'-commit-latency-by-client.csv'))
-        self.bwdf.to_csv(self.output_dir/(self.mode+'-bandwidth-by-client.csv'))
-        self.iopsdf.to_csv(self.output_dir/(self.mode+'-iops-by-client.csv'))
+        self.cldf.to_csv(self.output_dir/('%s-commit-latency-by-client-%d.csv' % (self.mode, bs)))
+        self.pctdf.to_csv(self.output_dir/('%s-commit-latency-percentiles-by-client-%d.csv' % (self.mode, bs)))
+        self.bwdf.to_csv(self.output_dir/('%s-bandwidth-by-client-%d.csv' % (self.mode, bs)))
+        self.iopsdf.to_csv(self.output_dir/('%s-iops-by-client-%d.csv' % (self.mode, bs)))
 
         return True
 
 
-    def ensure_output_dir(self, force):
+    def aggregate_percentiles(self):
+        ''' Latency percentiles for each column, computed from the merged
+            histogram of all results in that column rather than averaged
+            over the percentiles reported for each result.  The percentiles
+            are those reported by fio. '''
+
+        import pandas as pd
+        percentiles = sorted(P for P in self.cldf.columns if P != 'iops')
+        pctdf = pd.DataFrame(
+            [ self.io_data[X].percentiles(percentiles) / self.ts_divider for X in sorted(self.io_data) ],
+            index=pd.Index(sorted(self.io_data), name=self.cldf.index.name), columns=percentiles)
+        return pctdf
+
+    def ensure_output_dir(self, force, keep=False):
         # Check the status of the output directory
-        self.output_dir.mkdir(parents=True, exist_ok=force)
+        # Existing output is kept if it is to be updated in place
+        self.output_dir.mkdir(parents=True, exist_ok=force or keep)
+        if keep:
+            return
         for p in self.output_dir.iterdir():
             if force:
                 print( "Deleting existing output data %s in output directory" % (p) )
@@ -454,44 +603,80 @@ class ClatGrid:
                 os.abort()
 
 
-def get_fio_file_list(input_dir):
-    # List JSON files in the fio input directory
-    results = []
+def histogram_cdf(bins_Y, bins_Z, Z_total):
+    ''' Construct the cumulative distribution of a latency histogram,
+        normalised by Z_total.  The samples in each bin are taken to be spread
+        uniformly between the previous bin value (or zero) and the bin value,
+        so the distribution is piecewise linear between the returned knots. '''
+
+    order = np.argsort(bins_Y)
+    knots = np.concatenate(([0.0], bins_Y[order]))
+    cdf = np.concatenate(([0.0], np.cumsum(bins_Z[order]) / Z_total))
+    return knots, cdf
+
+
+def regrid_cdf(io_cdf, grid_Y):
+    ''' Resample a list of cumulative distributions onto the grid_Y row
+        boundaries, returning the combined probability mass in each row. '''
 
+    F = np.zeros(len(grid_Y), dtype=np.dtype('double'))
+    for knots, cdf in io_cdf:
+        F += np.interp(grid_Y, knots, cdf)
+    return np.diff(F)
+
+
+@profiled('find_fio_files')
+def find_fio_files(input_dir, include=None, exclude=None):
+    # Find JSON files in the fio input directory, including those in tar archives,
+    # with their (size, mtime) where listed in a manifest
+    # fio bandwidth, latency and IOPS logs are read by fiotools.Log instead
     try:
-        # Recursive directory traversal
-        for root, dirs, files in os.walk(str(input_dir)):
-            results += [ os.path.join(root, x) for x in files ]
-            #for subdir in dirs:
-                #results += get_fio_file_list( os.path.join(root,subdir) )
+        return find_results(input_dir, include, exclude)
     except OSError as E:
         print( "Could not access input directory %s" % (input_dir) )
         raise E
 
-    return results
+
+def get_fio_file_list(input_dir, include=None, exclude=None):
+    # List JSON files in the fio input directory
+    return [ path for path, stat_key in find_fio_files(input_dir, include, exclude) ]
 
 
-def get_fio_results(fio_file_list):
-    # Read in and parse the data files
+def index_fio_result(fio_file, fio_run_data, error=None):
+    # Determine the (test clients, I/O size) of a parsed result, or None if it is unusable
+    if isinstance(error, ValueError):
+        print( "Skipping %s: could not be parsed as JSON" % (fio_file) )
+        return None
+    try:
+        if error is not None:
+            raise error
+        test_bs = int(fio_run_data['global options']['bs'])
+        if 'meta' in fio_run_data:
+            test_clients = int(fio_run_data['meta']['total_clients'])
+        else:
+            test_clients = 1
+        return test_clients, test_bs
+    except KeyError as E:
+        print( "Skipping %s: data structure could not be parsed: %s" % (fio_file, str(E)) )
+        return None
+    except TypeError as E:
+        print( "Skipping %s: unexpected result format: %s" % (fio_file, str(E)) )
+        return None
+    except OSError as E:
+        print( "Skipping %s: could not be read: %s" % (fio_file, str(E)) )
+        return None
+
+
+@profiled('get_fio_results')
+def get_fio_results(fio_file_list, cache=True, rebuild_cache=False, jobs=1, stats=None):
+    # Read in and parse the data files, via the parse cache of each results directory
     fio_results = {}
-    for fio_file in fio_file_list:
-        with open(fio_file, 'r') as fio_fd:
-            try:
-                fio_run_data = json.load(fio_fd)
-                test_bs = int(fio_run_data['global options']['bs'])
-                if 'meta' in fio_run_data:
-                    test_clients = int(fio_run_data['meta']['total_clients'])
-                else:
-                    test_clients = 1
-                if test_clients not in fio_results:
-                    fio_results[test_clients] = {}
-                if test_bs not in fio_results[test_clients]:
-                    fio_results[test_clients][test_bs] = []
-                fio_results[test_clients][test_bs] += [fio_run_data]
-            except ValueError:
-                print( "Skipping %s: could not be parsed as JSON" % (fio_file) )
-                pass
-            except KeyError as E:
-                print( "Skipping %s: data structure could not be parsed: %s" % (fio_file, str(E)) )
-                pass
+    for fio_file, fio_run_data, error in load_fio_files(fio_file_list, cache, rebuild_cache, jobs=jobs, stats=stats):
+        key = index_fio_result(fio_file, fio_run_data, error)
+        if key is not None:
+            test_clients, test_bs = key
+            fio_results.setdefault(test_clients, {}).setdefault(test_bs, []).append(fio_run_data)
+    unconverged, judged = count_unconverged(R for B in fio_results.values() for L in B.values() for R in L)
+    if unconverged:
+        print( "%d of %d fio results run to steady state did not reach it" % (unconverged, judged) )
     return fio_results
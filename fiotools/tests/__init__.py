@@ -1,4 +1,8 @@
+import os
+import shutil
+import tempfile
 import unittest
+import numpy as np
 import fiotools
 from pathlib2 import Path
 
@@ -6,8 +10,9 @@ class Test(unittest.TestCase):
     def setUp(self):
         self.input_dirs_read = list(Path('fiotools/tests/ceph-randread/2').iterdir())
         self.input_dirs_write = list(Path('fiotools/tests/beegfs-write/2').iterdir())
+        self.tmp_dir = tempfile.mkdtemp()
         self.kwargs = dict(
-            output_dir = 'fiotools/tests/output',
+            output_dir = os.path.join(self.tmp_dir, 'output'),
             logscale=True,
             scenario = 'test',
             granularity=200,
@@ -15,6 +20,9 @@ class Test(unittest.TestCase):
             verbose=False,
         )
 
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
     def test_clatgrid_read(self):
         ''' Read mode should successfully process data from read mode. '''
 
@@ -59,6 +67,7 @@ class Test(unittest.TestCase):
         ''' This should raise OSError because there are files that could be
             overwritten in the results folder. '''
 
+        fiotools.ClatGrid(input_dirs=self.input_dirs_read, mode='randread', **self.kwargs)
         self.kwargs['force'] = False
         with self.assertRaises(OSError):
             grid = fiotools.ClatGrid(
@@ -83,5 +92,106 @@ class Test(unittest.TestCase):
                     skip_bs=[128, 256],
                     mode='write', **self.kwargs)
 
+    def test_clatgrid_index_once(self):
+        ''' Each input directory should be parsed once into an index keyed
+            by (clients, bs), and only the requested block sizes processed. '''
+
+        grid = fiotools.ClatGrid(
+                    input_dirs=self.input_dirs_read,
+                    bs_list=[1024, 4096], plot=False,
+                    mode='randread', **self.kwargs)
+        self.assertEqual(grid.bs_list, [1024, 4096])
+        self.assertEqual(grid.index_clients(), [1])
+        self.assertEqual(len(grid.index_bs()), 18)
+        for key, results in grid.fio_index.items():
+            self.assertEqual(len(results), len(self.input_dirs_read))
+
+    def test_clatgrid_bs_bounds(self):
+        ''' Every I/O size found should be processed unless bounded. '''
+
+        grid = fiotools.ClatGrid(
+                    input_dirs=self.input_dirs_read, plot=False,
+                    mode='randread', **self.kwargs)
+        self.assertEqual(grid.bs_list, grid.index_bs())
+        self.assertIn(2097152, grid.bs_list)
+        grid = fiotools.ClatGrid(
+                    input_dirs=self.input_dirs_read, plot=False, max_bs=65536,
+                    mode='randread', **self.kwargs)
+        self.assertEqual(max(grid.bs_list), 65536)
+
+    def test_clatgrid_render(self):
+        ''' Figures for each block size should be rendered from plot specs,
+            in parallel, and none left open. '''
+
+        from matplotlib import pyplot as plt
+        grid = fiotools.ClatGrid(
+                    input_dirs=self.input_dirs_read,
+                    bs_list=[1024, 4096], jobs=2,
+                    mode='randread', **self.kwargs)
+        self.assertEqual(len(grid.plot_specs), 6)
+        self.assertEqual([F for F, T in grid.render_times], [S.outfile for S in grid.plot_specs])
+        for S in grid.plot_specs:
+            self.assertTrue(Path(S.outfile).exists())
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_clatgrid_output_format(self):
+        ''' Figures should be written in the requested format. '''
+
+        grid = fiotools.ClatGrid(
+                    input_dirs=self.input_dirs_read,
+                    bs_list=[4096], output_format='svg',
+                    mode='randread', **self.kwargs)
+        self.assertTrue(all(S.outfile.endswith('.svg') for S in grid.plot_specs))
+        with self.assertRaises(ValueError):
+            fiotools.ClatGrid(input_dirs=self.input_dirs_read, output_format='gif',
+                              mode='randread', **self.kwargs)
+
+    def test_clatgrid_watch(self):
+        ''' In watch mode existing output is kept, and polling ingests only
+            new or changed files and emits output for their I/O sizes. '''
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            src = str(self.input_dirs_read[0])
+            input_dir = os.path.join(tmp_dir, 'results')
+            output_dir = os.path.join(tmp_dir, 'output')
+            os.makedirs(input_dir)
+            os.makedirs(output_dir)
+            open(os.path.join(output_dir, 'previous.csv'), 'w').close()
+            for F in ('1024.json', '4096.json'):
+                shutil.copy(os.path.join(src, F), input_dir)
+            self.kwargs.update(output_dir=output_dir, force=False)
+            grid = fiotools.ClatGrid(input_dirs=[input_dir], watch=True, mode='randread', **self.kwargs)
+            self.assertEqual(grid.bs_list, [1024, 4096])
+            self.assertTrue(os.path.exists(os.path.join(output_dir, 'previous.csv')))
+            self.assertEqual(grid.poll(), [])
+
+            shutil.copy(os.path.join(src, '8192.json'), input_dir)
+            self.assertEqual(grid.poll(), [8192])
+            self.assertEqual(grid.bs_list, [1024, 4096, 8192])
+            self.assertTrue(all(S.outfile.endswith('-8192.png') for S in grid.plot_specs))
+
+            # A result still being written is picked up once complete
+            with open(os.path.join(src, '16384.json')) as f:
+                text = f.read()
+            partial = os.path.join(input_dir, '16384.json')
+            with open(partial, 'w') as f:
+                f.write(text[:len(text) // 2])
+            self.assertEqual(grid.poll(), [])
+            with open(partial, 'w') as f:
+                f.write(text)
+            self.assertEqual(grid.poll(), [16384])
+            self.assertEqual([len(grid.fio_index[(1, bs)]) for bs in grid.bs_list], [1, 1, 1, 1])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_regrid_cdf(self):
+        ''' Regridding a histogram should spread each bin uniformly back to
+            the previous bin value and conserve the total probability. '''
+
+        io_cdf = [fiotools.histogram_cdf(np.array([4.0, 2.0]), np.array([1.0, 3.0]), 4.0)]
+        grid_mass = fiotools.regrid_cdf(io_cdf, np.array([0.0, 1.0, 2.0, 3.0, 4.0]))
+        np.testing.assert_allclose(grid_mass, [0.375, 0.375, 0.125, 0.125])
+
 if __name__ == '__main__':
     unittest.main()
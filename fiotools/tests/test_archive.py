@@ -0,0 +1,112 @@
+import gzip
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+import pandas as pd
+
+import fiotools
+import fiotools.Data
+from fiotools.Archive import ArchiveWriter, list_archive, result_stat, split_archive_path
+from fiotools.Cache import ResultCache, load_fio_files, read_fio_file
+from fiotools.Discovery import list_result_files
+from fiotools.Synthetic import write_group_sweep
+
+CLIENT_DIR = 'fiotools/tests/ceph-randread/2'
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.archive = os.path.join(self.tmp_dir, 'ceph-randread.tar.gz')
+        with tarfile.open(self.archive, 'w:gz') as tar:
+            tar.add(CLIENT_DIR, arcname='2')
+        self.plain = sorted(os.path.relpath(P, CLIENT_DIR) for P in list_result_files(CLIENT_DIR))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_compressed_files(self):
+        ''' Compressed results should read as their plain originals, and be cached. '''
+
+        source = os.path.join(CLIENT_DIR, 'ceph-randread-2-8zdn4', '4096.json')
+        path = os.path.join(self.tmp_dir, '4096.json.gz')
+        with open(source, 'rb') as f, gzip.open(path, 'wb') as g:
+            g.write(f.read())
+        self.assertEqual(read_fio_file(path), read_fio_file(source))
+        [(_, S, E)] = load_fio_files([path])
+        self.assertIsNone(E)
+        self.assertEqual(S, read_fio_file(source))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp_dir, ResultCache.filename)))
+
+    def test_list_archive(self):
+        ''' Members of an archive should be listed by walking a directory
+            holding it, by naming the archive, or a directory within it. '''
+
+        listed = list_result_files(self.tmp_dir)
+        self.assertEqual(listed, list_result_files(self.archive))
+        self.assertEqual(sorted(os.path.relpath(P, os.path.join(self.archive, '2')) for P in listed), self.plain)
+        subdir = os.path.join(self.archive, '2', 'ceph-randread-2-8zdn4')
+        self.assertEqual(len(list_result_files(subdir)), len(list_result_files(os.path.join(CLIENT_DIR, 'ceph-randread-2-8zdn4'))))
+        self.assertEqual(split_archive_path(os.path.join(subdir, '4096.json')),
+                         (self.archive, os.path.join('2', 'ceph-randread-2-8zdn4', '4096.json')))
+        self.assertEqual(split_archive_path(self.archive), (None, self.archive))
+        self.assertEqual(result_stat(listed[0])[0], os.path.getsize(self.archive))
+
+    def test_load_archive(self):
+        ''' Members should parse as their plain originals, serially or in
+            parallel, with missing members reported as errors. '''
+
+        paths = list_result_files(self.archive)
+        missing = os.path.join(self.archive, '2', 'missing.json')
+        for jobs in (1, 2):
+            results = load_fio_files(paths + [missing], jobs=jobs)
+            self.assertEqual([ P for P, S, E in results ], paths + [missing])
+            for path, S, E in results[:-1]:
+                self.assertIsNone(E)
+                self.assertEqual(S, read_fio_file(os.path.join(CLIENT_DIR, os.path.relpath(path, os.path.join(self.archive, '2')))))
+            self.assertIsInstance(results[-1][2], KeyError)
+
+    def test_clatgrid_archive(self):
+        ''' ClatGrid should process the results of an archive as those of a directory. '''
+
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        grid = fiotools.ClatGrid(input_dirs=[self.archive], output_dir=output_dir, mode='randread',
+                                 scenario='test', granularity=200, logscale=True, force=True, plot=False)
+        self.assertEqual(sum(len(V) for V in grid.fio_index.values()), len(self.plain))
+        self.assertTrue(os.listdir(output_dir))
+
+    def test_series_archive(self):
+        ''' A Series should read the group-reporting results of an archive. '''
+
+        results = write_group_sweep(os.path.join(self.tmp_dir, 'group'), 'grp', 'read', [1, 3], [4096], density=50)
+        archive = os.path.join(self.tmp_dir, 'group.tar.xz')
+        with tarfile.open(archive, 'w:xz') as tar:
+            tar.add(results, arcname='grp-read')
+        series = fiotools.Data.SeriesGroup(archive)
+        self.assertEqual(series.client_counts(), set([1, 3]))
+        pd.testing.assert_frame_equal(series.to_frame(), fiotools.Data.SeriesGroup(results).to_frame())
+
+    def test_archive_writer(self):
+        ''' Members should be appended as they arrive, readable before the
+            archive is compressed once at the end. '''
+
+        path = os.path.join(self.tmp_dir, 'drive.tar.gz')
+        writer = ArchiveWriter(path)
+        writer.add('run/0/1-4096.json', b'{"a": 1}')
+        writer.add('run/0/1-65536.json', b'{"a": 2}')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(list_archive(writer.partial), [ os.path.join(writer.partial, 'run', '0', N)
+                                                         for N in ('1-4096.json', '1-65536.json') ])
+        writer.close()
+        self.assertFalse(os.path.exists(writer.partial))
+        with tarfile.open(path, 'r:gz') as tar:
+            self.assertEqual([ tar.extractfile(I).read() for I in tar ], [b'{"a": 1}', b'{"a": 2}'])
+        with self.assertRaises(ValueError):
+            ArchiveWriter(os.path.join(self.tmp_dir, 'drive.zip'))
+
+
+if __name__ == '__main__':
+    unittest.main()
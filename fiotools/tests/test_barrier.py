@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from fiotools.Barrier import BarrierError, Coordinator, main, wait
+
+
+def enter(address, name, parties, client, timeout, queue):
+    try:
+        wait(address, name, parties, client, timeout=timeout, group='sweep')
+        queue.put((client, 'go', time.time()))
+    except BarrierError as E:
+        queue.put((client, E.reply['status'], time.time()))
+
+
+class TestBarrier(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.messages = []
+        self.start('localhost:0')
+
+    def tearDown(self):
+        self.coordinator.stop()
+        self.thread.join()
+        shutil.rmtree(self.tmp_dir)
+
+    def start(self, address):
+        self.coordinator = Coordinator(address, log=self.messages.append)
+        self.thread = threading.Thread(target=self.coordinator.run)
+        self.thread.start()
+        self.assertTrue(self.coordinator.ready.wait(10))
+        self.address = self.coordinator.address_string()
+
+    def sweep(self, parties, steps, timeout=60):
+        ''' Release times of each client at each step, with one process per client '''
+        queue = multiprocessing.Queue()
+        released = []
+        for step in range(steps):
+            processes = [ multiprocessing.Process(target=enter, args=(self.address, 'step-%d' % step, parties,
+                                                                       'client-%d' % i, timeout, queue))
+                          for i in range(parties) ]
+            for P in processes:
+                P.start()
+            replies = [ queue.get(timeout=60) for P in processes ]
+            for P in processes:
+                P.join()
+            released.append(replies)
+        return released
+
+    def test_release(self):
+        ''' Every client should be released together, at each step of a
+            sweep through barriers of the same name. '''
+
+        parties = 16
+        for replies in self.sweep(parties, 2) + self.sweep(parties, 2):
+            self.assertEqual(sorted(C for C, S, T in replies), sorted('client-%d' % i for i in range(parties)))
+            self.assertEqual(set(S for C, S, T in replies), set(['go']))
+            times = [ T for C, S, T in replies ]
+            self.assertLess(max(times) - min(times), 0.5)
+        self.assertEqual(len([ M for M in self.messages if 'released 16 clients' in M ]), 4)
+        self.assertEqual(self.coordinator.barriers, {})
+
+    def test_timeout(self):
+        ''' A barrier should time out from its first arrival, naming the
+            clients of the group that did not arrive. '''
+
+        self.sweep(3, 1)
+        queue = multiprocessing.Queue()
+        processes = [ multiprocessing.Process(target=enter, args=(self.address, 'step-1', 3, 'client-%d' % i, 0.5, queue))
+                      for i in range(2) ]
+        for P in processes:
+            P.start()
+        replies = [ queue.get(timeout=60) for P in processes ]
+        for P in processes:
+            P.join()
+        self.assertEqual(set(S for C, S, T in replies), set(['timeout']))
+        with self.assertRaises(BarrierError) as E:
+            wait(self.address, 'step-2', 3, 'client-0', timeout=0.1, group='sweep')
+        self.assertEqual(E.exception.reply['arrived'], ['client-0'])
+        self.assertEqual(E.exception.reply['missing'], ['client-1', 'client-2'])
+        self.assertTrue(any('step-1 timed out' in M and 'missing client-2' in M for M in self.messages))
+
+        # Exit status of the client command
+        self.assertEqual(main(['wait', '-a', self.address, '-n', 'step-3', '-p', '2', '-t', '0.1']), 1)
+        self.assertEqual(main(['wait', '-a', self.address, '-n', 'step-4', '-p', '1']), 0)
+
+    def test_disconnect(self):
+        ''' A client that goes away while waiting should be dropped from the
+            count, and a mismatched number of parties refused. '''
+
+        dead = multiprocessing.Process(target=enter, args=(self.address, 'step', 2, 'dead', 60, multiprocessing.Queue()))
+        dead.start()
+        while not self.coordinator.barriers.get('step'):
+            time.sleep(0.01)
+        dead.terminate()
+        dead.join()
+        while self.coordinator.barriers['step'].waiters:
+            time.sleep(0.01)
+        self.assertTrue(any('client dead disconnected' in M for M in self.messages))
+        with self.assertRaises(BarrierError):
+            wait(self.address, 'step', 3, 'client-0')
+
+        replies = []
+        threads = [ threading.Thread(target=lambda C: replies.append(wait(self.address, 'step', 2, C)), args=(C,))
+                    for C in ('client-0', 'client-1') ]
+        for T in threads:
+            T.start()
+        for T in threads:
+            T.join()
+        self.assertEqual([ R['status'] for R in replies ], ['go', 'go'])
+
+    def test_unix_socket(self):
+        ''' Clients on one host may use a Unix socket. '''
+
+        self.coordinator.stop()
+        self.thread.join()
+        path = os.path.join(self.tmp_dir, 'barrier.sock')
+        self.start(path)
+        self.assertEqual(self.address, path)
+        for replies in self.sweep(4, 2):
+            self.assertEqual(set(S for C, S, T in replies), set(['go']))
+        self.coordinator.stop()
+        self.thread.join()
+        self.assertFalse(os.path.exists(path))
+        with self.assertRaises(OSError):
+            wait(path, 'step', 1, 'client-0', connect_timeout=0.2)
+        self.start('localhost:0')
+
+
+if __name__ == '__main__':
+    unittest.main()
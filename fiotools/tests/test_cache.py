@@ -0,0 +1,89 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import fiotools
+import fiotools.Cache
+from fiotools.Cache import ResultCache, load_fio_files, read_fio_file
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.tmp_dir, 'client')
+        shutil.copytree('fiotools/tests/ceph-randread/2/ceph-randread-2-8zdn4', self.input_dir)
+        with open(os.path.join(self.input_dir, 'broken.json'), 'w') as f:
+            f.write('{"global options": ')
+        self.paths = sorted(os.path.join(self.input_dir, F) for F in os.listdir(self.input_dir)
+                            if not F.startswith('.'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_cache_round_trip(self):
+        ''' Records loaded from the cache should equal freshly parsed records,
+            and parse errors should be remembered. '''
+
+        first = load_fio_files(self.paths)
+        self.assertTrue(os.path.exists(os.path.join(self.input_dir, ResultCache.filename)))
+        with mock.patch.object(fiotools.Cache, 'read_fio_file', side_effect=AssertionError):
+            second = load_fio_files(self.paths)
+        for (path, S1, E1), (_, S2, E2) in zip(first, second):
+            if path.endswith('broken.json'):
+                self.assertIsInstance(E2, ValueError)
+                continue
+            self.assertIsNone(E2)
+            self.assertEqual(S2, read_fio_file(path))
+            self.assertEqual(S2, S1)
+
+    def test_cache_reparses_changed_files(self):
+        ''' Only files whose size or mtime changed should be parsed again. '''
+
+        load_fio_files(self.paths)
+        changed = os.path.join(self.input_dir, '1024.json')
+        st = os.stat(changed)
+        os.utime(changed, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        with mock.patch.object(fiotools.Cache, 'read_fio_file', wraps=read_fio_file) as reader:
+            load_fio_files(self.paths)
+            self.assertEqual([C.args[0] for C in reader.call_args_list], [changed])
+        with mock.patch.object(fiotools.Cache, 'read_fio_file', wraps=read_fio_file) as reader:
+            load_fio_files(self.paths, rebuild=True)
+            self.assertEqual(reader.call_count, len(self.paths))
+        with mock.patch.object(fiotools.Cache, 'read_fio_file', wraps=read_fio_file) as reader:
+            load_fio_files(self.paths, cache=False)
+            self.assertEqual(reader.call_count, len(self.paths))
+
+    def test_parallel_load(self):
+        ''' Parsing with a pool of workers should give the same results,
+            in the same order, as parsing serially. '''
+
+        serial = load_fio_files(self.paths, cache=False)
+        parallel = load_fio_files(self.paths, cache=False, jobs=3)
+        self.assertEqual([R[:2] for R in parallel], [R[:2] for R in serial])
+        self.assertEqual([type(R[2]) for R in parallel], [type(R[2]) for R in serial])
+        cached = load_fio_files(self.paths, jobs=3)
+        self.assertEqual([R[:2] for R in cached], [R[:2] for R in serial])
+
+    def test_unreadable_files(self):
+        ''' A file that cannot be read, or of an unexpected format, should
+            be reported as its own error without stopping the others. '''
+
+        missing = os.path.join(self.input_dir, 'missing.json')
+        results = load_fio_files(self.paths + [missing])
+        self.assertIsInstance(results[-1][2], OSError)
+        self.assertEqual(len([ R for R in results if R[2] is None ]), len(self.paths) - 1)
+        self.assertIsInstance(load_fio_files([missing])[0][2], OSError)
+
+        # Errors remembered by the cache are skipped when indexing
+        odd = os.path.join(self.input_dir, 'odd.json')
+        shutil.copy(self.paths[0], odd)
+        with mock.patch.object(fiotools.Cache, 'read_fio_file', side_effect=TypeError("group-reported")):
+            load_fio_files([odd])
+        results = fiotools.get_fio_results([odd, missing] + self.paths)
+        self.assertEqual(sum(len(L) for B in results.values() for L in B.values()), len(self.paths) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+from fiotools.Campaign import Campaign, CampaignReport
+from fiotools.Synthetic import write_client_sweep, write_group_sweep
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestCampaign(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.results = os.path.join(self.tmp_dir, 'results')
+        for clients in (1, 2):
+            write_client_sweep(self.results, 'syn', 'randread', clients, [4096, 65536], density=50)
+        write_client_sweep(self.results, 'syn', 'write', 2, [4096], density=50)
+        write_group_sweep(os.path.join(self.results, 'group'), 'grp', 'read', [1, 3], [4096], density=50)
+        self.output_dir = os.path.join(self.tmp_dir, 'output')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_ingest(self):
+        ''' Results should be read once and grouped by scenario, mode,
+            number of clients and I/O size. '''
+
+        campaign = Campaign(self.results, cache=False)
+        self.assertEqual(campaign.scenarios(), [('grp', 'read'), ('syn', 'randread'), ('syn', 'write')])
+        self.assertEqual(sorted(campaign.client_index[('syn', 'randread')]),
+                         [(1, 4096), (1, 65536), (2, 4096), (2, 65536)])
+        self.assertEqual(len(campaign.client_index[('syn', 'randread')][(2, 4096)]), 2)
+        self.assertEqual(campaign.group_series[('grp', 'read')].client_counts(), set([1, 3]))
+
+    def test_report(self):
+        ''' A report should hold every output set, linked from its index page. '''
+
+        campaign = Campaign(self.results, cache=False)
+        CampaignReport(campaign, self.output_dir, plot=False, logscale=True).generate()
+        randread = os.listdir(os.path.join(self.output_dir, 'syn-randread', 'clients'))
+        self.assertIn('read-commit-latency-grid-by-client-65536.json', randread)
+        self.assertIn('write-bandwidth-by-client-4096.csv',
+                      os.listdir(os.path.join(self.output_dir, 'syn-write', 'clients')))
+        group = os.listdir(os.path.join(self.output_dir, 'grp-read', 'group'))
+        self.assertEqual(sorted(group), ['grp-read-results.csv', 'grp-test-clients-vs-bandwidth-4096.csv',
+                                         'grp-test-clients-vs-iops-4096.csv'])
+        with open(os.path.join(self.output_dir, 'index.html')) as f:
+            index = f.read()
+        self.assertIn('href="syn-randread/clients/read-commit-latency-grid-by-client-65536.json"', index)
+        self.assertIn('href="grp-read/group/grp-read-results.csv"', index)
+        with self.assertRaises(ValueError):
+            CampaignReport(campaign, self.output_dir)
+
+    def test_report_force(self):
+        ''' Overwriting a report should replace only its own outputs, such
+            as beside those of fio_blocksize, written in parallel. '''
+
+        campaign = Campaign(self.results, cache=False)
+        CampaignReport(campaign, self.output_dir, plot=False).generate()
+        parsed = os.path.join(self.output_dir, 'syn-randread', '2')
+        os.makedirs(parsed)
+        with open(os.path.join(parsed, 'read-iops-by-client-4096.csv'), 'w') as f:
+            f.write('parsed')
+        stale = os.path.join(self.output_dir, 'syn-randread', 'clients', 'stale.csv')
+        with open(stale, 'w') as f:
+            f.write('stale')
+        report = CampaignReport(campaign, self.output_dir, force=True, plot=False, jobs=2)
+        report.generate()
+        self.assertFalse(os.path.exists(stale))
+        self.assertEqual(os.listdir(parsed), ['read-iops-by-client-4096.csv'])
+        self.assertEqual([ os.path.relpath(D, self.output_dir) for T, D in report.sections ],
+                         [ os.path.join(*P) for P in (('grp-read', 'group'), ('syn-randread', 'clients'),
+                                                      ('syn-write', 'clients')) ])
+        self.assertIn('read-commit-latency-grid-by-client-65536.json',
+                      os.listdir(os.path.join(self.output_dir, 'syn-randread', 'clients')))
+
+    def test_report_figures(self):
+        ''' Figures of every output set should be rendered and shown on the index page. '''
+
+        shutil.rmtree(os.path.join(self.results, 'syn-randread'))
+        campaign = Campaign(self.results, cache=False)
+        report = CampaignReport(campaign, self.output_dir, force=True, jobs=2)
+        report.generate()
+        self.assertEqual(len(report.plot_specs), 5)
+        with open(os.path.join(self.output_dir, 'index.html')) as f:
+            index = f.read()
+        for S in report.plot_specs:
+            self.assertTrue(os.path.exists(S.outfile))
+            self.assertIn('<img src="%s"' % os.path.relpath(S.outfile, self.output_dir), index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from fiotools.Campaign import Campaign
+from fiotools.Compare import COMPARE_COLUMNS, METRICS, Comparison
+from fiotools.Plot import render_figures
+from fiotools.Synthetic import write_client_sweep, write_group_sweep
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.baseline = os.path.join(self.tmp_dir, 'baseline')
+        self.candidate = os.path.join(self.tmp_dir, 'candidate')
+        for clients in (1, 2):
+            write_client_sweep(self.baseline, 'ceph', 'randread', clients, [4096, 65536], runs=3, density=50)
+            write_client_sweep(self.candidate, 'ceph', 'randread', clients, [4096, 65536], runs=3, density=50,
+                               seed=1, latency_scale=1.25 if clients == 2 else 1.0)
+        write_group_sweep(self.baseline, 'grp', 'write', [1, 2], [4096], runs=2, density=50)
+        write_group_sweep(self.candidate, 'grp', 'write', [1, 2], [4096], runs=2, density=50, seed=1)
+        self.output_dir = os.path.join(self.tmp_dir, 'output')
+        os.makedirs(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_no_change(self):
+        ''' Results compared with themselves should show no change and no regressions. '''
+
+        baseline = Campaign(self.baseline, cache=False)
+        comparison = Comparison(baseline, baseline)
+        self.assertEqual(tuple(comparison.table.columns), COMPARE_COLUMNS)
+        # randread: 2 client counts x 2 I/O sizes x 5 metrics, write: 2 client counts x bw and iops
+        self.assertEqual(len(comparison.table), 2 * 2 * len(METRICS) + 2 * 2)
+        np.testing.assert_array_equal(comparison.table['delta_pct'], 0.0)
+        self.assertEqual(len(comparison.regressions()), 0)
+        self.assertEqual(comparison.unmatched, 0)
+
+    def test_regression(self):
+        ''' Slower storage should be flagged on every metric of the
+            configurations affected, and only those. '''
+
+        comparison = Comparison(Campaign(self.baseline, cache=False), Campaign(self.candidate, cache=False))
+        regressions = comparison.regressions()
+        self.assertEqual(set(regressions['clients']), set([2]))
+        self.assertEqual(set(regressions['rw']), set(['randread']))
+        self.assertEqual(len(regressions), 2 * len(METRICS))
+        self.assertTrue(np.all(np.abs(regressions['t']) >= 2.0))
+        bw = comparison.table[(comparison.table['clients'] == 1) & (comparison.table['metric'] == 'bw')]
+        self.assertTrue(np.all(np.abs(bw['t']) < 2.0))
+        self.assertEqual(len(Comparison(Campaign(self.baseline, cache=False), Campaign(self.candidate, cache=False),
+                                        threshold=50.0).regressions()), 0)
+
+    def test_outputs(self):
+        ''' The table and the latency difference of each I/O size should be
+            written, as figures or as JSON grids. '''
+
+        comparison = Comparison(Campaign(self.baseline, cache=False), Campaign(self.candidate, cache=False))
+        self.assertEqual(comparison.write_outputs(self.output_dir, plot=False), [])
+        self.assertEqual(sorted(os.listdir(self.output_dir)),
+                         ['comparison.csv', 'randread-commit-latency-diff-by-client-4096.json',
+                          'randread-commit-latency-diff-by-client-65536.json'])
+        with open(os.path.join(self.output_dir, 'randread-commit-latency-diff-by-client-4096.json')) as f:
+            grid = json.load(f)
+        self.assertEqual(grid['x_edges'], [0.5, 1.5, 2.5])
+        # Probability mass moves between rows but is conserved in each column
+        for column in zip(*grid['grid']):
+            self.assertAlmostEqual(sum(Z for Z in column if Z is not None), 0.0)
+
+        specs = comparison.write_outputs(self.output_dir)
+        render_figures(specs)
+        self.assertTrue(all(os.path.exists(S.outfile) for S in specs))
+
+    def test_scenarios(self):
+        ''' A scenario must be chosen where a result set holds several for a mode. '''
+
+        write_client_sweep(self.candidate, 'cephfs', 'randread', 1, [4096], density=50)
+        candidate = Campaign(self.candidate, cache=False)
+        with self.assertRaises(ValueError):
+            Comparison(Campaign(self.baseline, cache=False), candidate)
+        comparison = Comparison(Campaign(self.baseline, cache=False), candidate, candidate_scenario='cephfs')
+        self.assertEqual(set(comparison.table['clients']), set([1]))
+        self.assertEqual(set(comparison.table['bs']), set([4096]))
+        self.assertEqual(comparison.unmatched, 3 * len(METRICS) + 2 * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+from fiotools.Synthetic import write_group_sweep
+import copy
+import fiotools.Data
+import fiotools.Plot
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import tempfile
+import unittest
+
+
+class TestSeries(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        group_dir = write_group_sweep(self.tmp_dir, 'syn', 'read', [1, 3], [4096, 65536], runs=2, density=50)
+        self.run_data = fiotools.Data.SeriesGroup(group_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_query(self):
+        ''' Queries by any combination of keys should match a scan of
+            every result, in the same order. '''
+
+        run_data = self.run_data
+        self.assertEqual(len(run_data.query()), 2 * 2 * (1 + 3))
+        self.assertEqual(run_data.client_counts(), set([1, 3]))
+        self.assertEqual(run_data.jobnames(), set(['syn']))
+        for keys in ({'hostname': 'client-2'},
+                     {'hostname': 'client-0', 'jobname': 'syn'},
+                     {'clients': 3, 'io_size': 65536},
+                     {'hostname': 'client-1', 'clients': 1},
+                     {'jobname': 'other'}):
+            scan = [ R for R in run_data.extract_results(lambda R: True)
+                     if all(R[fiotools.Data.Series.INDEX_KEYS.index(K)] == V for K, V in keys.items()) ]
+            self.assertEqual(run_data.query(**keys), scan)
+        self.assertEqual(len(run_data.query(hostname='client-2')), 4)
+        self.assertEqual(run_data.query(hostname='client-1', clients=1), [])
+
+    def test_select_copy(self):
+        ''' Constraining a copy of a series should leave the original and
+            its index intact. '''
+
+        sub_data = copy.copy(self.run_data)
+        sub_data.select_samples(lambda S: S.io_size == 4096)
+        self.assertEqual(sub_data.io_sizes(), set([4096]))
+        self.assertEqual(len(sub_data.query(hostname='client-0')), 4)
+        self.assertEqual(self.run_data.io_sizes(), set([4096, 65536]))
+        self.assertEqual(len(self.run_data.query(hostname='client-0')), 8)
+
+    def test_to_frame(self):
+        ''' The tidy table should have a row per result, matching the
+            results, and round trip through CSV. '''
+
+        table = self.run_data.to_frame()
+        self.assertEqual(tuple(table.columns), fiotools.Data.TABLE_COLUMNS)
+        self.assertEqual(len(table), len(self.run_data.query()))
+        for (hostname, jobname, clients, io_size, R), (i, row) in zip(self.run_data.query(), table.iterrows()):
+            self.assertEqual((row['hostname'], row['clients'], row['io_size']), (hostname, clients, io_size))
+            self.assertEqual(row['bw'], R.fio_data['bw'])
+        path = os.path.join(self.tmp_dir, 'results.csv')
+        self.run_data.write_table(path)
+        pd.testing.assert_frame_equal(pd.read_csv(path), table)
+
+    def test_stacked_pivot(self):
+        ''' Stacked line plots should pivot the table to a row per host
+            and a column per client count. '''
+
+        plot = fiotools.Plot.BandwidthClient('syn', 4096, self.run_data)
+        self.assertEqual(list(plot.DF.columns), [1, 3])
+        self.assertEqual(list(plot.DF.index), ['client-0', 'client-1', 'client-2'])
+        # client-1 only ran with 3 clients
+        self.assertTrue(np.isnan(plot.DF.loc['client-1', 1]))
+        last = self.run_data.query(hostname='client-0', clients=3, io_size=4096)[-1]
+        self.assertAlmostEqual(plot.DF.loc['client-0', 3], last[4].fio_data['bw'] * 0.001)
+
+
+if __name__ == '__main__':
+    unittest.main()
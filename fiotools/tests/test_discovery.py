@@ -0,0 +1,125 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+import fiotools
+from fiotools.Cache import ResultCache, load_fio_files
+from fiotools.Discovery import MANIFEST_NAME, find_results, list_result_files, write_manifest
+from fiotools.Synthetic import write_client_sweep
+
+
+class TestDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.results = os.path.join(self.tmp_dir, 'results')
+        self.client_count_dir = write_client_sweep(self.results, 'syn', 'randread', 2, [4096, 65536], density=50)
+        self.expected = list_result_files(self.results)
+        # The leftovers of run_fio.sh and mpi_fio.sh, and of editing
+        lock_dir = os.path.join(self.client_count_dir, '4096.lock')
+        os.makedirs(lock_dir)
+        for path in (os.path.join(lock_dir, 'client-0'),
+                     os.path.join(self.client_count_dir, 'fio-2-1-client-0-4096.dat'),
+                     os.path.join(self.client_count_dir, '.4096.json.swp'),
+                     os.path.join(self.client_count_dir, '4096.json~')):
+            with open(path, 'w') as f:
+                f.write('not a result')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_filters(self):
+        ''' Only result files should be found, in sorted walk order, with
+            excluded directories never listed. '''
+
+        self.assertEqual(len(self.expected), 4)
+        self.assertEqual(self.expected, sorted(self.expected))
+        self.assertEqual(list_result_files(self.results), self.expected)
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            list_result_files(self.results)
+            self.assertFalse([ C for C in scandir.call_args_list if C.args[0].endswith('.lock') ])
+        self.assertEqual(list_result_files(self.results, exclude=['*-1']), self.expected[:2])
+        self.assertEqual([ os.path.basename(P) for P in list_result_files(self.results, include=['*.dat']) ],
+                         ['fio-2-1-client-0-4096.dat'])
+        with self.assertRaises(OSError):
+            fiotools.get_fio_file_list(os.path.join(self.tmp_dir, 'missing'))
+
+    def test_manifest(self):
+        ''' A manifest should stand in for its directory tree, giving the
+            size and mtime of each result, including archive members. '''
+
+        self.assertEqual(write_manifest(self.results), 4)
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            found = find_results(self.results)
+            self.assertEqual(scandir.call_count, 1)
+        self.assertEqual([ P for P, K in found ], self.expected)
+        for path, (size, mtime) in found:
+            st = os.stat(path)
+            self.assertEqual((size, mtime), (st.st_size, st.st_mtime_ns))
+
+        # Cache lookups use the stats of the manifest
+        load_fio_files([ P for P, K in found ], stats=dict(found))
+        with mock.patch('os.stat', side_effect=AssertionError):
+            self.assertTrue(all(E is None for P, S, E in load_fio_files([ P for P, K in found ], stats=dict(found))))
+
+        # Archives are listed whole
+        archive = os.path.join(self.tmp_dir, 'archived.tar')
+        with tarfile.open(archive, 'w') as tar:
+            tar.add(self.results, arcname='results')
+        os.remove(os.path.join(self.results, MANIFEST_NAME))
+        self.assertEqual(write_manifest(self.tmp_dir), 5)
+        found = find_results(self.tmp_dir)
+        self.assertEqual(len(found), 8)
+        self.assertEqual(set(K for P, K in found[:4]), set([(os.path.getsize(archive), os.stat(archive).st_mtime_ns)]))
+
+        # Seconds as written by find -printf %T@
+        size = os.path.getsize(self.expected[0])
+        os.utime(self.expected[0], ns=(1600000000123456789, 1600000000123456789))
+        with open(os.path.join(self.client_count_dir, MANIFEST_NAME), 'w') as f:
+            f.write('%d\t1600000000.1234567890\tsyn-randread-2-0-0/4096.json\n' % size)
+        self.assertEqual(find_results(self.client_count_dir),
+                         [(self.expected[0], (size, 1600000000123456789))])
+
+    def test_stale_manifest(self):
+        ''' A manifest older than its directories should be passed over for a
+            walk, so that results added or removed since are seen, and caches
+            should be pruned from what is found without listing again. '''
+
+        write_manifest(self.results)
+        client_dir = os.path.dirname(self.expected[0])
+        load_fio_files(self.expected)
+        added = os.path.join(client_dir, '1048576.json')
+        shutil.copy(self.expected[0], added)
+        os.remove(self.expected[1])
+        future = os.stat(client_dir).st_mtime_ns + 10**9
+        os.utime(client_dir, ns=(future, future))
+        found = list_result_files(self.results)
+        self.assertEqual(found, sorted([added] + self.expected[:1] + self.expected[2:]))
+
+        with mock.patch('os.listdir', side_effect=AssertionError):
+            load_fio_files(found, complete=True)
+        self.assertEqual(sorted(ResultCache(client_dir).rows), ['1048576.json', '4096.json'])
+
+        # Renewed, the manifest is read again
+        write_manifest(self.results)
+        with mock.patch('os.scandir', wraps=os.scandir) as scandir:
+            self.assertEqual(list_result_files(self.results), found)
+            self.assertEqual(scandir.call_count, 1)
+
+        # A result rewritten in place, leaving its directory alone, is not
+        # served from the cache by the stats of the manifest
+        load_fio_files(found)
+        with open(self.expected[2]) as f:
+            rewritten = f.read().replace('"randread"', '"randwrite"', 1)
+        with open(self.expected[2], 'w') as f:
+            f.write(rewritten)
+        stats = dict(find_results(self.results))
+        self.assertEqual(stats[self.expected[2]], None)
+        records = dict((P, S) for P, S, E in load_fio_files(list(stats), stats=stats))
+        self.assertEqual(records[self.expected[2]]['jobs'][0]['job options']['rw'], 'randwrite')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import unittest
+
+import pandas as pd
+
+import fiotools.Data
+from fiotools.Driver import Driver, client_ladder, parse_host, render_jobfile
+
+JOBFILE = os.path.join(os.path.dirname(__file__), '..', '..', 'fio_jobfiles', 'global_config.fio')
+
+# fiotools.Synthetic standing in for fio
+STUB_FIO = [sys.executable, '-m', 'fiotools.Synthetic']
+
+
+class TestDriver(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Listening sockets standing in for fio servers
+        self.servers = []
+        for i in range(4):
+            S = socket.socket()
+            S.bind(('localhost', 0))
+            S.listen(8)
+            self.servers.append(S)
+        self.hosts = [ 'localhost,%d' % S.getsockname()[1] for S in self.servers ]
+
+    def tearDown(self):
+        for S in self.servers:
+            S.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_jobfile(self):
+        ''' The job file sent to the servers should be complete. '''
+
+        text = render_jobfile(open(JOBFILE).read(), 65536, {'FIO_RW': 'randwrite', 'FIO_NUM_JOBS': 2})
+        self.assertTrue(text.startswith('[global]\nbs=65536\n'))
+        self.assertIn('\nnumjobs=2\n', text)
+        self.assertIn('\nrw=randwrite\n', text)
+        self.assertIn('filename_format=$jobnum.dat', text)
+        self.assertEqual(client_ladder(1), [1])
+        self.assertEqual(client_ladder(6), [1, 2, 4, 6])
+        self.assertEqual(parse_host('ip:node-1,8000'), ('node-1', 8000))
+        self.assertEqual(parse_host('node-1'), ('node-1', 8765))
+
+    def test_sweep(self):
+        ''' Each point should be parsed into the series as it completes, and
+            kept in an archive that reads back the same. '''
+
+        archive = os.path.join(self.tmp_dir, 'drive.tar.gz')
+        driver = Driver(self.hosts, JOBFILE, 'stub', 'randread', [4096, 65536], runs=2,
+                        archive=archive, fio=STUB_FIO)
+        series = driver.run()
+        self.assertEqual(driver.client_counts, [1, 2, 4])
+        self.assertEqual(len(series.samples), 2 * 3 * 2)
+        self.assertEqual(series.client_counts(), set([1, 2, 4]))
+        self.assertEqual(series.io_sizes(), set([4096, 65536]))
+        self.assertEqual(series.hostnames(), set(['localhost']))
+        self.assertEqual(len(series.query(clients=4, io_size=4096)), 2 * 4)
+
+        self.assertFalse(os.path.exists(archive + '.partial.tar'))
+        stored = fiotools.Data.SeriesGroup(archive, cache=False)
+        self.assertEqual(len(stored.samples), len(series.samples))
+        pd.testing.assert_frame_equal(stored.to_frame().sort_values(['clients', 'io_size', 'bw']).reset_index(drop=True),
+                                      series.to_frame().sort_values(['clients', 'io_size', 'bw']).reset_index(drop=True))
+
+    def test_failures(self):
+        ''' Servers that are down and fio failures should be reported. '''
+
+        self.servers[3].close()
+        driver = Driver(self.hosts, JOBFILE, 'stub', 'read', [4096], client_counts=[2, 4], fio=STUB_FIO)
+        with self.assertRaises(OSError) as E:
+            driver.run()
+        self.assertIn(self.hosts[3], str(E.exception))
+        self.assertEqual(len(driver.series.samples), 1)
+
+        with self.assertRaises(ValueError):
+            Driver(self.hosts, JOBFILE, 'stub', 'read', [4096], client_counts=[8])
+        driver = Driver(self.hosts, JOBFILE, 'stub', 'read', [4096], client_counts=[1],
+                        fio=[sys.executable, '-c', 'import sys; sys.stderr.write("no server"); sys.exit(3)'])
+        with self.assertRaises(RuntimeError) as E:
+            driver.run()
+        self.assertIn('no server', str(E.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
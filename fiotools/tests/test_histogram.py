@@ -0,0 +1,65 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from fiotools.Histogram import LatencyHistogram, PlatHistogram, plat_idx_to_val, plat_val_to_idx
+from fiotools.Projection import read_fio_file
+
+
+class TestHistogram(unittest.TestCase):
+    def test_from_bins(self):
+        ''' fio's string-keyed bins should become sorted int64 arrays. '''
+
+        H = LatencyHistogram.from_bins({'4000': 1, '1000': 3, '2000': 4})
+        np.testing.assert_array_equal(H.values, [1000, 2000, 4000])
+        np.testing.assert_array_equal(H.counts, [3, 4, 1])
+        self.assertEqual(H.values.dtype, np.int64)
+        self.assertEqual((H.total(), H.min(), H.max()), (8, 1000, 4000))
+        self.assertFalse(hasattr(H, '__dict__'))
+        self.assertEqual(pickle.loads(pickle.dumps(H)), H)
+
+    def test_density(self):
+        ''' Each bin's density spreads its samples back to the previous bin. '''
+
+        H = LatencyHistogram([1000, 2000, 4000], [3, 4, 1])
+        np.testing.assert_allclose(H.normalise(), [0.375, 0.5, 0.125])
+        np.testing.assert_allclose(H.density(divider=1000), [0.375, 0.5, 0.0625])
+        self.assertAlmostEqual((H.density(divider=1000) * [1, 1, 2]).sum(), 1.0)
+
+    def test_empty(self):
+        H = LatencyHistogram.from_bins({})
+        self.assertEqual(H.total(), 0)
+        with self.assertRaises(ValueError):
+            H.min()
+
+    def test_plat_buckets(self):
+        ''' fio's reported bin values should map back onto themselves. '''
+
+        S = read_fio_file('fiotools/tests/ceph-randread/2/ceph-randread-2-8zdn4/4096.json')
+        H = S['jobs'][0]['read']['clat_ns']['bins']
+        np.testing.assert_array_equal(plat_idx_to_val(plat_val_to_idx(H.values)), H.values)
+        np.testing.assert_array_equal(plat_val_to_idx(np.arange(128)), np.arange(128))
+
+    def test_plat_percentiles(self):
+        ''' Percentiles of a single job should be those fio reported, and
+            merging histograms should equal adding their samples. '''
+
+        S = read_fio_file('fiotools/tests/ceph-randread/2/ceph-randread-2-8zdn4/4096.json')
+        clat = S['jobs'][0]['read']['clat_ns']
+        P = PlatHistogram().add(clat['bins'])
+        self.assertEqual(P.total(), clat['bins'].total())
+        self.assertEqual(P.histogram(), clat['bins'])
+        pcts = sorted(clat['percentile'], key=float)
+        np.testing.assert_array_equal(P.percentiles([float(p) for p in pcts if float(p) > 0]),
+                                      [clat['percentile'][p] for p in pcts if float(p) > 0])
+
+        other = LatencyHistogram([1000, 5000000], [2, 3])
+        merged = PlatHistogram().add(clat['bins']).merge(PlatHistogram().add(other))
+        self.assertEqual(merged.total(), P.total() + 5)
+        np.testing.assert_array_equal(merged.counts, P.add(other).counts)
+        self.assertEqual(len(merged.counts), len(PlatHistogram().counts))
+
+
+if __name__ == '__main__':
+    unittest.main()
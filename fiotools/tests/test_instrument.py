@@ -0,0 +1,79 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import fiotools
+from fiotools import Instrument
+from fiotools.Instrument import count, profiled
+
+
+@profiled('outer')
+def outer():
+    count(files=2, nbytes=100)
+    return [ inner() for i in range(3) ]
+
+
+@profiled('inner')
+def inner():
+    return np.ones(2**20).sum()
+
+
+class TestInstrument(unittest.TestCase):
+    def tearDown(self):
+        Instrument.disable()
+
+    def test_disabled(self):
+        ''' Without a profiler nothing should be recorded. '''
+
+        self.assertIsNone(Instrument.profiler)
+        self.assertEqual(outer(), [2**20] * 3)
+        self.assertIsNone(Instrument.disable())
+
+    def test_stages(self):
+        ''' Nested stages should be counted, and the peak memory of the
+            inner stages should be included in the outer stage. '''
+
+        Instrument.enable()
+        outer()
+        P = Instrument.disable()
+        self.assertIsNone(Instrument.profiler)
+        R = P.as_dict()
+        self.assertEqual(list(R), ['outer', 'inner'])
+        self.assertEqual((R['outer']['calls'], R['inner']['calls']), (1, 3))
+        self.assertEqual((R['outer']['files'], R['outer']['nbytes']), (2, 100))
+        self.assertEqual((R['inner']['depth'], R['inner']['files']), (1, 0))
+        self.assertTrue(R['inner']['peak'] >= 8 * 2**20)
+        self.assertTrue(R['outer']['peak'] >= R['inner']['peak'])
+        self.assertTrue(R['outer']['wall'] >= R['inner']['wall'])
+
+    def test_clatgrid(self):
+        ''' The ClatGrid stages should be recorded, with the files parsed. '''
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_dir = 'fiotools/tests/ceph-randread/2/ceph-randread-2-8zdn4'
+            Instrument.enable(memory=False)
+            fiotools.ClatGrid(input_dirs=[input_dir], output_dir=tmp_dir, granularity=50,
+                              scenario='test', mode='randread', bs_list=[4096], force=True,
+                              cache=False, plot=False)
+            P = Instrument.disable()
+            R = P.as_dict()
+            for stage in ('find_fio_files', 'parse_fio_files', 'ClatGrid.populate_for_clients',
+                          'ClatGrid.add_series', 'ClatGrid.aggregate_and_normalise'):
+                self.assertIn(stage, R)
+            files = [ F for F in os.listdir(input_dir) if not F.startswith('.') ]
+            self.assertEqual(R['parse_fio_files']['files'], len(files))
+            path = os.path.join(tmp_dir, 'profile.json')
+            P.write_json(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f), R)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+from fiotools.Log import DDIR_READ, align_logs, downsample, find_logs, read_fio_log, sample_logs
+from fiotools.Plot import PlotSpec, render_figure
+from fiotools.Synthetic import write_fio_logs
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestLog(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rng = np.random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_log(self, name, rows):
+        path = os.path.join(self.tmp_dir, name)
+        with open(path, 'w') as f:
+            f.writelines(', '.join(str(x) for x in row) + '\n' for row in rows)
+        return path
+
+    def test_read(self):
+        ''' Logs should be read whole lines at a time, whatever the chunk
+            size, with the optional offset column where present. '''
+
+        rows = [ (T, int(V), T % 2, 4096, T * 4096) for T, V in enumerate(self.rng.integers(0, 10**9, 1000)) ]
+        path = self.write_log('4096_clat.1.log', rows)
+        log = read_fio_log(path)
+        self.assertEqual(len(log), 1000)
+        np.testing.assert_array_equal(log.value, [ R[1] for R in rows ])
+        np.testing.assert_array_equal(log.offset, [ R[4] for R in rows ])
+        self.assertIsNone(log.prio)
+        for chunk_bytes in (7, 100, 4096):
+            np.testing.assert_array_equal(read_fio_log(path, chunk_bytes).value, log.value)
+        self.assertEqual(len(log.direction(DDIR_READ)), 500)
+        self.assertEqual(len(read_fio_log(self.write_log('empty_bw.log', []))), 0)
+        with self.assertRaises(ValueError):
+            read_fio_log(self.write_log('other.log', [(1, 2)]))
+
+    def test_downsample(self):
+        ''' Each bucket should hold the min, mean and max of its entries,
+            and empty buckets NaN. '''
+
+        path = self.write_log('4096_lat.log', [(100, 4, 0, 4096), (900, 8, 0, 4096), (2500, 6, 0, 4096)])
+        D = downsample(read_fio_log(path), 1000)
+        np.testing.assert_array_equal(D.time, [0, 1000, 2000])
+        np.testing.assert_array_equal(D.count, [2, 0, 1])
+        np.testing.assert_array_equal(D.min, [4, np.nan, 6])
+        np.testing.assert_array_equal(D.mean, [6, np.nan, 6])
+        np.testing.assert_array_equal(D.max, [8, np.nan, 6])
+
+    def test_sample_logs(self):
+        ''' The logs of each client should be found beside its result,
+            totalled over jobs and aligned on common buckets. '''
+
+        results = []
+        for client, runtime in (('a', 30), ('b', 20)):
+            os.makedirs(os.path.join(self.tmp_dir, client))
+            results.append(os.path.join(self.tmp_dir, client, '4096.json'))
+            write_fio_logs(results[-1], 'bw', self.rng, 100000, runtime=runtime)
+            write_fio_logs(os.path.join(self.tmp_dir, client, '40960.json'), 'bw', self.rng, 1, runtime=runtime)
+        self.assertEqual([ os.path.basename(P) for P in find_logs(results[0], 'bw') ],
+                         ['4096_bw.1.log', '4096_bw.2.log', '4096_bw.3.log', '4096_bw.4.log'])
+        times, reduced = sample_logs(results, 'bw', 1000)
+        self.assertEqual(len(times), 31)
+        self.assertTrue(all(len(D) == 31 for D in reduced))
+        self.assertTrue(np.all(np.isnan(reduced[1].mean[21:])))
+        np.testing.assert_allclose(np.nanmean(reduced[0].mean), 100000, rtol=0.05)
+        with self.assertRaises(ValueError):
+            sample_logs(results, 'iops')
+
+        times, reduced = align_logs([ read_fio_log(P) for P in find_logs(results[1], 'bw')[:1] ], 1000, [5000])
+        self.assertEqual(times[0], 5000)
+
+        outfile = os.path.join(self.tmp_dir, 'bw.png')
+        render_figure(PlotSpec('timeseries', outfile, list(zip(['a', 'b'], reduced)), scale=0.001))
+        self.assertTrue(os.path.exists(outfile))
+
+
+if __name__ == '__main__':
+    unittest.main()
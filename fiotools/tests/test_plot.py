@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from matplotlib import pyplot as plt
+
+from fiotools.Plot import PlotSpec, grid_spacing, render_figure, render_figures
+
+
+class TestPlot(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        DF = pd.DataFrame([[1.0, 2.0, 3.0], [2.0, 1.0, 0.5]], columns=[1, 2, 4])
+        grid = np.random.RandomState(0).rand(9, 3)
+        self.specs = [
+            PlotSpec('stacked', os.path.join(self.tmp_dir, 'stacked.png'), DF,
+                     title='stacked', xticks=[1, 2, 4]),
+            PlotSpec('boxplot', os.path.join(self.tmp_dir, 'boxplot.png'), DF),
+            PlotSpec('heatmap', os.path.join(self.tmp_dir, 'heatmap.png'), DF.T,
+                     xlim=[0.5, 2.5], ylim=[1, 10], grid_X=np.linspace(-0.5, 2.5, 4),
+                     grid_Y=np.linspace(1, 10, 10), grid=grid, logy=True),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_render_closes_figures(self):
+        ''' Rendered figures should be written and always closed. '''
+
+        times = render_figures(self.specs, verbose=False)
+        self.assertEqual([F for F, T in times], [S.outfile for S in self.specs])
+        for S in self.specs:
+            self.assertTrue(os.path.getsize(S.outfile) > 0)
+        self.assertEqual(plt.get_fignums(), [])
+
+        bad = PlotSpec('heatmap', os.path.join(self.tmp_dir, 'bad.png'), None)
+        with self.assertRaises(KeyError):
+            render_figure(bad)
+        self.assertEqual(plt.get_fignums(), [])
+
+    def test_render_parallel(self):
+        ''' A pool of workers should render every figure, in order. '''
+
+        times = render_figures(self.specs, jobs=2, verbose=False)
+        self.assertEqual([F for F, T in times], [S.outfile for S in self.specs])
+        for S in self.specs:
+            self.assertTrue(os.path.getsize(S.outfile) > 0)
+
+    def test_caller_figure(self):
+        ''' A figure supplied by the caller should be drawn on and left open. '''
+
+        fig, ax = plt.subplots()
+        render_figure(self.specs[0], fig, ax)
+        self.assertEqual(ax.get_title(), 'stacked')
+        self.assertIn(fig.number, plt.get_fignums())
+        plt.close(fig)
+
+    def test_heatmap_modes(self):
+        ''' Each heatmap mode should render to each output format, and the
+            image layer should follow log-spaced rows on a log axis. '''
+
+        self.assertEqual(grid_spacing(np.linspace(1, 10, 10)), 'linear')
+        self.assertEqual(grid_spacing(np.logspace(0, 3, 10)), 'log')
+        self.assertIsNone(grid_spacing([1, 2, 5]))
+
+        grid = np.array([[0.0], [1.0]])
+        lines = pd.DataFrame({50.0: [10.0]}, index=[0])
+        for mode in ('image', 'mesh', 'pcolor'):
+            for fmt in ('png', 'svg', 'pdf'):
+                outfile = os.path.join(self.tmp_dir, 'heatmap-%s.%s' % (mode, fmt))
+                render_figure(PlotSpec('heatmap', outfile, lines, ylim=[1, 100],
+                                       grid_X=[-0.5, 0.5], grid_Y=[1, 10, 100], grid=grid,
+                                       cmap='gray', heatmap=mode, logy=True))
+                self.assertTrue(os.path.getsize(outfile) > 0)
+        with open(os.path.join(self.tmp_dir, 'heatmap-image.svg')) as f:
+            self.assertIn('<image', f.read())
+
+        # The boundary between the two rows lies half way up a log axis
+        images = {}
+        for mode in ('image', 'mesh'):
+            fig, ax = plt.subplots(figsize=(1, 2), dpi=100)
+            ax.set_position([0, 0, 1, 1])
+            render_figure(PlotSpec('heatmap', os.path.join(self.tmp_dir, 'edge.png'), lines, ylim=[1, 100],
+                                   grid_X=[-0.5, 0.5], grid_Y=[1, 10, 100], grid=grid,
+                                   cmap='gray', heatmap=mode, logy=True), fig, ax)
+            ax.legend().remove()
+            ax.lines[0].remove()
+            ax.axis('off')
+            fig.canvas.draw()
+            images[mode] = np.asarray(fig.canvas.buffer_rgba())[:, 50, 0].copy()
+            plt.close(fig)
+        self.assertEqual(images['image'][10], 255)
+        self.assertEqual(images['image'][190], 0)
+        self.assertTrue(abs(np.argmax(images['image'] < 128) - 100) <= 1)
+        self.assertTrue(np.abs(images['image'].astype(int) - images['mesh']).max() <= 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
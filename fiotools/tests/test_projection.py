@@ -0,0 +1,75 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import fiotools.Data
+from fiotools.Projection import ProjectingReader, fio_spec, project_fio_data, read_fio_file
+
+
+def group_report(path, clients):
+    ''' Construct a group-reporting document from a single-client result '''
+    with open(path) as f:
+        S = json.load(f)
+    S['global options']['group_reporting'] = '1'
+    job = S.pop('jobs')[0]
+    S['client_stats'] = [ dict(job, hostname='client-%d' % i) for i in range(clients) ]
+    S['client_stats'].append(dict(job, jobname='All clients'))
+    return S
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = 'fiotools/tests/beegfs-write/2/beegfs-write-97njm'
+        self.paths = sorted(os.path.join(self.input_dir, F) for F in os.listdir(self.input_dir)
+                            if not F.startswith('.'))
+
+    def test_stream_matches_json(self):
+        ''' The streamed projection should match projecting the fully parsed
+            document, wherever the chunk boundaries fall. '''
+
+        for path in self.paths[:4]:
+            with open(path) as f:
+                text = f.read()
+            expected = project_fio_data(json.loads(text))
+            self.assertEqual(read_fio_file(path), expected)
+            for chunk_size in (1, 7, 64):
+                reader = ProjectingReader(io.StringIO(text), chunk_size=chunk_size)
+                self.assertEqual(project_fio_data(reader.load(fio_spec())), expected)
+
+    def test_stream_without_histograms(self):
+        ''' Without histograms no clat_ns data should be constructed. '''
+
+        S = read_fio_file(self.paths[0], histograms=False)
+        self.assertNotIn('clat_ns', S['jobs'][0]['write'])
+        self.assertIn('bw', S['jobs'][0]['write'])
+        self.assertEqual(S['jobs'][0]['job options'], {'rw': 'write'})
+
+    def test_stream_malformed(self):
+        ''' Truncated or trailing data should be rejected like json.load. '''
+
+        for text in ('', '{"jobs": [{"a": 1}', '{"jobs": "x', '{} {}', '{"jobs" 1}'):
+            with self.assertRaises(ValueError):
+                ProjectingReader(io.StringIO(text), chunk_size=4).load(fio_spec())
+
+    def test_sample_group(self):
+        ''' Group-reporting results should be read without histograms. '''
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            S = group_report(self.paths[0], 3)
+            with open(os.path.join(tmp_dir, 'group.json'), 'w') as f:
+                json.dump(S, f)
+            run_data = fiotools.Data.SeriesGroup(tmp_dir)
+            self.assertEqual(run_data.hostnames(), set(['client-0', 'client-1', 'client-2']))
+            for R in run_data.samples[0].sample_group:
+                self.assertEqual(R.fio_data['bw'], S['client_stats'][0]['write']['bw'])
+                self.assertNotIn('clat_ns', R.fio_data)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
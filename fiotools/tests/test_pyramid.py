@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import fiotools
+from fiotools.Plot import render_figure
+from fiotools.Pyramid import GridPyramid, coarsen
+from fiotools.Synthetic import fio_result, write_json
+
+
+class TestPyramid(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_coarsen(self):
+        ''' Coarser levels should hold exactly the mass of the finer. '''
+
+        rng = np.random.default_rng(3)
+        mass = rng.uniform(0.0, 1.0, (25, 3))
+        mass[5:9] = 0.0
+        pyramid = GridPyramid.build(np.arange(4.0), np.linspace(1.0, 26.0, 26), mass, min_rows=5)
+        self.assertEqual(pyramid.rows(), [25, 13, 7, 4])
+        for y_edges, M in pyramid.levels:
+            self.assertEqual(len(y_edges), M.shape[0] + 1)
+            self.assertEqual((y_edges[0], y_edges[-1]), (1.0, 26.0))
+            np.testing.assert_allclose(M.sum(axis=0), mass.sum(axis=0))
+        y_edges, M = coarsen(np.linspace(1.0, 26.0, 26), mass, 5)
+        np.testing.assert_array_equal(y_edges, [1.0, 6.0, 11.0, 16.0, 21.0, 26.0])
+        np.testing.assert_allclose(M[1], mass[5:10].sum(axis=0))
+
+        # A window of latencies comes from the coarsest level that resolves it
+        self.assertEqual(pyramid.level_for(6), 2)
+        self.assertEqual(pyramid.level_for(6, ylim=(3.0, 9.5)), 0)
+        grid_Y, grid = pyramid.grid(0, ylim=(3.0, 9.5))
+        np.testing.assert_array_equal(grid_Y, np.arange(3.0, 11.0))
+        self.assertEqual(np.nanmax(grid), 1.0)
+        self.assertTrue(np.isnan(grid[3:7]).all())
+
+    def test_clatgrid(self):
+        ''' The grid of each I/O size should be the level of the granularity
+            asked for, and be drawn again from the saved pyramid. '''
+
+        rng = np.random.default_rng(5)
+        for clients in (1, 2, 4):
+            S = fio_result(rng, 'randread', 4096, clients, density=50)
+            S['meta'] = {'total_clients': clients}
+            write_json(os.path.join(self.tmp_dir, str(clients), '4096.json'), S)
+        input_dirs = [ os.path.join(self.tmp_dir, str(C)) for C in (1, 2, 4) ]
+        output_dir = os.path.join(self.tmp_dir, 'output')
+        grid = fiotools.ClatGrid(input_dirs=input_dirs, output_dir=output_dir, granularity=50, scenario='syn',
+                                 mode='randread', logscale=True, plot=False, cache=False)
+        self.assertEqual(grid.grid.shape, (50, 4))
+        path = os.path.join(output_dir, 'read-commit-latency-pyramid-by-client-4096.npz')
+        pyramid = GridPyramid.load(path)
+        self.assertEqual(pyramid.rows()[:5], [392, 196, 98, 49, 25])
+        self.assertEqual(pyramid.meta['bs'], 4096)
+        np.testing.assert_array_equal(pyramid.x_edges, grid.grid_X)
+        grid_Y, level = pyramid.grid(pyramid.level_for(49))
+        np.testing.assert_array_equal(grid_Y, grid.grid_Y)
+        np.testing.assert_array_equal(level, grid.grid[:-1])
+        for X in (0, 1, 3):
+            self.assertAlmostEqual(pyramid.levels[0][1][:, X].sum(), 1.0, places=4)
+        self.assertEqual(list(pyramid.percentiles.index), [1, 2, 4])
+
+        spec = pyramid.spec(os.path.join(output_dir, 'zoom.png'), rows=20,
+                            ylim=(grid.grid_Y[10], grid.grid_Y[20]))
+        self.assertGreaterEqual(len(spec.options['grid_Y']) - 1, 20)
+        render_figure(spec)
+        self.assertTrue(os.path.exists(spec.outfile))
+        np.savez(os.path.join(output_dir, 'other.npz'), grid=grid.grid)
+        with self.assertRaises(ValueError):
+            GridPyramid.load(os.path.join(output_dir, 'other.npz'))
+
+
+if __name__ == '__main__':
+    unittest.main()
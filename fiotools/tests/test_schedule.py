@@ -0,0 +1,154 @@
+import contextlib
+import io
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import fiotools.Schedule
+from fiotools.Barrier import BarrierError, Coordinator, wait
+from fiotools.Driver import Driver
+from fiotools.Schedule import (BS_SHAPE_METRICS, Scheduler, block_size_points, client_count_points, doubling, main,
+                               next_value)
+from fiotools.Synthetic import write_client_sweep
+
+SIZES = doubling(256, 16 * 1024 * 1024)
+
+
+def sweep(curve, values=SIZES, latency=None, **kwargs):
+    ''' The values measured by an adaptive sweep of a bandwidth curve, and
+        of a latency curve if given '''
+    measured = {}
+    while True:
+        V = next_value(values, measured, **kwargs)
+        if V is None:
+            return sorted(measured)
+        measured[V] = {'bw': curve(V), 'iops': curve(V) / V}
+        if latency is not None:
+            measured[V]['lat'] = latency(V)
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_next_value(self):
+        ''' Knees should be refined, straight runs and plateaus skipped. '''
+
+        # Bandwidth scales with I/O size up to 3 GiB/s, reached between 2 and 4 MiB
+        measured = sweep(lambda bs: min(bs * 1000.0, 3.0 * 2**30))
+        self.assertLess(len(measured), len(SIZES))
+        self.assertIn(2 * 2**20, measured)
+        self.assertIn(4 * 2**20, measured)
+        self.assertEqual(sweep(lambda bs: bs * 10.0), [256, 4096, 65536, 1048576, 16777216])
+        # Saturated from 4 KiB: the sweep stops before the largest sizes
+        measured = sweep(lambda bs: min(bs, 4096) * 1000.0)
+        self.assertEqual(measured[-1], 1048576)
+        self.assertIn(4096, measured)
+        self.assertEqual(len(sweep(lambda bs: bs / (5.0e5 + 5.0 * bs), max_points=7)), 7)
+
+        # Bandwidth scales evenly, but latency rises steeply from 256 KiB
+        knee = sweep(lambda bs: bs * 10.0, latency=lambda bs: 1.0e5 * max(1.0, bs / 262144.0) ** 2,
+                     shape_metrics=BS_SHAPE_METRICS)
+        self.assertGreater(len(knee), 5)
+        self.assertTrue(set([262144, 524288]) & set(knee))
+        self.assertEqual(sweep(lambda bs: bs * 10.0, shape_metrics=BS_SHAPE_METRICS),
+                         [256, 4096, 65536, 1048576, 16777216])
+
+    def test_results(self):
+        ''' Measurements should be read from results in the run_fio.sh layout. '''
+
+        scenario_dir = os.path.dirname(write_client_sweep(self.tmp_dir, 'syn', 'read', 1, [256, 4096, 65536], density=20))
+        write_client_sweep(self.tmp_dir, 'syn', 'read', 2, [256, 4096], density=20)
+        os.makedirs(os.path.join(scenario_dir, '2', '4096.lock'))
+        points = block_size_points(os.path.join(scenario_dir, '2'))
+        self.assertEqual(sorted(points), [256, 4096])
+        self.assertGreater(points[4096]['bw'], points[256]['bw'])
+        self.assertGreater(points[4096]['lat'], 0)
+        counts = client_count_points(scenario_dir)
+        self.assertEqual(sorted(counts), [1, 2])
+        self.assertEqual(counts[2]['bw'], points[4096]['bw'])
+
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            self.assertEqual(main(['bs', '-i', os.path.join(scenario_dir, '2')]), 0)
+            self.assertEqual(main(['bs', '-i', os.path.join(scenario_dir, '3')]), 0)
+            self.assertEqual(main(['clients', '-i', scenario_dir, '--values', '1', '2', '4', '8']), 0)
+        self.assertEqual(stdout.getvalue().split(), ['65536', '256', '4'])
+
+    def test_coordinator(self):
+        ''' The barrier coordinator should choose each I/O size once, from
+            results read once each, and hand it to every client. '''
+
+        client_count_dir = write_client_sweep(self.tmp_dir, 'syn', 'read', 3, [256, 4096], density=20)
+        scheduler = Scheduler(self.tmp_dir)
+        coordinator = Coordinator('localhost:0', log=lambda message: None, choose=scheduler)
+        thread = threading.Thread(target=coordinator.run)
+        thread.start()
+        self.assertTrue(coordinator.ready.wait(10))
+        address = coordinator.address_string()
+        schedule = {'sweep': 'bs', 'input_dir': os.path.relpath(client_count_dir, self.tmp_dir)}
+        try:
+            def enter(name, client, replies):
+                replies.append(wait(address, name, 3, client, schedule=schedule)['next'])
+
+            replies = []
+            with mock.patch('fiotools.Schedule.load_fio_files', wraps=fiotools.Schedule.load_fio_files) as load:
+                for name in ('step-4096', 'step-65536'):
+                    threads = [ threading.Thread(target=enter, args=(name, 'client-%d' % C, replies)) for C in range(3) ]
+                    for T in threads:
+                        T.start()
+                    for T in threads:
+                        T.join()
+                    if name == 'step-4096':
+                        write_client_sweep(self.tmp_dir, 'syn', 'read', 3, [65536], density=20, seed=1)
+            self.assertEqual(replies, [65536] * 3 + [1048576] * 3)
+            self.assertEqual([ len(C.args[0]) for C in load.call_args_list ], [6, 3])
+
+            with self.assertRaises(BarrierError):
+                wait(address, 'outside', 1, 'client-0', schedule={'sweep': 'bs', 'input_dir': '..'})
+        finally:
+            coordinator.stop()
+            thread.join()
+        self.assertEqual(scheduler({'sweep': 'clients', 'input_dir': os.path.dirname(schedule['input_dir']),
+                                    'values': [1, 2, 3, 4]}), 1)
+
+    def test_driver(self):
+        ''' An adaptive client/server sweep should run fewer points, and
+            repeat them in later runs. '''
+
+        servers = []
+        for i in range(4):
+            S = socket.socket()
+            S.bind(('localhost', 0))
+            S.listen(8)
+            servers.append(S)
+        hosts = [ 'localhost,%d' % S.getsockname()[1] for S in servers ]
+        jobfile = os.path.join(os.path.dirname(__file__), '..', '..', 'fio_jobfiles', 'global_config.fio')
+        try:
+            driver = Driver(hosts, jobfile, 'stub', 'randread', SIZES, runs=2, tolerance=0.2,
+                            fio=[sys.executable, '-m', 'fiotools.Synthetic'])
+            series = driver.run()
+        finally:
+            for S in servers:
+                S.close()
+        half = len(series.samples) // 2
+        first = [ (S.clients, S.io_size) for S in series.samples[:half] ]
+        second = [ (S.clients, S.io_size) for S in series.samples[half:] ]
+        self.assertEqual(first, second)
+        self.assertEqual(series.client_counts(), set([1, 2, 3, 4]))
+        for C in range(1, 5):
+            sizes = sorted(bs for clients, bs in first if clients == C)
+            self.assertEqual(sizes[0], 256)
+            self.assertLess(len(sizes), len(SIZES))
+
+
+if __name__ == '__main__':
+    unittest.main()
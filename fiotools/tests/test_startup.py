@@ -0,0 +1,54 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+def run_python(code):
+    ''' Run code in a fresh interpreter, returning its stdout '''
+    return subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_import_is_lazy(self):
+        ''' Importing fiotools for parsing should not load matplotlib,
+            pandas or the debugger. '''
+
+        loaded = run_python(
+            "import sys; import fiotools, fiotools.Data, fiotools.Plot; "
+            "print(' '.join(M for M in ('matplotlib', 'pandas', 'pdb') if M in sys.modules))")
+        self.assertEqual(loaded.strip(), '')
+
+    def test_no_plot(self):
+        ''' Without plots, ClatGrid should write its CSVs and latency grid
+            as JSON, without loading matplotlib. '''
+
+        input_dir = os.path.abspath('fiotools/tests/ceph-randread/2')
+        input_dir = os.path.join(input_dir, sorted(os.listdir(input_dir))[0])
+        loaded = run_python(
+            "import sys, fiotools; "
+            "fiotools.ClatGrid(input_dirs=[%r], output_dir=%r, granularity=50, scenario='test', "
+            "mode='randread', logscale=True, bs_list=[4096], plot=False, cache=False, force=True); "
+            "print('matplotlib' in sys.modules)" % (input_dir, self.tmp_dir))
+        self.assertEqual(loaded.strip().splitlines()[-1], 'False')
+        outputs = sorted(os.listdir(self.tmp_dir))
+        self.assertIn('read-commit-latency-grid-by-client-4096.json', outputs)
+        self.assertIn('read-bandwidth-by-client-4096.csv', outputs)
+        self.assertFalse([ F for F in outputs if F.endswith('.png') ])
+        with open(os.path.join(self.tmp_dir, 'read-commit-latency-grid-by-client-4096.json')) as f:
+            grid = json.load(f)
+        self.assertEqual(len(grid['grid']), len(grid['y_edges']) - 1)
+        self.assertEqual(len(grid['grid'][0]), len(grid['x_edges']) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+import fiotools
+import fiotools.Data
+from fiotools.Cache import load_fio_files
+from fiotools.Driver import Driver, render_jobfile
+from fiotools.SteadyState import (count_unconverged, find_steady_state, log_steady_state, parse_criterion,
+                                  steadystate_options)
+from fiotools.Synthetic import fio_result, write_fio_logs, write_json
+
+JOBFILE = os.path.join(os.path.dirname(__file__), '..', '..', 'fio_jobfiles', 'global_config.fio')
+
+
+class TestSteadyState(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_results(self, client_dir, steadystate):
+        ''' A result per I/O size, run to the given (criterion, attained) or
+            without a criterion for None '''
+        rng = np.random.default_rng(7)
+        for bs, ss in steadystate.items():
+            write_json(os.path.join(client_dir, '%d.json' % bs), fio_result(rng, 'randread', bs, density=20,
+                                                                          steadystate=ss))
+
+    def test_options(self):
+        ''' Criteria should be checked and turned into fio job options. '''
+
+        self.assertEqual(parse_criterion('iops_slope:0.5%'), ('iops', True, 0.5, True))
+        self.assertEqual(parse_criterion('bw:2000'), ('bw', False, 2000.0, False))
+        with self.assertRaises(ValueError):
+            parse_criterion('lat:5%')
+        options = steadystate_options('bw_slope:1%', 20, 10, 300)
+        self.assertEqual(options, [('steadystate', 'bw_slope:1%'), ('steadystate_duration', '20s'),
+                                   ('steadystate_ramp_time', '10s'), ('runtime', '300')])
+        text = render_jobfile(open(JOBFILE).read(), 4096, {}, options)
+        self.assertTrue(text.startswith('[global]\nbs=4096\nsteadystate=bw_slope:1%\nsteadystate_duration=20s\n'))
+
+    def test_series(self):
+        ''' Convergence should be read from fio's report, including through
+            the parse cache, or judged from the logs. '''
+
+        client_dir = os.path.join(self.tmp_dir, 'client-0')
+        self.write_results(client_dir, {4096: ('iops_slope:0.5%', True), 65536: ('iops_slope:0.5%', False),
+                                        1048576: None})
+        for cache in (False, True, True):
+            series = fiotools.Data.SeriesDir(client_dir, cache=cache)
+            converged = { R[3]: R[4].converged for R in series.results }
+            self.assertEqual(converged, {4096: True, 65536: False, 1048576: None})
+        self.assertEqual(series.to_frame().sort_values('io_size')['converged'].fillna(-1).tolist(), [1.0, 0.0, -1])
+        paths = [ os.path.join(client_dir, '%d.json' % bs) for bs in (4096, 65536, 1048576) ]
+        self.assertEqual(count_unconverged(S for path, S, E in load_fio_files(paths, cache=True)), (1, 2))
+
+        # Flat from the start, by the logs of the result run without a criterion
+        write_fio_logs(paths[2], 'iops', np.random.default_rng(1), 1000.0, interval_ms=1000)
+        self.assertEqual(log_steady_state(paths[2], 'iops:30%'), 15)
+        self.assertIsNone(log_steady_state(paths[2], 'iops:0.1%'))
+        with self.assertRaises(ValueError):
+            log_steady_state(paths[2], 'bw:10%')
+        series = fiotools.Data.SeriesDir(client_dir, steadystate='iops:30%')
+        self.assertEqual([ S.converged() for S in sorted(series.samples, key=lambda S: S.io_size) ],
+                         [True, False, True])
+
+    def test_find(self):
+        ''' A run should be judged stable once it has levelled off. '''
+
+        values = np.concatenate([np.linspace(100.0, 1000.0, 20), np.full(30, 1000.0) + np.tile([1.0, -1.0], 15)])
+        self.assertEqual(find_steady_state(values, 'iops_slope:0.5%', 10, 5), 28)
+        self.assertEqual(find_steady_state(values, 'iops:1%', 10, 0), 29)
+        self.assertIsNone(find_steady_state(values[:25], 'iops:1%', 10, 0))
+
+    def test_driver(self):
+        ''' A client/server sweep should be run to steady state. '''
+
+        driver = Driver(['localhost'], JOBFILE, 'stub', 'read', [1024, 4096], probe=False,
+                        fio=[sys.executable, '-m', 'fiotools.Synthetic'],
+                        options=steadystate_options('iops_slope:0.5%'))
+        series = driver.run()
+        self.assertEqual(sorted(series.to_frame()['converged']), [0.0, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import fiotools
+import fiotools.Benchmark
+import fiotools.Data
+from fiotools.Histogram import PlatHistogram
+from fiotools.Projection import read_fio_file
+from fiotools.Synthetic import fio_result, write_client_sweep, write_group_sweep
+
+
+class TestSynthetic(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_fio_result(self):
+        ''' Synthetic results should be self-consistent fio json+ output. '''
+
+        rng = np.random.default_rng(0)
+        job = fio_result(rng, 'randwrite', 4096, clients=2, density=300)['jobs'][0]
+        W = job['write']
+        self.assertEqual(job['read']['total_ios'], 0)
+        self.assertEqual(sum(W['clat_ns']['bins'].values()), W['total_ios'])
+        self.assertEqual(W['io_bytes'], 4096 * W['total_ios'])
+        self.assertTrue(100 < len(W['clat_ns']['bins']) < 600)
+        P = PlatHistogram()
+        P.add(fiotools.Histogram.LatencyHistogram.from_bins(W['clat_ns']['bins']))
+        self.assertEqual(P.percentiles([50.0])[0], W['clat_ns']['percentile']['50.000000'])
+
+    def test_sweeps(self):
+        ''' Generated sweeps should be read by ClatGrid and SeriesGroup. '''
+
+        block_sizes = [4096, 65536]
+        client_dir = write_client_sweep(self.tmp_dir, 'syn', 'read', 3, block_sizes, runs=2, density=100)
+        self.assertEqual(len(os.listdir(client_dir)), 6)
+        grid = fiotools.ClatGrid(input_dirs=[client_dir], output_dir=os.path.join(self.tmp_dir, 'out'),
+                                 granularity=50, scenario='syn', mode='read', plot=False)
+        self.assertEqual(grid.bs_list, block_sizes)
+        self.assertEqual(len(grid.fio_index[(1, 4096)]), 6)
+
+        group_dir = write_group_sweep(os.path.join(self.tmp_dir, 'group'), 'syn', 'read', [1, 4], block_sizes)
+        run_data = fiotools.Data.SeriesGroup(group_dir)
+        self.assertEqual(run_data.io_sizes(), set(block_sizes))
+        self.assertEqual(len(run_data.hostnames()), 4)
+        self.assertEqual(read_fio_file(os.path.join(group_dir, '0', '4-4096.json'))['client_stats'][-1]['jobname'],
+                         'All clients')
+
+    def test_benchmarks(self):
+        ''' The benchmark suite should time every stage, and report only
+            stages slower than the baseline beyond the tolerance. '''
+
+        results = fiotools.Benchmark.run_benchmarks(self.tmp_dir, [2], block_sizes=[4096, 8192],
+                                                    density=100, repeat=1)
+        self.assertIn('2-clients/aggregate_and_normalise', results)
+        self.assertIn('2-clients/StackedLine', results)
+        self.assertIn('startup/import_fiotools', results)
+        path = os.path.join(self.tmp_dir, 'baseline.json')
+        fiotools.Benchmark.save_baseline(path, results)
+        baseline = fiotools.Benchmark.load_baseline(path)
+        self.assertEqual(fiotools.Benchmark.compare(results, baseline), [])
+        slower = dict(results, **{'2-clients/SeriesGroup': baseline['2-clients/SeriesGroup'] * 2 + 1.0})
+        self.assertEqual([R[0] for R in fiotools.Benchmark.compare(slower, baseline)], ['2-clients/SeriesGroup'])
+
+
+if __name__ == '__main__':
+    unittest.main()
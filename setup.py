@@ -17,7 +17,7 @@ setup(
     author_email='stig@stackhpc.com',
     packages=['fiotools', 'fiotools.tests'],
     package_data={'fiotools': [os.path.join('tests', 'urls.txt'), 'VERSION']},
-    scripts=['bin/fio_blocksize', 'bin/fio_client', 'bin/fio_group_bw', 'bin/templater'],
+    scripts=['bin/fio_blocksize', 'bin/fio_client', 'bin/fio_group_bw', 'bin/fio_report', 'bin/fio_manifest', 'bin/fio_compare', 'bin/fio_heatmap', 'bin/fio_barrier', 'bin/fio_drive', 'bin/fio_schedule', 'bin/fio_benchmark', 'bin/templater'],
     url='https://github.com/stackhpc/stackhpc-io-tools',
     license='Apache (see LICENSE file)',
     description='IO json parser and plotter',
@@ -30,5 +30,9 @@ setup(
         'pathlib2',
         'unittest2',
         ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'zstd': ['zstandard'],
+        },
     test_suite='fiotools.tests'
 )